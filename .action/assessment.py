@@ -24,17 +24,14 @@
 # POSSIBILITY OF SUCH DAMAGE.
 #
 """ Utilities to build, run, and evaluate student projects. """
-import csv
-import json
 import os
-import pickle
-import re
 import sys
-import subprocess
-from ccsrcutilities import glob_all_src_files, strip_and_compare_files, format_check, lint_check, glob_cc_src_files
-from parse_header import dict_header, null_dict_header
-from header_check import header_check
-from logger import setup_logger
+from capture import run_bounded
+from fileaccess import contains
+from ccsrcutilities import glob_all_src_files, strip_and_compare_files, format_check, glob_cc_src_files, syntax_check
+from buildengine import build as engine_build, engine_enabled, unity_enabled
+from parse_header import null_dict_header, validate_headers
+from logger import setup_logger, LazyJoin
 
 def make_spotless(target_dir):
     """Given a directory that contains a GNU Makefile, clean with the `make
@@ -58,14 +55,12 @@ def make_unittest(target_dir, always_clean=True, output_format="json", output_fi
     """Given a directory that contains a GNU Makefile, build with `make unittest`.
     This function call will call `make spotless` via make_spotless()"""
     status = True
-    os.environ['GTEST_OUTPUT_FORMAT'] = output_format
-    os.environ['GTEST_OUTPUT_FILE'] = output_file
     if always_clean:
         status = make_spotless(target_dir)
     if status:
-        status = make(target_dir, 'unittest')
-    del os.environ['GTEST_OUTPUT_FORMAT']
-    del os.environ['GTEST_OUTPUT_FILE']
+        # Pass the output settings as make variables rather than through
+        # os.environ so concurrent graders in one process do not collide.
+        status = make(target_dir, f'unittest GTEST_OUTPUT_FORMAT={output_format} GTEST_OUTPUT_FILE={output_file}')
     return status
 
 def make(target_dir, make_target):
@@ -79,14 +74,7 @@ def make(target_dir, make_target):
     else:
         cmd = 'make -C {} {}'.format(target_dir, make_target)
         logger.debug(cmd)
-        proc = subprocess.run(
-            [cmd],
-            capture_output=True,
-            shell=True,
-            timeout=120,
-            check=False,
-            text=True,
-        )
+        proc = run_bounded([cmd], timeout=120)
         # if proc.stdout:
         #    logger.info('stdout: %s', str(proc.stdout).rstrip("\n\r"))
         if proc.stderr:
@@ -106,14 +94,7 @@ def build(file, target='asgt', compiletimeout=120):
     status = True
     cmd = 'clang++ -Wall -pedantic -std=c++14 -o {} {}'.format(target, file)
     logger.debug(cmd)
-    proc = subprocess.run(
-        [cmd],
-        capture_output=True,
-        shell=True,
-        timeout=compiletimeout,
-        check=False,
-        text=True,
-    )
+    proc = run_bounded([cmd], timeout=compiletimeout)
     if proc.stdout:
         logger.info('stdout: %s', str(proc.stdout).rstrip("\n\r"))
     if proc.stderr:
@@ -132,21 +113,14 @@ def identify(header):
 
 def has_main_function(file):
     """Check if a given file has a C++ main function."""
-    status = False
-    main_regex = re.compile(
-        r'int\s*main\s*\(int\s*argc,\s*(const)?\s*char\s*(const)?\s*\*\s*argv\[\]\)'
-    )
-    with open(file, 'r') as file_handle:
-        src_code = file_handle.read()
-        matches = main_regex.search(src_code)
-        if matches:
-            status = True
-    return status
+    from srcindex import MAIN_REGEX
+    return contains(file, MAIN_REGEX)
 
 
 def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_check=True, tidy_options=None, skip_compile_cmd=False):
     """Main function for checking student's solution. Provide a pointer to a
     run function."""
+    from srcindex import source_index
     logger = setup_logger()
     if len(sys.argv) < 3:
         logger.error(
@@ -158,8 +132,11 @@ def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_ch
         base_directory = sys.argv[3]
     else:
         base_directory = None
+    # One walk of the part for the whole check; everything below looks
+    # files up in this index.
+    index = source_index(target_directory, refresh=True)
     if not files:
-        files = glob_all_src_files(target_directory)
+        files = glob_all_src_files(target_directory, index)
     else:
         files = [os.path.join(sys.argv[1], file) for file in files]
     if len(files) == 0:
@@ -167,17 +144,16 @@ def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_ch
         sys.exit(1)
 
     # Header checks
-    files_missing_header = [file for file in files if not header_check(file)]
-    files_with_header = [file for file in files if header_check(file)]
+    headers = dict(validate_headers(files))
+    files_missing_header = [file for file in files if not headers[file]]
+    files_with_header = [file for file in files if headers[file]]
     header = None
     if len(files_with_header) == 0:
         logger.error('❌ No header provided in any file in %s. Exiting.', target_directory)
         logger.error('All files: %s', ' '.join(files))
         sys.exit(1)
     else:
-        with open(files_with_header[0]) as file_handle:
-            contents = file_handle.read()
-        header = dict_header(contents)
+        header = headers[files_with_header[0]]
     
     logger.info('Start %s', identify(header))
     logger.info('All files: %s', ' '.join(files))
@@ -209,17 +185,19 @@ def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_ch
                 logger.info(
                     'Please make sure your code conforms to the Google C++ style.'
                 )
-                logger.debug('\n'.join(diff))
+                logger.debug('%s', LazyJoin(diff))
             else:
                 logger.info('✅ Formatting passed on %s', file)
 
     # Lint
     if do_lint_check:
+        from lintagg import lint_files
+        lint_report = lint_files(files, tidy_options, skip_compile_cmd, index)
         for file in files:
-            lint_warnings = lint_check(file, tidy_options, skip_compile_cmd)
+            lint_warnings = lint_report.warnings[file]
             if len(lint_warnings) != 0:
                 logger.warning('❌ Linter found improvements in %s.', file)
-                logger.debug('\n'.join(lint_warnings))
+                logger.debug('%s', LazyJoin(lint_warnings))
             else:
                 logger.info('✅ Linting passed in %s', file)
 
@@ -230,7 +208,7 @@ def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_ch
     if sum([True for file in files if file.endswith('.cc')]):
         cc_files = files
     else:
-        cc_files = glob_cc_src_files(target_directory)
+        cc_files = glob_cc_src_files(target_directory, index)
     # Clean, Build, & Run
     if len(cc_files) > 1:
         logger.info(
@@ -238,7 +216,8 @@ def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_ch
         )
     main_src_file = None
     for file in files:
-        if has_main_function(file):
+        entry = index.entry(file)
+        if entry.has_main if entry else has_main_function(file):
             if not main_src_file:
                 main_src_file = file
                 logger.info('Main function found in %s', file)
@@ -268,50 +247,166 @@ def solution_check_simple(run=None, files=None, do_format_check=True, do_lint_ch
 
 def solution_check_make(target_directory, program_name='asgt', base_directory=None, run=None, files=None, do_format_check=True, do_lint_check=True, tidy_options=None, skip_compile_cmd=False):
     """Main function for checking student's solution. Provide a pointer to a
-    run function."""
+    run function. A thin wrapper around grade_part() without unit tests."""
+    repo_name = os.path.basename(os.path.dirname(os.path.abspath(target_directory)))
+    result = grade_part(repo_name, target_directory, program_name, base_directory, run, files, do_format_check, do_lint_check, tidy_options, skip_compile_cmd, do_unit_tests=False)
+    # Formatting and linting are advisory here; only missing files or
+    # headers, a failed build or runs that all failed fail the check.
+    # grade_part() wants every run to pass, but this entry point has
+    # always passed when any run did.
+    status = 0
+    if not any(verdict.passed for verdict in result.verdicts('header')):
+        status = 1
+    if not all(verdict.passed for verdict in result.verdicts('build')):
+        status = 1
+    if result.verdicts('run') and not any(result.run_statuses):
+        status = 1
+    sys.exit(status)
+
+def _sortable_name(name):
+    """'Ada King Lovelace' -> 'Lovelace, Ada King'"""
+    names = name.split()
+    return '{}, {}'.format(names[-1], ' '.join(names[:len(names)-1]))
+
+
+# Short-circuit policies for grade_part: stage -> stages that must pass
+# before it runs. A skipped stage counts as 0 in the grading log.
+STAGE_POLICIES = {
+    # What grading has always done: only an unchanged repository stops
+    # grading early and the program runs only when it built.
+    'legacy': {},
+    # Also nothing that compiles when a syntax check finds compile
+    # errors, and no unit tests when the program does not build.
+    'build': {
+        'lint': ('precheck',),
+        'build': ('precheck',),
+        'unittest': ('build',),
+    },
+    # Nothing past the headers when a header is missing, and no unit
+    # tests or lint when the program does not build.
+    'strict': {
+        'precheck': ('header',),
+        'format': ('header',),
+        'build': ('header', 'precheck'),
+        'lint': ('header', 'build'),
+        'unittest': ('header', 'build'),
+    },
+}
+DEFAULT_STAGE_POLICY = 'build'
+# Estimated seconds per stage, so cheap stages report first.
+STAGE_COSTS = {
+    'header': 0.01, 'base_diff': 0.05, 'precheck': 0.3, 'format': 0.5, 'build': 5.0,
+    'run': 2.0, 'unittest': 10.0, 'lint': 15.0, 'scaling': 30.0,
+}
+
+
+def grade_part(csv_key, target_directory, program_name='asgt', base_directory=None, run=None, files=None, do_format_check=True, do_lint_check=True, tidy_options=None, skip_compile_cmd=False, students=None, do_unit_tests=True, scaling=None, policy=None, jobs=None):
+    """Grade one part of a student's repository and return a
+    results.GradeResult. Nothing is written and sys.exit() is never
+    called, so many parts can be graded in one process. students is an
+    optional roster.Roster used to turn partner logins into names.
+    scaling is an optional function that times the program on growing
+    inputs and returns a scaling.ScalingReport; it runs only after every
+    run passed.
+
+    The stages run as a stagegraph: policy names one of STAGE_POLICIES
+    (default MS_STAGE_POLICY or DEFAULT_STAGE_POLICY) and jobs is how many
+    stages may run at once (default MS_STAGE_JOBS or 2)."""
+    import time
+    from results import GradeResult, StageVerdict
+    from srcindex import source_index
+    from stagegraph import Stage, run_stages
     logger = setup_logger()
-    # if len(sys.argv) < 3:
-    #     logger.error(
-    #         'provide target directory, program name, and optionally a base directory'
-    #     )
-    #     sys.exit(1)
-    # target_directory = sys.argv[1]
-    # if len(sys.argv) == 4:
-    #     base_directory = sys.argv[3]
-    # else:
-    #     base_directory = None
+    abs_path_target_dir = os.path.abspath(target_directory)
+    result = GradeResult(repo=csv_key, part=os.path.basename(abs_path_target_dir))
+    policy = STAGE_POLICIES[policy or os.environ.get('MS_STAGE_POLICY') or DEFAULT_STAGE_POLICY]
+    jobs = jobs or int(os.environ.get('MS_STAGE_JOBS', '2'))
+
+    # The part is walked once per grading run; the stages share index.
+    index = source_index(target_directory, refresh=True)
     if not files:
         # This could be a target in the Makefile
-        files = glob_all_src_files(target_directory)
+        files = glob_all_src_files(target_directory, index)
     else:
         files = [os.path.join(target_directory, file) for file in files]
+    result.files = files
+
     if len(files) == 0:
         logger.error("❌ No files in %s.", target_directory)
-        sys.exit(1)
-
-    # Header checks
-    files_missing_header = [file for file in files if not header_check(file)]
-    files_with_header = [file for file in files if header_check(file)]
-    header = None
-    if len(files_with_header) == 0:
-        logger.error('❌ No header provided in any file in %s. Exiting.', target_directory)
-        logger.error('All files: %s', ' '.join(files))
-        sys.exit(1)
-    else:
-        with open(files_with_header[0]) as file_handle:
-            contents = file_handle.read()
-        header = dict_header(contents)
-
-    logger.info('Start %s', identify(header))
-    logger.info('All files: %s', ' '.join(files))
-    files_missing_header = [file for file in files if not header_check(file)]
-    if len(files_missing_header) != 0:
-        logger.warning(
-            'Files missing headers: %s', ' '.join(files_missing_header)
-        )
+        result.notes.append(f"❌ No files in {target_directory}.")
+        result.status = 1
+        return result
+
+    # Stages run concurrently, so each records into its own result and
+    # they are merged in the order below.
+    partial = {}
+    header = null_dict_header()
+
+    def stage_result(stage):
+        partial[stage] = GradeResult(repo=result.repo, part=result.part)
+        return partial[stage]
+
+    def timed(out, stage, func, *args):
+        start = time.perf_counter()
+        value = func(*args)
+        elapsed = time.perf_counter() - start
+        out.timings[stage] = out.timings.get(stage, 0.0) + elapsed
+        return value, elapsed
+
+    def check_headers():
+        nonlocal header
+        out = stage_result('header')
+        headers = {}
+        # One parser streams through every file, reading only the headers.
+        checked = validate_headers(files)
+        for file in files:
+            (_, headers[file]), elapsed = timed(out, 'header', next, checked)
+            has_header = bool(headers[file])
+            out.stages.append(StageVerdict('header', has_header, file, seconds=elapsed))
+        files_missing_header = [file for file in files if not headers[file]]
+        files_with_header = [file for file in files if headers[file]]
+        if len(files_with_header) == 0:
+            logger.error('❌ No header provided in any file in %s. Exiting.', target_directory)
+            logger.error('All files: %s', ' '.join(files))
+            all_files = ' '.join(files)
+            out.notes.append(f'❌ No header provided in any file in {target_directory}. All files: {all_files}.')
+            out.status = 1
+        else:
+            header = headers[files_with_header[0]]
+
+        logger.info('Start %s', identify(header))
+        logger.info('All files: %s', ' '.join(files))
+        out.author = _sortable_name(header['name'])
+        partners = header['partners'].replace(',', ' ').replace('@', '').lower().split()
+
+        # Map GitHub login to student name
+        if students:
+            # sortable partner names
+            for github_login in partners:
+                student_name = students.get(github_login)
+                if not student_name:
+                    logger.warning(f"No such user in db '{github_login}'. Skipping.")
+                    out.notes.append(f'❌ Partner: no such user in db {github_login}.')
+                    name = github_login
+                else:
+                    name = '"{}, {}"'.format(student_name[0], student_name[1])
+                out.partners.append(name)
+        else:
+            # Can't map the logins to names, just use them as is.
+            out.partners = partners
+
+        if len(files_missing_header) != 0:
+            files_missing_header_str = ' '.join(files_missing_header)
+            logger.warning(
+                'Files missing headers: %s', files_missing_header_str
+            )
+            out.notes.append(f'❌Files missing headers: {files_missing_header_str}\n')
+            out.status = 1
+        return out.status == 0
 
     # Check if files have changed
-    if base_directory:
+    def check_base_diff():
+        out = stage_result('base_diff')
         count = 0
         for file in files:
             diff = strip_and_compare_files(file, os.path.join(base_directory, file))
@@ -320,253 +415,210 @@ def solution_check_make(target_directory, program_name='asgt', base_directory=No
                 logger.error('No changes made in file %s.', file)
         if count == len(files):
             logger.error('No changes made ANY file. Stopping.')
-            sys.exit(1)
-    else:
-        logger.debug('Skipping base file comparison.')
-
-    # Format
-    if do_format_check:
+            out.notes.append('❌ No changes made to any file.\n')
+            out.status = 1
+            return False
+        return True
+
+    # Compile errors in a second, before any make target runs.
+    def precheck():
+        out = stage_result('precheck')
+        sources = [file for file in files if file.endswith('.cc')]
+        errors, elapsed = timed(out, 'precheck', syntax_check, target_directory, sources)
+        if errors is None:
+            return True
+        for file in sources:
+            if errors[file]:
+                logger.error('❌ Compile errors in %s', file)
+                logger.error('%s', errors[file])
+                out.notes.append(f'❌ Compile errors in {file}.\n')
+                out.status = 1
+            out.stages.append(StageVerdict('precheck', not errors[file], file, seconds=elapsed))
+        if out.status == 0:
+            logger.info('✅ Syntax check passed')
+        return out.status == 0
+
+    def check_format():
+        out = stage_result('format')
         for file in files:
-            diff = format_check(file)
+            diff, elapsed = timed(out, 'format', format_check, file)
             if len(diff) != 0:
                 logger.warning('❌ Formatting needs improvement in %s.', file)
                 logger.info(
                     'Please make sure your code conforms to the Google C++ style.'
                 )
-                logger.debug('\n'.join(diff))
+                logger.debug('%s', LazyJoin(diff))
+                out.notes.append(f'❌ Formatting needs improvement in {file}.\n')
+                out.status = 1
             else:
                 logger.info('✅ Formatting passed on %s', file)
+            out.stages.append(StageVerdict('format', len(diff) == 0, file, seconds=elapsed))
+        return out.status == 0
 
-    # Lint
-    if do_lint_check:
+    def check_lint():
+        from lintagg import lint_files
+        out = stage_result('lint')
+        lint_report, _ = timed(out, 'lint', lint_files, files, tidy_options, skip_compile_cmd, index)
         for file in files:
-            lint_warnings = lint_check(file, tidy_options, skip_compile_cmd)
+            lint_warnings = lint_report.warnings[file]
+            elapsed = lint_report.seconds[file]
             if len(lint_warnings) != 0:
                 logger.warning('❌ Linter found improvements in %s.', file)
-                logger.debug('\n'.join(lint_warnings))
+                logger.debug('%s', LazyJoin(lint_warnings))
+                out.notes.append(f'❌ Linter found improvements in {file}.\n')
+                out.status = 1
             else:
                 logger.info('✅ Linting passed in %s', file)
+            out.stages.append(StageVerdict('lint', len(lint_warnings) == 0, file, seconds=elapsed))
+            out.lint_warnings.extend((file, warning) for warning in lint_warnings)
+        out.lint_diagnostics.extend(
+            (diagnostic.check, owner, diagnostic.line) for owner, diagnostic in lint_report.diagnostics
+        )
+        return out.status == 0
+
+    # Unit tests
+    # We don't know if there are unit tests in this project
+    # or not. We'll assume there are and then check to see
+    # if an output file was created.
+    def unit_tests():
+        from gtest_report import read_report
+        from gtest_runner import run_unittest
+        out = stage_result('unittest')
+        logger.info('✅ Attempting unit tests')
+        unit_test_output_file = "test_detail.json"
+        # The build stage has just cleaned the directory.
+        ran, elapsed = timed(out, 'unittest', run_unittest, target_directory, False, unit_test_output_file)
+        unit_test_output_path = os.path.join(target_directory, unit_test_output_file)
+        if not ran or not os.path.exists(unit_test_output_path):
+            logger.error('❌ The unit tests did not build or run')
+            out.notes.append('❌ The unit tests did not build or run\n')
+            out.stages.append(StageVerdict('unittest', False, detail='no report', seconds=elapsed))
+            return False
+        logger.info('✅ Unit test output found')
+        report = read_report(unit_test_output_path)
+        if report.failures > 0:
+            logger.error(f'❌ One or more unit tests failed ({report.passed}/{report.tests})')
+        else:
+            logger.info('✅ Passed all unit tests')
+        out.unit_tests_total = report.tests
+        out.unit_tests_passed = report.passed
+        out.stages.append(StageVerdict('unittest', report.failures == 0, detail=f'{report.passed}/{report.tests}', seconds=elapsed))
+        out.unit_test_times = report.times()
+        out.unit_test_failures = report.failed_assertions()
+        for failure in out.unit_test_failures:
+            logger.error(f'❌ {failure.suite}:{failure.test}:{failure.message}\n')
+        return report.failures == 0
 
-    status = 0
     # Clean, Build, & Run
-    if make_build(target_directory):
-        logger.info('✅ Build passed')
-        # Run
-        run_stats = run(os.path.join(target_directory, program_name))
-        total_stats = sum(run_stats)
-        if total_stats:
-            logger.info('✅ Test run passed')
+    def build_program():
+        out = stage_result('build')
+        if engine_enabled():
+            built, elapsed = timed(out, 'build', engine_build, target_directory)
         else:
-            logger.error('❌ Test run failed')
-            status = 1
+            built, elapsed = timed(out, 'build', make_build, target_directory)
+        out.stages.append(StageVerdict('build', built, seconds=elapsed))
+        if built:
+            logger.info('✅ Build passed')
+        else:
+            logger.error('❌ Build failed')
+            out.notes.append('❌ Build failed\n')
+            out.status = 1
+        return built
+
+    def run_program():
+        out = stage_result('run')
+        run_stats, elapsed = timed(out, 'run', run, os.path.join(target_directory, program_name))
+        out.run_statuses = list(run_stats)
+        # passed tests / total tests
+        test_notes = f'{sum(run_stats)}/{len(run_stats)}'
+        out.stages.append(StageVerdict('run', all(run_stats), detail=test_notes, seconds=elapsed))
+        if all(run_stats):
+            logger.info('✅ All test runs passed')
+        else:
+            logger.error(f'❌ One or more runs failed ({test_notes})')
+            out.notes.append('❌ One or more test runs failed\n')
+            out.status = 1
+        return all(run_stats)
+
+    def check_scaling():
+        out = stage_result('scaling')
+        report, elapsed = timed(out, 'scaling', scaling, os.path.join(target_directory, program_name))
+        out.stages.append(StageVerdict('scaling', not report.quadratic, detail=report.describe(), seconds=elapsed))
+        if report.quadratic:
+            # A note only; the program's output is correct.
+            logger.warning('⚠️ Running time is quadratic: %s', report.describe())
+            out.notes.append(f'⚠️ Running time is quadratic in the number of rows: {report.describe()}\n')
+        return not report.quadratic
+
+    # (name, function, requires, after, resources) in grading log order.
+    # Stages that clean or build in the part directory, or read the
+    # compile commands database there, hold 'directory'; the unit tests
+    # reuse the build's objects.
+    stages = [('header', check_headers, (), (), ())]
+    if base_directory:
+        stages.append(('base_diff', check_base_diff, (), (), ()))
     else:
-        logger.error('❌ Build failed')
-        status = 1
+        logger.debug('Skipping base file comparison.')
+    stages.append(('precheck', precheck, (), (), ()))
+    if do_format_check:
+        stages.append(('format', check_format, (), (), ()))
+    if do_lint_check:
+        stages.append(('lint', check_lint, (), (), ('directory',)))
+    if do_unit_tests:
+        stages.append(('unittest', unit_tests, (), ('build',), ('directory',)))
+    stages.append(('build', build_program, (), (), ('directory',)))
+    stages.append(('run', run_program, ('build',), (), ()))
+    if scaling:
+        stages.append(('scaling', check_scaling, ('run',), (), ()))
+    graph = []
+    for name, func, requires, after, resources in stages:
+        requires += tuple(policy.get(name, ()))
+        if name in ('build', 'unittest') and unity_enabled():
+            # A unity build compiles a source that is missing an #include
+            # when an earlier source has it; the precheck compiles each
+            # source on its own first.
+            requires += ('precheck',)
+        if base_directory and name not in ('header', 'base_diff'):
+            # An unchanged repository is not graded any further.
+            requires += ('base_diff',)
+        graph.append(Stage(name, func, requires, after, STAGE_COSTS[name], resources))
+    outcomes = run_stages(graph, jobs)
+
+    for name, *_ in stages:
+        if name in partial:
+            result.merge(partial[name])
+        elif outcomes[name].state == 'skipped':
+            result.stages.append(StageVerdict(name, False, detail=f'skipped: {outcomes[name].reason}', skipped=True))
     logger.info('End %s', identify(header))
-    sys.exit(status)
+    return result
+
 
-def csv_solution_check_make(csv_key, target_directory, program_name='asgt', base_directory=None, run=None, files=None, do_format_check=True, do_lint_check=True, tidy_options=None, skip_compile_cmd=False):
+def csv_solution_check_make(csv_key, target_directory, program_name='asgt', base_directory=None, run=None, files=None, do_format_check=True, do_lint_check=True, tidy_options=None, skip_compile_cmd=False, scaling=None):
     """Main function for checking student's solution. Provide a pointer to a
-    run function."""
+    run function. Grades with grade_part(), records the result in the
+    gradebook or the part's hidden CSV file and exits."""
+    import csv
+    from gradebook import CSV_FIELDS, open_gradebook
+    from roster import open_roster
     logger = setup_logger()
-    students_file = os.environ.get("MS_GITUSER_PICKLE")
-    students_dict = None
-    if not students_file:
-        logger.debug('Missing environment variable MS_GITUSER_PICKLE. Cannot convert GitHub logins to sortable names.')
+    students = open_roster()
+    if not students:
+        logger.debug('Missing environment variable MS_GITUSER_DB or MS_GITUSER_PICKLE. Cannot convert GitHub logins to sortable names.')
+    try:
+        result = grade_part(csv_key, target_directory, program_name, base_directory, run, files, do_format_check, do_lint_check, tidy_options, skip_compile_cmd, students, scaling=scaling)
+    finally:
+        if students:
+            students.close()
+    gradebook = open_gradebook()
+    if gradebook:
+        # Only this repo part's rows are replaced.
+        with gradebook:
+            gradebook.record_part(*result.gradebook_records())
     else:
-        logger.info("Loading student information")
-        with open(students_file, "rb") as fh:
-            # The students file contains only one dict
-            students_dict = pickle.load(fh)
-    abs_path_target_dir = os.path.abspath(target_directory)
-    repo_root = os.path.dirname(abs_path_target_dir)
-    cwd_name = os.path.basename(abs_path_target_dir)
-    csv_filename = f'.{csv_key}_{cwd_name}_gradelog.csv'
-    csv_path = os.path.join(repo_root, csv_filename)
-    csv_fields = ['Repo Name', 'Part', 'Author', 'Partner1', 'Partner2', 'Partner3', 'PartnerN', 'Formatting', 'Linting', 'Build', 'Tests', 'UnitTests', 'Notes', 'UnitTestNotes']
-    status = 0
-    with open(csv_path, 'w') as csv_output_handle:
-        outcsv = csv.DictWriter(csv_output_handle, csv_fields)
-        outcsv.writeheader()
-        row = {}
-        row['Repo Name'] = csv_key
-        row['Part'] = cwd_name
-        # Init to empty string so you're always adding notes.
-        row['Notes'] =''
-        if not files:
-            # This could be a target in the Makefile
-            files = glob_all_src_files(target_directory)
-        else:
-            files = [os.path.join(target_directory, file) for file in files]
-
-        if len(files) == 0:
-            logger.error("❌ No files in %s.", target_directory)
-            row['Formatting'] = 0
-            row['Linting'] = 0
-            row['Build'] = 0
-            row['Tests'] = 0
-            row['Notes'] = f"❌ No files in {target_directory}."
-            status = 1
-        else:
-            # Header checks
-            files_missing_header = [file for file in files if not header_check(file)]
-            files_with_header = [file for file in files if header_check(file)]
-            header = null_dict_header()
-            if len(files_with_header) == 0:
-                logger.error('❌ No header provided in any file in %s. Exiting.', target_directory)
-                logger.error('All files: %s', ' '.join(files))
-                row['Formatting'] = 0
-                row['Linting'] = 0
-                row['Build'] = 0
-                row['Tests'] = 0
-                all_files = ' '.join(files)
-                row['Notes'] = f'❌ No header provided in any file in {target_directory}. All files: {all_files}.'
-                status = 1
-            else:
-                with open(files_with_header[0]) as file_handle:
-                    contents = file_handle.read()
-                header = dict_header(contents)
-
-
-            logger.info('Start %s', identify(header))
-            logger.info('All files: %s', ' '.join(files))
-            files_missing_header = [file for file in files if not header_check(file)]
-            names = header['name'].split()
-            sortable_name = '{}, {}'.format(names[-1], ' '.join(names[:len(names)-1]))
-            row['Author'] = sortable_name
-            partners = header['partners'].replace(',', ' ').replace('@', '').lower().split()
-            sortable_names = []
-            
-            # Map GitHub login to student name
-            if students_dict:
-                # sortable partner names
-                for github_login in partners:
-                    print(github_login)
-                    student_name = students_dict[github_login] if github_login in students_dict else None
-                    if not student_name:
-                        logger.warning(f"No such user in db '{github_login}'. Skipping.")
-                        row['Notes'] = row['Notes'] + f'❌ Partner: no such user in db {github_login}.'
-                        name = github_login
-                    else:
-                        name = '"{}, {}"'.format(student_name[0], student_name[1])
-                    sortable_names.append(name)
-            else:
-                # Can't map the logins to names, just use them as is.
-                sortable_names = partners
-            for num, name in enumerate(sortable_names, start=1):
-                key = f'Partner{num}'
-                if num > 3:
-                    break
-                row[key] = name
-            if len(sortable_names) > 3:
-                row['PartnerN'] = ';'.join(sortable_names[3:])
-
-            if len(files_missing_header) != 0:
-                files_missing_header_str = ' '.join(files_missing_header)
-                logger.warning(
-                    'Files missing headers: %s', files_missing_header_str
-                )
-                row['Notes'] = row['Notes'] + f'❌Files missing headers: {files_missing_header_str}\n'
-                status = 1
-            # Check if files have changed
-            if base_directory:
-                count = 0
-                for file in files:
-                    diff = strip_and_compare_files(file, os.path.join(base_directory, file))
-                    if len(diff) == 0:
-                        count += 1
-                        logger.error('No changes made in file %s.', file)
-                if count == len(files):
-                    logger.error('No changes made ANY file. Stopping.')
-                    sys.exit(1)
-            else:
-                logger.debug('Skipping base file comparison.')
-
-            # Format
-            if do_format_check:
-                count = 0
-                for file in files:
-                    diff = format_check(file)
-                    if len(diff) != 0:
-                        logger.warning('❌ Formatting needs improvement in %s.', file)
-                        logger.info(
-                            'Please make sure your code conforms to the Google C++ style.'
-                        )
-                        logger.debug('\n'.join(diff))
-                        row['Notes'] = row['Notes'] + f'❌ Formatting needs improvement in {file}.\n'
-                        status = 1
-                    else:
-                        logger.info('✅ Formatting passed on %s', file)
-                        count += 1
-                row['Formatting'] = f'{count}/{len(files)}'
-
-            # Lint
-            if do_lint_check:
-                count = 0
-                for file in files:
-                    lint_warnings = lint_check(file, tidy_options, skip_compile_cmd)
-                    if len(lint_warnings) != 0:
-                        logger.warning('❌ Linter found improvements in %s.', file)
-                        logger.debug('\n'.join(lint_warnings))
-                        row['Notes'] = row['Notes'] + f'❌ Linter found improvements in {file}.\n'
-                        status = 1
-                    else:
-                        logger.info('✅ Linting passed in %s', file)
-                        count += 1
-                row['Linting'] = f'{count}/{len(files)}'
-            # Unit tests
-            # We don't know if there are unit tests in this project
-            # or not. We'll assume there are and then check to see
-            # if an output file was created.
-            logger.info('✅ Attempting unit tests')
-            unit_test_output_file="test_detail.json"
-            make_unittest(target_directory, output_file=unit_test_output_file)
-            unit_test_output_path = os.path.join(target_directory, unit_test_output_file)
-            if os.path.exists(unit_test_output_path):
-                logger.info('✅ Unit test output found')
-                with open(unit_test_output_path, 'r') as json_fh:
-                    unit_test_results = json.load(json_fh)
-                    total_tests = unit_test_results['tests']
-                    failures = unit_test_results.get('failures', 0)
-                    passed_tests = total_tests - failures
-                    if failures > 0:
-                        logger.error(f'❌ One or more unit tests failed ({passed_tests}/{total_tests})')
-                    else:
-                        logger.info('✅ Passed all unit tests')                    
-                    row['UnitTests'] = f'{passed_tests}/{total_tests}'
-                    row['UnitTestNotes'] = ""
-                    for test_suite in unit_test_results['testsuites']:
-                        name = test_suite['name']
-                        for inner_suite in test_suite['testsuite']:
-                            inner_name = inner_suite['name']
-                            if 'failures' in inner_suite:
-                                for fail in inner_suite['failures']:
-                                    this_fail = fail['failure']
-                                    unit_test_note = f'{name}:{inner_name}:{this_fail}\n'
-                                    row['UnitTestNotes'] = row['UnitTestNotes'] + unit_test_note
-                                    logger.error(f'❌ {unit_test_note}')
-                                    
-            # Clean, Build, & Run
-            if make_build(target_directory):
-                logger.info('✅ Build passed')
-                row['Build'] = 1
-                # Run
-                run_stats = run(os.path.join(target_directory, program_name))
-                # passed tests / total tests
-                test_notes = f'{sum(run_stats)}/{len(run_stats)}'
-                if all(run_stats):
-                    logger.info('✅ All test runs passed')
-                else:
-                    logger.error(f'❌ One or more runs failed ({test_notes})')
-                    row['Notes'] = row['Notes'] + f'❌ One or more test runs failed\n'
-                    status = 1
-                row['Tests'] = test_notes
-            else:
-                logger.error('❌ Build failed')
-                row['Build'] = 0
-                row['Notes'] = row['Notes'] + f'❌ Build failed\n'
-                row['Tests'] = '0/0'
-                status = 1
-            logger.info('End %s', identify(header))
-        outcsv.writerow(row)
-    sys.exit(status)
+        repo_root = os.path.dirname(os.path.abspath(target_directory))
+        csv_path = os.path.join(repo_root, f'.{csv_key}_{result.part}_gradelog.csv')
+        with open(csv_path, 'w') as csv_output_handle:
+            outcsv = csv.DictWriter(csv_output_handle, CSV_FIELDS)
+            outcsv.writeheader()
+            outcsv.writerow(result.csv_row())
+    sys.exit(result.status)
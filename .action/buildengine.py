@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Build engine that stands in for `make spotless all`. The part's
+    Makefile is asked for its variables, its translation units are
+    compiled in parallel and the target is linked, using the same
+    commands as the Makefile's rules. The compiler writes a .d file next
+    to each object, as the Makefile does, and the files each object was
+    built from are remembered by content in the cache directory, so a
+    rebuild compiles exactly the sources whose inputs or flags changed.
+
+    Compiles draw from a job budget shared by every grader on the
+    machine: MS_BUILD_JOBS slots (default: the number of CPUs) that are
+    lock files in the cache directory. A batch job holds one slot while
+    it grades (see job_slot()) and compiles its first source on it; each
+    further compile at the same time needs a free slot, so the machine
+    runs at most MS_BUILD_JOBS compiles however many parts are graded.
+    A build with no job slot held takes a slot of its own first. The
+    syntax check, the unit test build and the unit test shards draw
+    from the same budget through compile_slot() and run_all().
+    Select the engine with MS_BUILD_ENGINE=python.
+
+    With MS_BUILD_ENGINE=unity the engine first builds the program, and
+    the unit tests, as one translation unit each, so the standard
+    headers are parsed once rather than once per source. unity.py looks
+    for names the sources would clash on; with a clash, or when the
+    unity compile fails, the sources are built one by one as above.
+
+    ex.
+    .action/buildengine.py part-2
+"""
+
+import contextlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from fileaccess import cache_dir, file_digest
+from logger import setup_logger
+
+VARIABLES = (
+    'CXX', 'CXXFLAGS', 'LDFLAGS', 'LLDLIBS', 'CXXFILES', 'HEADERS', 'TARGET',
+    'GTESTINCLUDE', 'GTESTLIBS',
+)
+UNITTEST = 'unittest'
+COMPILE_TIMEOUT = 120
+POLL_SECONDS = 0.02
+
+# Slots held by job_slot() in this process that no compile_slot() is
+# using at the moment.
+_spare_slots = 0
+_spare_lock = threading.Lock()
+
+
+def engine_enabled():
+    """True when MS_BUILD_ENGINE selects this engine over make."""
+    return os.environ.get('MS_BUILD_ENGINE', 'make') in ('python', 'unity')
+
+
+def unity_enabled():
+    """True when MS_BUILD_ENGINE=unity: the engine first tries to build
+    the program and the unit tests each as one translation unit."""
+    return os.environ.get('MS_BUILD_ENGINE', 'make') == 'unity'
+
+
+def makefile_variables(target_dir, names=VARIABLES):
+    """{name: expanded value} for names from the Makefile in target_dir,
+    or None when make fails. A rule added with --eval prints them; DEP is
+    emptied so the .d files are not remade just to print a variable."""
+    from capture import run_bounded
+    logger = setup_logger()
+    rule = f"print-build-variables:;@:$(foreach name,{' '.join(names)},$(info $(name)=$($(name))))"
+    cmd = ['make', '-s', '-C', target_dir, '--eval', rule, 'print-build-variables', 'DEP=']
+    try:
+        proc = run_bounded(cmd, timeout=30, shell=False)
+    except subprocess.TimeoutExpired:
+        logger.error('❌ Reading the Makefile took more than 30 seconds')
+        return None
+    if proc.returncode != 0:
+        logger.info('stderr: %s', str(proc.stderr).rstrip('\n\r'))
+        return None
+    variables = dict.fromkeys(names, '')
+    for line in proc.stdout.splitlines():
+        name, _, value = line.partition('=')
+        if name in variables:
+            variables[name] = value.strip()
+    return variables
+
+
+def parse_depfile(path):
+    """The prerequisites in a make dependency file, either the compiler's
+    `main.o: main.cc hilo.h` or the Makefile's `main.o main.d : ...`.
+    Returns None when the file is missing."""
+    try:
+        with open(path) as file_handle:
+            text = file_handle.read().replace('\\\n', ' ')
+    except OSError:
+        return None
+    prerequisites = []
+    for line in text.splitlines():
+        targets, colon, rest = line.partition(':')
+        # -MP adds an empty rule per header; those add nothing.
+        if colon and rest.strip():
+            prerequisites.extend(word for word in rest.split() if word not in prerequisites)
+    return prerequisites
+
+
+class JobBudget:
+    """A machine wide pool of size job slots. A slot is a lock file held
+    with flock, so a slot is freed even when its holder dies."""
+
+    def __init__(self, size=None, directory=None):
+        self.size = size or int(os.environ.get('MS_BUILD_JOBS', '0')) or os.cpu_count() or 1
+        self.directory = directory or os.path.join(cache_dir(), 'jobslots')
+
+    def try_acquire(self):
+        """An open file holding a free slot, or None when all are taken."""
+        import fcntl
+        os.makedirs(self.directory, exist_ok=True)
+        for index in range(self.size):
+            file_handle = open(os.path.join(self.directory, f'slot-{index}'), 'a')
+            try:
+                fcntl.flock(file_handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file_handle.close()
+                continue
+            return file_handle
+        return None
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Hold a slot, waiting for one if need be."""
+        file_handle = self.try_acquire()
+        while file_handle is None:
+            time.sleep(POLL_SECONDS)
+            file_handle = self.try_acquire()
+        try:
+            yield
+        finally:
+            file_handle.close()
+
+
+@contextlib.contextmanager
+def job_slot():
+    """Hold a budget slot for a batch job, e.g. one part graded by
+    cohort_bench.py or the grading daemon, which the job's compiles
+    then use first. With make building the program this holds no slot
+    and each compile stage takes its own."""
+    global _spare_slots
+    if not engine_enabled():
+        yield
+        return
+    with JobBudget().slot():
+        with _spare_lock:
+            _spare_slots += 1
+        try:
+            yield
+        finally:
+            with _spare_lock:
+                _spare_slots -= 1
+
+
+def _borrow_spare():
+    global _spare_slots
+    with _spare_lock:
+        if _spare_slots:
+            _spare_slots -= 1
+            return True
+        return False
+
+
+@contextlib.contextmanager
+def compile_slot(budget=None):
+    """Hold a slot for one compile heavy step: the job's own slot when
+    job_slot() holds one that is free, otherwise a slot from budget,
+    waiting for either if need be."""
+    global _spare_slots
+    budget = budget or JobBudget()
+    file_handle = None
+    while not _borrow_spare():
+        file_handle = budget.try_acquire()
+        if file_handle is not None:
+            break
+        time.sleep(POLL_SECONDS)
+    try:
+        yield
+    finally:
+        if file_handle is None:
+            with _spare_lock:
+                _spare_slots += 1
+        else:
+            file_handle.close()
+
+
+def run_all(commands, run, budget=None):
+    """Call run(item) for every item in commands and return {item:
+    result}. One worker starts on a compile_slot(); the others start as
+    budget slots come free and stop when the work runs out."""
+    from concurrent.futures import ThreadPoolExecutor
+    budget = budget or JobBudget()
+    queue = list(commands)
+    lock = threading.Lock()
+    results = {}
+
+    def worker(own_slot):
+        file_handle = None
+        while not own_slot and file_handle is None:
+            with lock:
+                if not queue:
+                    return
+            file_handle = budget.try_acquire()
+            if file_handle is None:
+                time.sleep(POLL_SECONDS)
+        try:
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    item = queue.pop(0)
+                results[item] = run(item)
+        finally:
+            if file_handle is not None:
+                file_handle.close()
+
+    if not queue:
+        return results
+    workers = min(len(queue), budget.size)
+    with compile_slot(budget), ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(worker, number == 0) for number in range(workers)]
+        for future in futures:
+            future.result()
+    return results
+
+
+def _cache_key(target_dir):
+    import hashlib
+    return hashlib.sha256(os.path.abspath(target_dir).encode('utf-8')).hexdigest()[:32]
+
+
+def _state_path(target_dir):
+    return os.path.join(cache_dir(), 'build', f'{_cache_key(target_dir)}.json')
+
+
+def _load_state(target_dir):
+    import json
+    try:
+        with open(_state_path(target_dir)) as file_handle:
+            return json.load(file_handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(target_dir, state):
+    import json
+    path = _state_path(target_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as file_handle:
+        json.dump(state, file_handle)
+    os.replace(temp_path, path)
+
+
+def _inputs(target_dir, paths):
+    """{path: digest} for paths relative to target_dir, or None when one
+    of them is missing."""
+    digests = {}
+    for path in paths:
+        try:
+            digests[path] = file_digest(os.path.join(target_dir, path))
+        except OSError:
+            return None
+    return digests
+
+
+def _up_to_date(target_dir, output, command, entry):
+    """True when output exists and was made by command from inputs that
+    have not changed since."""
+    if not entry or entry.get('command') != command:
+        return False
+    if not os.path.exists(os.path.join(target_dir, output)):
+        return False
+    return _inputs(target_dir, entry.get('inputs', {})) == entry.get('inputs')
+
+
+def _unity_compile(target_dir, sources, output, flags, libs, state):
+    """Build output from sources compiled as one translation unit, a file
+    in the cache directory that #includes each of them. Returns False
+    when the sources clash or the unity compile fails, and the caller
+    builds them the usual way; their own errors are reported then."""
+    from capture import run_bounded
+    from unity import unity_clashes
+    logger = setup_logger()
+    paths = [os.path.abspath(os.path.join(target_dir, source)) for source in sources]
+    stem = os.path.join(cache_dir(), 'unity', f'{_cache_key(target_dir)}-{output}')
+    command = f'{flags} -MMD -MP -MF {stem}.d -o {output} {stem}.cc {libs}'.rstrip()
+    if _up_to_date(target_dir, output, command, state.get(output)):
+        return True
+    state.pop(output, None)
+    # An out of date output must not outlive a failed compile.
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(os.path.join(target_dir, output))
+    clashes = unity_clashes(paths)
+    if clashes:
+        logger.debug('No unity build of %s: %s', output, '; '.join(clashes))
+        return False
+    text = f'// Unity build of {output}\n' + ''.join(f'#include "{path}"\n' for path in paths)
+    os.makedirs(os.path.dirname(stem), exist_ok=True)
+    with open(f'{stem}.cc', 'w') as file_handle:
+        file_handle.write(text)
+    logger.debug(command)
+    try:
+        with compile_slot():
+            proc = run_bounded([command], timeout=COMPILE_TIMEOUT, cwd=target_dir)
+    except subprocess.TimeoutExpired:
+        return False
+    if proc.returncode != 0:
+        logger.debug('Unity build of %s failed; building each source', output)
+        return False
+    inputs = _inputs(target_dir, parse_depfile(f'{stem}.d') or paths)
+    state[output] = {'command': command, 'inputs': inputs or {}}
+    return True
+
+
+def unity_unittest(target_dir):
+    """Build the unittest binary from TARGET.cc and TARGET_unittest.cc,
+    the files the Makefile's utest rule uses, as one translation unit.
+    Returns False when that cannot be done and `make unittest` should
+    build it instead."""
+    variables = makefile_variables(target_dir)
+    if variables is None or not variables['TARGET']:
+        return False
+    target = variables['TARGET']
+    sources = [f'{target}.cc', f'{target}_unittest.cc']
+    if not all(os.path.exists(os.path.join(target_dir, source)) for source in sources):
+        return False
+    state = _load_state(target_dir)
+    flags = f"{variables['CXX']} {variables['CXXFLAGS']} {variables['GTESTINCLUDE']} {variables['LDFLAGS']}"
+    built = _unity_compile(target_dir, sources, UNITTEST, flags, variables['GTESTLIBS'], state)
+    _save_state(target_dir, state)
+    return built
+
+
+def build(target_dir, budget=None):
+    """Compile what changed in target_dir and link the target, like
+    `make all` with exact rebuilds. Returns True when the target was
+    built."""
+    from capture import run_bounded
+    logger = setup_logger()
+    if not os.path.exists(os.path.join(target_dir, 'Makefile')):
+        logger.error('Makefile does not exist in %s', target_dir)
+        return False
+    variables = makefile_variables(target_dir)
+    if variables is None or not variables['CXXFILES'] or not variables['TARGET']:
+        logger.error('❌ Cannot read the build settings from %s/Makefile', target_dir)
+        return False
+    budget = budget or JobBudget()
+    state = _load_state(target_dir)
+    sources = variables['CXXFILES'].split()
+    target = variables['TARGET']
+    flags = f"{variables['CXX']} {variables['CXXFLAGS']} {variables['LDFLAGS']}"
+    if unity_enabled() and len(sources) > 1 and _unity_compile(target_dir, sources, target, flags, variables['LLDLIBS'], state):
+        _save_state(target_dir, state)
+        return True
+    objects = [os.path.splitext(source)[0] + '.o' for source in sources]
+    commands = {}
+    for source, obj in zip(sources, objects):
+        depfile = os.path.splitext(source)[0] + '.d'
+        command = f"{variables['CXX']} {variables['CXXFLAGS']} -MMD -MP -MF {depfile} -c {source} -o {obj}"
+        if not _up_to_date(target_dir, obj, command, state.get(obj)):
+            commands[obj] = (source, depfile, command)
+            state.pop(obj, None)
+
+    def compile_one(obj):
+        source, depfile, command = commands[obj]
+        logger.debug(command)
+        try:
+            proc = run_bounded([command], timeout=COMPILE_TIMEOUT, cwd=target_dir)
+        except subprocess.TimeoutExpired:
+            return f'{source}: the compiler took more than {COMPILE_TIMEOUT} seconds'
+        if proc.returncode != 0:
+            return str(proc.stderr).rstrip('\n\r') or f'{source}: exit status {proc.returncode}'
+        inputs = _inputs(target_dir, parse_depfile(os.path.join(target_dir, depfile)) or [source])
+        state[obj] = {'command': command, 'inputs': inputs or {}}
+        return None
+
+    logger.debug('Compiling %d of %d sources in %s', len(commands), len(sources), target_dir)
+    errors = [error for error in run_all(commands, compile_one, budget).values() if error]
+    if errors:
+        _save_state(target_dir, state)
+        logger.info('stderr: %s', '\n'.join(errors))
+        return False
+    command = f"{variables['CXX']} {variables['LDFLAGS']} -o {target} {' '.join(objects)} {variables['LLDLIBS']}".rstrip()
+    if not _up_to_date(target_dir, target, command, state.get(target)):
+        logger.debug(command)
+        state.pop(target, None)
+        try:
+            with compile_slot(budget):
+                proc = run_bounded([command], timeout=COMPILE_TIMEOUT, cwd=target_dir)
+        except subprocess.TimeoutExpired:
+            logger.error('❌ Linking took more than %d seconds', COMPILE_TIMEOUT)
+            _save_state(target_dir, state)
+            return False
+        if proc.returncode != 0:
+            logger.info('stderr: %s', str(proc.stderr).rstrip('\n\r'))
+            _save_state(target_dir, state)
+            return False
+        state[target] = {'command': command, 'inputs': _inputs(target_dir, objects) or {}}
+    _save_state(target_dir, state)
+    return True
+
+
+def main():
+    """Main function; build a part with the engine."""
+    logger = setup_logger()
+    if len(sys.argv) != 2:
+        logger.error('usage: buildengine.py part-directory')
+        return 1
+    start = time.perf_counter()
+    built = build(sys.argv[1])
+    seconds = time.perf_counter() - start
+    if built:
+        logger.info('✅ Build passed in %.2f s', seconds)
+    else:
+        logger.error('❌ Build failed in %.2f s', seconds)
+    return 0 if built else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
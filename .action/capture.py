@@ -0,0 +1,210 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Bounded capture of program output. A student program that prints
+    forever must not fill memory before the timeout fires, so output is
+    kept as a fixed size head plus a ring buffer holding the tail.
+    Expected output is matched by pexpect as it arrives, with a
+    BoundedCapture as the logfile, so the byte limit ends a run early. """
+
+import os
+import signal
+import subprocess
+import threading
+import time
+
+DEFAULT_HEAD_SIZE = 4096
+DEFAULT_TAIL_SIZE = 4096
+DEFAULT_BYTE_LIMIT = 1024 * 1024
+
+
+class OutputLimitExceeded(Exception):
+    """Raised from BoundedCapture.write() once more than byte_limit bytes
+    have been written. When the capture is used as a pexpect logfile this
+    aborts the expect() call so pexpect stops buffering as well."""
+
+
+class BoundedCapture:
+    """File-like sink that counts every byte written to it but only
+    retains the first head_size bytes and the last tail_size bytes."""
+
+    def __init__(self, head_size=DEFAULT_HEAD_SIZE, tail_size=DEFAULT_TAIL_SIZE, byte_limit=None):
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.byte_limit = byte_limit
+        self.total_bytes = 0
+        self._head = bytearray()
+        self._ring = bytearray(tail_size)
+        self._ring_pos = 0
+        self._ring_len = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        written = len(data)
+        with self._lock:
+            self.total_bytes += len(data)
+            if len(self._head) < self.head_size:
+                room = self.head_size - len(self._head)
+                self._head += data[:room]
+                data = data[room:]
+            self._ring_write(data)
+        if self.byte_limit and self.total_bytes > self.byte_limit:
+            raise OutputLimitExceeded(
+                f'output exceeded {self.byte_limit} bytes'
+            )
+        return written
+
+    def _ring_write(self, data):
+        if not data or not self.tail_size:
+            return
+        if len(data) >= self.tail_size:
+            self._ring[:] = data[-self.tail_size:]
+            self._ring_pos = 0
+            self._ring_len = self.tail_size
+            return
+        end = self._ring_pos + len(data)
+        if end <= self.tail_size:
+            self._ring[self._ring_pos:end] = data
+        else:
+            split = self.tail_size - self._ring_pos
+            self._ring[self._ring_pos:] = data[:split]
+            self._ring[:end - self.tail_size] = data[split:]
+        self._ring_pos = end % self.tail_size
+        self._ring_len = min(self.tail_size, self._ring_len + len(data))
+
+    def flush(self):
+        """Nothing to flush; present for the file protocol."""
+
+    @property
+    def truncated(self):
+        """True when bytes were dropped between the head and the tail."""
+        return self.total_bytes > len(self._head) + self._ring_len
+
+    def tail(self):
+        """The retained tail in stream order."""
+        if self._ring_len < self.tail_size:
+            return bytes(self._ring[:self._ring_len])
+        return bytes(self._ring[self._ring_pos:] + self._ring[:self._ring_pos])
+
+    def getvalue(self):
+        """Head and tail joined, with a marker noting any omitted bytes."""
+        with self._lock:
+            if not self.truncated:
+                return bytes(self._head) + self.tail()
+            omitted = self.total_bytes - len(self._head) - self._ring_len
+            marker = f'\n[... {omitted} bytes omitted ...]\n'.encode('utf-8')
+            return bytes(self._head) + marker + self.tail()
+
+    def text(self):
+        """getvalue() decoded for logging."""
+        return self.getvalue().decode('utf-8', errors='replace')
+
+
+def _pump(stream, capture):
+    for chunk in iter(lambda: stream.read1(8192), b''):
+        capture.write(chunk)
+    stream.close()
+
+
+def _feed(stream, data):
+    try:
+        stream.write(data)
+        stream.close()
+    except BrokenPipeError:
+        pass
+
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_bounded(cmd, timeout, shell=True, input=None, head_size=DEFAULT_HEAD_SIZE, tail_size=DEFAULT_TAIL_SIZE, cwd=None, env=None):
+    """Drop in for subprocess.run(..., capture_output=True, text=True)
+    which streams stdout and stderr into BoundedCapture objects. Returns a
+    CompletedProcess whose stdout and stderr are the retained text; raises
+    subprocess.TimeoutExpired after killing the child on timeout. The
+    timeout also covers writing input and reading the pipes to their end,
+    which a backgrounded grandchild can hold open after the child exits."""
+    deadline = time.monotonic() + timeout
+    proc = subprocess.Popen(
+        cmd,
+        shell=shell,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+        cwd=cwd,
+        env=env,
+    )
+    out = BoundedCapture(head_size, tail_size)
+    err = BoundedCapture(head_size, tail_size)
+    pumps = [
+        threading.Thread(target=_pump, args=(proc.stdout, out), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stderr, err), daemon=True),
+    ]
+    if input is not None:
+        # A child that never reads stdin must not block us past the timeout.
+        pumps.append(threading.Thread(target=_feed, args=(proc.stdin, input.encode('utf-8')), daemon=True))
+    for pump in pumps:
+        pump.start()
+    try:
+        proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+        for pump in pumps:
+            pump.join(max(0.0, deadline - time.monotonic()))
+            if pump.is_alive():
+                raise subprocess.TimeoutExpired(cmd, timeout)
+    except subprocess.TimeoutExpired:
+        # Kill the whole group; with shell=True the student program is a
+        # grandchild and would otherwise keep the pipes open.
+        _kill_group(proc)
+        proc.wait()
+        for pump in pumps:
+            # A process that left the group can still hold a pipe; give
+            # up on the rest of its output rather than wait for it.
+            pump.join(1)
+        raise subprocess.TimeoutExpired(cmd, timeout, out.getvalue(), err.getvalue())
+    return subprocess.CompletedProcess(cmd, proc.returncode, out.text(), err.text())
+
+
+def drain_to_eof(proc, chunk_size=8192):
+    """Read a pexpect child until EOF without letting pexpect accumulate
+    the output in its before buffer; the logfile still sees every byte."""
+    import pexpect
+    while True:
+        try:
+            proc.read_nonblocking(chunk_size, timeout=proc.timeout)
+        except pexpect.exceptions.EOF:
+            break
@@ -28,10 +28,9 @@
 
 import glob
 import subprocess
-import difflib
 import os.path
 import logging
-from mkcompiledb import create_clang_compile_commands_db
+from fileaccess import read_text
 from logger import setup_logger
 
 def remove_cpp_comments(file):
@@ -100,7 +99,9 @@ def makefile_get_compilecmd(target_dir, compiler='clang++'):
     matches = None
     for makefile in makefiles:
         if makefile_has_compilecmd(makefile):
-            cmd = 'make -C {} compilecmd'.format(target_dir)
+            # DEP= keeps make from regenerating every .d file, which
+            # runs the compiler once per source, just to print a line.
+            cmd = 'make -C {} compilecmd DEP='.format(target_dir)
             proc = subprocess.run(
                 [cmd],
                 capture_output=True,
@@ -124,6 +125,7 @@ def makefile_get_compilecmd(target_dir, compiler='clang++'):
 def strip_and_compare_files(base_file, submission_file):
     """ Compare two source files with a contextual diff, return \
     result as a list of lines. """
+    import difflib
     base_file_contents_no_comments = remove_cpp_comments(base_file)
     contents_no_comments = remove_cpp_comments(submission_file)
     diff = ""
@@ -144,6 +146,20 @@ def strip_and_compare_files(base_file, submission_file):
     return list(diff)
 
 
+def format_diff(original_format, correct_format):
+    """ Contextual diff between a file's lines and the lines \
+    clang-format produced, as a list of lines. """
+    import difflib
+    diff = difflib.context_diff(
+        original_format,
+        correct_format,
+        'Student Submission (Yours)',
+        'Correct Format',
+        n=3,
+    )
+    return list(diff)
+
+
 def format_check(file):
     """ Use clang-format to check file's format against the \
     Google C++ style. """
@@ -162,22 +178,15 @@ def format_check(file):
         text=True,
     )
     correct_format = str(proc.stdout).split('\n')
-    with open(file) as file_handle:
-        original_format = file_handle.read().split('\n')
-    diff = difflib.context_diff(
-        original_format,
-        correct_format,
-        'Student Submission (Yours)',
-        'Correct Format',
-        n=3,
-    )
-    # print('\n'.join(list(diff)))
-    return list(diff)
+    original_format = read_text(file).split('\n')
+    return format_diff(original_format, correct_format)
 
 
-def lint_check(file, tidy_options=None, skip_compile_cmd=False):
+def lint_check(file, tidy_options=None, skip_compile_cmd=False, header_filter=None):
     """ Use clang-tidy to lint the file. Options for clang-tidy \
-    defined in the function. """
+    defined in the function. header_filter is clang-tidy's \
+    -header-filter regex for headers to report diagnostics in. """
+    from mkcompiledb import create_clang_compile_commands_db
     logger = setup_logger()
     # clang-tidy
     if not skip_compile_cmd:
@@ -211,6 +220,9 @@ def lint_check(file, tidy_options=None, skip_compile_cmd=False):
     else:
         cmd_options = tidy_options
     cmd = cmd + ' ' + cmd_options + ' ' + file
+    if header_filter:
+        import shlex
+        cmd = cmd + ' ' + shlex.quote('-header-filter=' + header_filter)
     if skip_compile_cmd:
         cmd = cmd + ' -- -std=c++17'
     logger.debug('Tidy command %s', cmd)
@@ -226,17 +238,53 @@ def lint_check(file, tidy_options=None, skip_compile_cmd=False):
     linter_warnings = [line for line in linter_warnings if line != '']
     return linter_warnings
 
-def glob_cc_src_files(target_dir='.'):
-    """Recurse through the target_dir and find all the .cc files."""
-    return glob.glob(os.path.join(target_dir, '**/*.cc'), recursive=True)
+
+def syntax_check(target_dir, sources, compiler='clang++', timeout=30):
+    """ Compile each of sources with -fsyntax-only, in parallel, using \
+    the flags from the Makefile in target_dir. Returns a dict of \
+    source -> compiler errors, empty when the source compiles, or None \
+    when the compiler cannot be run. """
+    import shlex
+    from buildengine import run_all
+    from capture import run_bounded
+    logger = setup_logger()
+    compilecmd = makefile_get_compilecmd(target_dir, compiler) or f'{compiler} -std=c++17'
+
+    def check(source):
+        cmd = f'{compilecmd} -fsyntax-only {shlex.quote(source)}'
+        logger.debug(cmd)
+        try:
+            return run_bounded([cmd], timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return subprocess.CompletedProcess(cmd, 1, '', f'{source}: the compiler took more than {timeout} seconds')
+
+    # The compiles share the machine wide job budget with the builds.
+    ran = run_all(sources, check)
+    procs = [ran[source] for source in sources]
+    if any(proc.returncode == 127 for proc in procs):
+        logger.debug('Cannot run %s; skipping the syntax check.', compiler)
+        return None
+    return {
+        source: '' if proc.returncode == 0 else str(proc.stderr).rstrip('\n\r')
+        for source, proc in zip(sources, procs)
+    }
+
+
+def glob_cc_src_files(target_dir='.', index=None):
+    """Recurse through the target_dir and find all the .cc files. index
+    is a srcindex.SourceIndex of target_dir to use instead of the kept
+    one."""
+    from srcindex import source_index
+    return (index or source_index(target_dir)).files('cc')
 
 
-def glob_h_src_files(target_dir='.'):
+def glob_h_src_files(target_dir='.', index=None):
     """Recurse through the target_dir and find all the .h files."""
-    return glob.glob(os.path.join(target_dir, '**/*.h'), recursive=True)
+    from srcindex import source_index
+    return (index or source_index(target_dir)).files('h')
 
 
-def glob_all_src_files(target_dir='.'):
+def glob_all_src_files(target_dir='.', index=None):
     """Recurse through the target_dir and find all the .cc and .h files."""
-    files = glob_cc_src_files(target_dir) + glob_h_src_files(target_dir)
-    return files
+    from srcindex import source_index
+    return (index or source_index(target_dir)).files('cc', 'h')
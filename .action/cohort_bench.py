@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" End to end benchmark of the grader on a synthetic cohort. Fake
+    student repositories are made from this repository's parts with
+    random headers, formatting drift, lint violations, compile errors,
+    infinite loops and duplicated partners, then graded with
+    assessment.grade_part() at several concurrency levels. Per stage
+    throughput and latency percentiles are written to a JSON file that
+    can be compared between commits. Runs offline.
+
+    With --engines the cohort is graded once per build engine (see
+    MS_BUILD_ENGINE in buildengine.py), levels are named engine/jobs and
+    the seconds spent compiling, in the build and unittest stages, are
+    compared with the first engine's.
+
+    ex.
+    .action/cohort_bench.py --students 20 --jobs 1 2 4 --json cohort.json
+    .action/cohort_bench.py --jobs 2 --engines make python unity
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from logger import setup_logger
+
+KINDS = (
+    'valid', 'bad_header', 'format_drift', 'lint_violation',
+    'compile_error', 'infinite_loop', 'partner_duplicate',
+)
+FIRST_NAMES = ('Ada', 'Alan', 'Grace', 'Edsger', 'Barbara', 'Donald', 'Frances', 'Ken')
+LAST_NAMES = ('Lovelace', 'Turing', 'Hopper', 'Dijkstra', 'Liskov', 'Knuth', 'Allen', 'Thompson')
+# Stages whose time is spent compiling.
+COMPILE_STAGES = ('build', 'unittest')
+# Files and directories that are build output, never part of a repo.
+IGNORE = shutil.ignore_patterns('*.o', '*.d', 'unittest', 'test_detail.json', 'compile_commands.json')
+
+
+def part_dirs(repo_root):
+    """The part-N directories of a repository, sorted."""
+    return sorted(
+        name for name in os.listdir(repo_root)
+        if re.fullmatch(r'part-\d+', name) and os.path.isdir(os.path.join(repo_root, name))
+    )
+
+
+def makefile_target(part_dir):
+    """The TARGET variable of a part's Makefile, i.e. the program name."""
+    with open(os.path.join(part_dir, 'Makefile')) as file_handle:
+        match = re.search(r'^TARGET\s*=\s*(\S+)', file_handle.read(), re.MULTILINE)
+    return match.group(1) if match else 'asgt'
+
+
+def make_header(rng, login, partners, lab, valid=True):
+    """A header for login; when valid is False one field is broken."""
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    lines = [
+        f'// {first} {last}',
+        '// CPSC 120-01',
+        '// 2022-11-12',
+        f'// {login}@csu.fullerton.edu',
+        f'// @{login}',
+        '//',
+        f'// {lab}',
+        '// Partners: ' + ', '.join(f'@{partner}' for partner in partners),
+        '//',
+        '// Synthetic submission for benchmarking.',
+        '//',
+    ]
+    if not valid:
+        broken = rng.choice((
+            (3, f'// {login}@gmail.com'),
+            (5, '// not blank'),
+            (1, '// CPSC one-twenty'),
+            (0, ' // leading whitespace'),
+        ))
+        lines[broken[0]] = broken[1]
+    return '\n'.join(lines) + '\n'
+
+
+def replace_header(contents, header):
+    """Swap the leading // comment block of contents for header."""
+    lines = contents.split('\n')
+    index = 0
+    while index < len(lines) and lines[index].lstrip().startswith('//'):
+        index += 1
+    return header + '\n'.join(lines[index:])
+
+
+def mutate_main(contents, kind):
+    """Apply a kind of defect to the body of a main.cc."""
+    if kind == 'format_drift':
+        return contents.replace('\n  ', '\n      ').replace(') {', ')\n{')
+    if kind == 'lint_violation':
+        return contents.replace('int main(', 'using namespace std;\nint unused_global = 3;\nint main(', 1)
+    if kind == 'compile_error':
+        return contents.replace('return 0;', 'return 0 this is not C++;', 1)
+    if kind == 'infinite_loop':
+        return re.sub(r'(int main\([^)]*\) \{)', r'\1\n  while (true) {\n    std::cout << "y\\n";\n  }', contents, count=1)
+    return contents
+
+
+def synthesize_cohort(source_root, destination, students, seed):
+    """Create students fake repositories under destination. Returns a
+    list of (repo_dir, kind)."""
+    rng = random.Random(seed)
+    parts = part_dirs(source_root)
+    logins = [f'student{number:04d}' for number in range(students)]
+    cohort = []
+    for number, login in enumerate(logins):
+        kind = KINDS[number % len(KINDS)] if number < len(KINDS) else rng.choice(KINDS)
+        repo_dir = os.path.join(destination, f'cpsc-120-lab-11-{login}')
+        partners = [rng.choice(logins)]
+        if kind == 'partner_duplicate':
+            partners = [login, partners[0], partners[0]]
+        for part in parts:
+            part_dir = os.path.join(repo_dir, part)
+            shutil.copytree(os.path.join(source_root, part), part_dir, ignore=IGNORE)
+            lab = f'Lab 11-0{part.split("-")[1]}'
+            header = make_header(rng, login, partners, lab, kind != 'bad_header')
+            for name in os.listdir(part_dir):
+                if not name.endswith(('.cc', '.h')):
+                    continue
+                path = os.path.join(part_dir, name)
+                with open(path) as file_handle:
+                    contents = replace_header(file_handle.read(), header)
+                if name == 'main.cc':
+                    contents = mutate_main(contents, kind)
+                with open(path, 'w') as file_handle:
+                    file_handle.write(contents)
+        cohort.append((repo_dir, kind))
+    return cohort
+
+
+def _quiet_worker():
+    import logging
+    setup_logger()
+    logging.getLogger().setLevel(logging.CRITICAL + 1)
+
+
+def _grade_job(job):
+    """Grade one part in a worker; the part directory becomes the working
+    directory just as it is for `make test`."""
+    repo_dir, part, kind = job
+    from assessment import grade_part
+    from buildengine import job_slot
+    import solution_check
+    run, files = solution_check.PARTS[part]
+    part_dir = os.path.join(repo_dir, part)
+    os.chdir(part_dir)
+    start = time.perf_counter()
+    with job_slot():
+        result = grade_part(
+            os.path.basename(repo_dir), '.', makefile_target(part_dir),
+            run=run, files=files, tidy_options=solution_check.tidy_opts,
+        )
+    return {
+        'kind': kind,
+        'part': part,
+        'status': result.status,
+        'seconds': time.perf_counter() - start,
+        'timings': result.timings,
+    }
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of a non-empty list: the smallest value
+    with at least fraction of the values at or below it.
+
+    >>> percentile([1, 2], 0.5), percentile([1, 2], 0.95)
+    (1, 2)
+    >>> [percentile([4, 1, 3, 2], f) for f in (0.25, 0.5, 0.75, 0.95, 1.0)]
+    [1, 2, 3, 4, 4]
+    """
+    ordered = sorted(values)
+    # Rounded first so that e.g. 0.7 * 10 counts as the whole rank 7.
+    rank = math.ceil(round(fraction * len(ordered), 9))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def summarize(samples, wall_seconds):
+    """Latency percentiles in ms and throughput per second."""
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+        'p90_ms': round(percentile(samples, 0.90) * 1000, 2),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+        'max_ms': round(max(samples) * 1000, 2),
+        'per_second': round(len(samples) / wall_seconds, 3),
+    }
+
+
+def run_level(cohort, jobs):
+    """Grade every part of the cohort with jobs worker processes."""
+    work = [
+        (repo_dir, part, kind)
+        for repo_dir, kind in cohort
+        for part in part_dirs(repo_dir)
+    ]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_quiet_worker) as pool:
+        outcomes = list(pool.map(_grade_job, work))
+    wall_seconds = time.perf_counter() - start
+    stages = {}
+    for outcome in outcomes:
+        for stage, seconds in outcome['timings'].items():
+            stages.setdefault(stage, []).append(seconds)
+    kinds = {}
+    for outcome in outcomes:
+        kinds.setdefault(outcome['kind'], []).append(outcome['status'])
+    return {
+        'wall_seconds': round(wall_seconds, 3),
+        'compile_seconds': round(sum(sum(stages.get(stage, [])) for stage in COMPILE_STAGES), 3),
+        'parts': summarize([outcome['seconds'] for outcome in outcomes], wall_seconds),
+        'stages': {stage: summarize(samples, wall_seconds) for stage, samples in sorted(stages.items())},
+        'failing_parts_by_kind': {kind: sum(1 for status in statuses if status) for kind, statuses in sorted(kinds.items())},
+    }
+
+
+def git_commit(repo_root):
+    """The commit being benchmarked, or None outside a git checkout."""
+    proc = subprocess.run(
+        ['git', '-C', repo_root, 'rev-parse', '--short', 'HEAD'],
+        capture_output=True, check=False, text=True,
+    )
+    return proc.stdout.strip() or None
+
+
+def main():
+    """Main function; synthesize a cohort and grade it."""
+    logger = setup_logger()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=14)
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seed', type=int, default=120)
+    parser.add_argument('--json', default='cohort_bench.json')
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic repositories')
+    parser.add_argument('--engines', nargs='+', choices=('make', 'python', 'unity'), help='build engines to compare')
+    args = parser.parse_args()
+    source_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix='cohort_bench_')
+    report = {
+        'config': {'students': args.students, 'jobs': args.jobs, 'seed': args.seed, 'engines': args.engines},
+        'commit': git_commit(source_root),
+        'levels': {},
+    }
+    try:
+        for engine in args.engines or [None]:
+            if engine:
+                # Workers inherit the environment when the pool starts.
+                os.environ['MS_BUILD_ENGINE'] = engine
+            for jobs in args.jobs:
+                name = f'{engine}/{jobs}' if engine else str(jobs)
+                # A fresh cohort per level so no level benefits from
+                # another's build products.
+                level_dir = os.path.join(workdir, f'{engine or "default"}-jobs-{jobs}')
+                cohort = synthesize_cohort(source_root, level_dir, args.students, args.seed)
+                logger.info('Grading %d repositories with %d job(s)', len(cohort), jobs)
+                report['levels'][name] = run_level(cohort, jobs)
+                logger.info(
+                    '%s: %.1f s, %.1f s compiling', name,
+                    report['levels'][name]['wall_seconds'], report['levels'][name]['compile_seconds'],
+                )
+        for engine in (args.engines or [])[1:]:
+            for jobs in args.jobs:
+                base = report['levels'][f'{args.engines[0]}/{jobs}']['compile_seconds']
+                seconds = report['levels'][f'{engine}/{jobs}']['compile_seconds']
+                saving = 100 * (base - seconds) / base if base else 0.0
+                logger.info('%s vs %s, %d job(s): %.1f%% less compile time', engine, args.engines[0], jobs, saving)
+    finally:
+        if args.keep:
+            logger.info('Synthetic repositories kept in %s', workdir)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.json, 'w') as file_handle:
+        json.dump(report, file_handle, indent=2, sort_keys=True)
+    logger.info('Wrote %s', args.json)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Columnar cache of CSV data files such as part-1's
+    state_demographics.csv. A CSV is parsed once into one typed binary
+    file per column under MS_CACHE_DIR: 64-bit integers or doubles in the
+    layout of the array module, plus for every column the cells' original
+    text as a UTF-8 string table with offsets. A column is numeric only
+    when every cell is a plain decimal number, as std::stoi and std::stod
+    read them in the students' code; 1_000, nan and inf stay text. The
+    files are memory-mapped, so a numeric column is a memoryview over the
+    page cache with no copying. The cache is keyed by the CSV's SHA-256,
+    so an edited CSV is converted again on its own.
+
+    ex.
+    .action/columnar.py part-1/state_demographics.csv
+"""
+
+import csv
+import json
+import mmap
+import os
+import re
+import sys
+from array import array
+from fileaccess import cache_dir, file_digest
+from logger import setup_logger
+
+FORMAT_VERSION = 2
+# Column type -> array typecode
+TYPECODES = {'int': 'q', 'float': 'd'}
+# Cells that are numbers. Python's int() and float() also take 1_000,
+# nan, inf and surrounding spaces, which the students' readers do not.
+NUMBER_REGEXES = (
+    ('int', re.compile(r'[+-]?[0-9]+')),
+    ('float', re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')),
+)
+
+
+def _column_type(cells):
+    for kind, regex in NUMBER_REGEXES:
+        if all(regex.fullmatch(cell) for cell in cells):
+            return kind
+    return 'str'
+
+
+def _file_name(index):
+    return f'column-{index:03d}'
+
+
+def _read_meta(directory):
+    """The meta.json of a converted directory, or None when there is no
+    current one."""
+    try:
+        with open(os.path.join(directory, 'meta.json')) as file_handle:
+            meta = json.load(file_handle)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('version') == FORMAT_VERSION else None
+
+
+def _write_columns(header, body, directory):
+    """Write the files of each header column into directory and return
+    the columns' descriptions."""
+    columns = []
+    for index, name in enumerate(header):
+        cells = [row[index] for row in body]
+        kind = _column_type(cells)
+        base = os.path.join(directory, _file_name(index))
+        blob = bytearray()
+        offsets = array('q', [0])
+        for cell in cells:
+            blob += cell.encode('utf-8')
+            offsets.append(len(blob))
+        with open(base + '.offsets', 'wb') as file_handle:
+            offsets.tofile(file_handle)
+        with open(base + '.strings', 'wb') as file_handle:
+            file_handle.write(blob)
+        if kind != 'str':
+            parse = int if kind == 'int' else float
+            with open(base + '.values', 'wb') as file_handle:
+                array(TYPECODES[kind], map(parse, cells)).tofile(file_handle)
+        columns.append({'name': name, 'type': kind})
+    return columns
+
+
+def convert(csv_path, destination):
+    """Parse csv_path into destination, one set of files per column. The
+    files are written to a temporary directory beside destination that
+    is then renamed into place, so graders converting the same CSV at
+    once never see each other's partly written files."""
+    import shutil
+    import tempfile
+    with open(csv_path, newline='') as file_handle:
+        rows = list(csv.reader(file_handle))
+    header, body = rows[0], [row for row in rows[1:] if len(row) == len(rows[0])]
+    parent = os.path.dirname(destination)
+    os.makedirs(parent, exist_ok=True)
+    temp_directory = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(destination) + '.')
+    try:
+        meta = {'version': FORMAT_VERSION, 'source': os.path.realpath(csv_path),
+                'rows': len(body), 'columns': _write_columns(header, body, temp_directory)}
+        with open(os.path.join(temp_directory, 'meta.json'), 'w') as file_handle:
+            json.dump(meta, file_handle)
+        for attempt in range(3):
+            try:
+                os.replace(temp_directory, destination)
+                return meta
+            except OSError:
+                # destination is not empty: another grader finished
+                # first, or it holds an older format, which is moved
+                # aside and removed.
+                current = _read_meta(destination)
+                if current:
+                    return current
+                if attempt == 2:
+                    raise
+                stale = temp_directory + '.stale'
+                try:
+                    os.replace(destination, stale)
+                except FileNotFoundError:
+                    pass
+                shutil.rmtree(stale, ignore_errors=True)
+    finally:
+        shutil.rmtree(temp_directory, ignore_errors=True)
+
+
+class ColumnarTable:
+    """A converted CSV. column() returns a memoryview of a numeric column
+    straight from the mapped file; strings() decodes a text column. Close
+    the table, or use it as a context manager, when done with the views."""
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.directory = os.path.join(cache_dir(), f'columnar-{file_digest(csv_path)}')
+        self.meta = _read_meta(self.directory) or convert(csv_path, self.directory)
+        self.rows = self.meta['rows']
+        self.names = [column['name'] for column in self.meta['columns']]
+        self._maps = {}
+        self._views = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        for mapped in self._maps.values():
+            mapped.close()
+        self._views = {}
+        self._maps = {}
+
+    def _map(self, path):
+        mapped = self._maps.get(path)
+        if mapped is None:
+            if os.path.getsize(path) == 0:
+                return b''
+            with open(path, 'rb') as file_handle:
+                mapped = self._maps[path] = mmap.mmap(
+                    file_handle.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        return mapped
+
+    def _index(self, name):
+        return name if isinstance(name, int) else self.names.index(name)
+
+    def column_type(self, name):
+        return self.meta['columns'][self._index(name)]['type']
+
+    def column(self, name):
+        """A numeric column as a read only memoryview of int or float."""
+        index = self._index(name)
+        view = self._views.get(index)
+        if view is None:
+            kind = self.meta['columns'][index]['type']
+            if kind == 'str':
+                raise TypeError(f'column {self.names[index]} holds text')
+            path = os.path.join(self.directory, _file_name(index) + '.values')
+            view = self._views[index] = memoryview(self._map(path)).cast(TYPECODES[kind])
+        return view
+
+    def strings(self, name):
+        """Any column's cells as the text in the CSV, a list of str."""
+        index = self._index(name)
+        base = os.path.join(self.directory, _file_name(index))
+        offsets = memoryview(self._map(base + '.offsets')).cast('q')
+        blob = self._map(base + '.strings')
+        try:
+            return [
+                blob[offsets[row]:offsets[row + 1]].decode('utf-8') for row in range(self.rows)
+            ]
+        finally:
+            offsets.release()
+
+    def cells(self, name):
+        """Any column as a list of Python values."""
+        if self.column_type(name) == 'str':
+            return self.strings(name)
+        return self.column(name).tolist()
+
+
+_tables = {}
+
+
+def open_table(csv_path):
+    """The ColumnarTable for csv_path, shared for the rest of the run
+    while the file is unchanged."""
+    key = (os.path.realpath(csv_path), file_digest(csv_path))
+    table = _tables.get(key)
+    if table is None:
+        table = _tables[key] = ColumnarTable(csv_path)
+    return table
+
+
+def main():
+    """Main function; convert CSV files and describe their columns."""
+    logger = setup_logger()
+    for csv_path in sys.argv[1:]:
+        table = open_table(csv_path)
+        logger.info('%s: %d rows in %s', csv_path, table.rows, table.directory)
+        for column in table.meta['columns']:
+            logger.info('  %-6s %s', column['type'], column['name'])
+
+
+if __name__ == '__main__':
+    main()
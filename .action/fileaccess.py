@@ -0,0 +1,159 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Shared file access for the checks. Small files are read once per
+    run and kept, keyed by (path, mtime, size), so the header, format and
+    main function checks do not each read them again. Header work only
+    reads the first few KB and regex scans of large files go through
+    mmap, so a multi-megabyte file pasted into a repository does not
+    slow down the checks that only need a little of it. """
+
+import io
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+# Files at least this large are never cached and are scanned with mmap.
+LARGE_FILE_BYTES = 1 << 20
+# Upper bound on the bytes kept in the cache.
+CACHE_BYTES = 32 << 20
+
+_cache = OrderedDict()
+_cached_bytes = 0
+# grade_part() runs stages on threads; this guards _cache, _cached_bytes
+# and _digests. Files are read outside of it.
+_lock = threading.Lock()
+
+
+def file_key(path):
+    """(path, mtime_ns, size) of path; a changed file gets a new key."""
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def _remember(key, data):
+    """Cache data under key; called with _lock held."""
+    global _cached_bytes
+    if key in _cache:
+        # Another thread read the same file first.
+        return
+    _cache[key] = data
+    _cached_bytes += len(data)
+    while _cached_bytes > CACHE_BYTES:
+        _, evicted = _cache.popitem(last=False)
+        _cached_bytes -= len(evicted)
+
+
+def clear_cache():
+    """Forget every cached file."""
+    global _cached_bytes
+    with _lock:
+        _cache.clear()
+        _digests.clear()
+        _cached_bytes = 0
+
+
+def _cached(key):
+    """The cached data for key, marked as recently used, or None."""
+    with _lock:
+        data = _cache.get(key)
+        if data is not None:
+            _cache.move_to_end(key)
+        return data
+
+
+def read_bytes(path):
+    """The contents of path as bytes, from the cache when unchanged."""
+    key = file_key(path)
+    data = _cached(key)
+    if data is None:
+        with open(path, 'rb') as file_handle:
+            data = file_handle.read()
+        if len(data) < LARGE_FILE_BYTES:
+            with _lock:
+                _remember(key, data)
+    return data
+
+
+def _text_stream(data):
+    # Same decoding and newline translation as open(path).
+    return io.TextIOWrapper(io.BytesIO(data))
+
+
+def read_text(path):
+    """The contents of path as text, as open(path).read() returns it."""
+    return _text_stream(read_bytes(path)).read()
+
+
+def open_text(path):
+    """A text stream over path. Served from the cache when the file is
+    there; otherwise the file is opened so a reader that only wants the
+    first few KB, such as the header parser, reads no more than that."""
+    if _cache:
+        data = _cached(file_key(path))
+        if data is not None:
+            return _text_stream(data)
+    return open(path)
+
+
+def cache_dir():
+    """Directory for caches kept between runs: MS_CACHE_DIR or
+    ~/.cache/cpsc120-grader."""
+    return os.environ.get(
+        'MS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'cpsc120-grader')
+    )
+
+
+_digests = {}
+
+
+def file_digest(path):
+    """SHA-256 hex digest of path's contents, computed once per version
+    of the file."""
+    key = file_key(path)
+    with _lock:
+        digest = _digests.get(key)
+    if digest is None:
+        import hashlib
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as file_handle:
+            for chunk in iter(lambda: file_handle.read(1 << 16), b''):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        with _lock:
+            _digests[key] = digest
+    return digest
+
+
+def contains(path, pattern):
+    """True when the compiled bytes pattern matches somewhere in path.
+    Large files are scanned through mmap rather than read."""
+    key = file_key(path)
+    if key[2] >= LARGE_FILE_BYTES and key not in _cache:
+        with open(path, 'rb') as file_handle, \
+                mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return pattern.search(mapped) is not None
+    return pattern.search(read_bytes(path)) is not None
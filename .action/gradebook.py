@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Gradebook kept in a SQLite database. Every grader process records its
+    part into the same database file (set MS_GRADEBOOK to its path) and
+    the grading log CSV is exported from it on demand.
+
+    ex.
+    .action/gradebook.py export gradebook.db grading_log.csv
+"""
+
+import csv
+import os
+import sqlite3
+import sys
+from logger import setup_logger
+
+CSV_FIELDS = [
+    'Repo Name', 'Part', 'Author', 'Partner1', 'Partner2', 'Partner3',
+    'PartnerN', 'Formatting', 'Linting', 'Build', 'Tests', 'UnitTests',
+    'Notes', 'UnitTestNotes',
+]
+
+# CSV column -> parts table column
+_PART_COLUMNS = {
+    'Author': 'author',
+    'Partner1': 'partner1',
+    'Partner2': 'partner2',
+    'Partner3': 'partner3',
+    'PartnerN': 'partner_n',
+    'Formatting': 'formatting',
+    'Linting': 'linting',
+    'Build': 'build',
+    'Tests': 'tests',
+    'UnitTests': 'unit_tests',
+    'Notes': 'notes',
+    'UnitTestNotes': 'unit_test_notes',
+}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS repos (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS parts (
+    id INTEGER PRIMARY KEY,
+    repo_id INTEGER NOT NULL REFERENCES repos(id) ON DELETE CASCADE,
+    part TEXT NOT NULL,
+    author TEXT, partner1 TEXT, partner2 TEXT, partner3 TEXT, partner_n TEXT,
+    formatting TEXT, linting TEXT, build TEXT, tests TEXT, unit_tests TEXT,
+    notes TEXT, unit_test_notes TEXT,
+    -- The lint_history push the part's lint_diagnostics belong to; NULL
+    -- when this grading did not run lint.
+    lint_push INTEGER,
+    graded_at TEXT NOT NULL DEFAULT (datetime('now')),
+    UNIQUE (repo_id, part)
+);
+CREATE TABLE IF NOT EXISTS stage_results (
+    part_id INTEGER NOT NULL REFERENCES parts(id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS stage_results_part ON stage_results(part_id);
+CREATE INDEX IF NOT EXISTS stage_results_stage ON stage_results(stage, passed);
+CREATE TABLE IF NOT EXISTS lint_warnings (
+    part_id INTEGER NOT NULL REFERENCES parts(id) ON DELETE CASCADE,
+    file TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lint_warnings_part ON lint_warnings(part_id);
+CREATE TABLE IF NOT EXISTS lint_diagnostics (
+    part_id INTEGER NOT NULL REFERENCES parts(id) ON DELETE CASCADE,
+    check_name TEXT NOT NULL,
+    file TEXT NOT NULL,
+    line INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lint_diagnostics_part ON lint_diagnostics(part_id);
+-- Per check counts of every push that ran lint, kept when the part is
+-- graded again. A push without diagnostics has one row with a NULL
+-- check_name; an empty one is a compiler error that names no check.
+CREATE TABLE IF NOT EXISTS lint_history (
+    repo_id INTEGER NOT NULL REFERENCES repos(id) ON DELETE CASCADE,
+    part TEXT NOT NULL,
+    push INTEGER NOT NULL,
+    check_name TEXT,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lint_history_repo ON lint_history(repo_id, part, push);
+CREATE TABLE IF NOT EXISTS unit_test_failures (
+    part_id INTEGER NOT NULL REFERENCES parts(id) ON DELETE CASCADE,
+    suite TEXT NOT NULL,
+    test TEXT NOT NULL,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS unit_test_failures_part ON unit_test_failures(part_id);
+CREATE TABLE IF NOT EXISTS unit_test_times (
+    part_id INTEGER NOT NULL REFERENCES parts(id) ON DELETE CASCADE,
+    suite TEXT NOT NULL,
+    test TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    passed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS unit_test_times_part ON unit_test_times(part_id);
+'''
+
+
+class Gradebook:
+    """A connection to the gradebook database. Safe to open from many
+    grader processes at once; writers wait on each other for up to
+    busy_timeout seconds."""
+
+    def __init__(self, path, busy_timeout=60):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=busy_timeout)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.executescript(_SCHEMA)
+        # Gradebooks made before parts had a lint_push column.
+        if 'lint_push' not in {column[1] for column in self.conn.execute('PRAGMA table_info(parts)')}:
+            self.conn.execute('ALTER TABLE parts ADD COLUMN lint_push INTEGER')
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def record_part(self, row, stages=(), lint_warnings=(), unit_test_failures=(), lint_diagnostics=(), unit_test_times=(), lint_ran=True):
+        """Replace the results for one repo part in a single transaction.
+        row is a dict keyed by CSV_FIELDS, stages is an iterable of
+        (stage, passed, detail), lint_warnings of (file, message),
+        unit_test_failures of (suite, test, message), lint_diagnostics
+        of (check, file, line) and unit_test_times of (suite, test,
+        seconds, passed). Other repos and parts are left untouched;
+        the per check counts are also added to the part's lint history
+        as a new push, unless lint_ran is false."""
+        columns = list(_PART_COLUMNS.values())
+        values = [_cell(row.get(key)) for key in _PART_COLUMNS]
+        # BEGIN IMMEDIATE takes the write lock up front so two graders
+        # never deadlock upgrading from a read lock.
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute(
+                'INSERT OR IGNORE INTO repos (name) VALUES (?)', (row['Repo Name'],)
+            )
+            repo_id = self.conn.execute(
+                'SELECT id FROM repos WHERE name = ?', (row['Repo Name'],)
+            ).fetchone()[0]
+            self.conn.execute(
+                'DELETE FROM parts WHERE repo_id = ? AND part = ?',
+                (repo_id, row['Part']),
+            )
+            push = None
+            if lint_ran:
+                push = self.conn.execute(
+                    'SELECT COALESCE(MAX(push), 0) + 1 FROM lint_history WHERE repo_id = ? AND part = ?',
+                    (repo_id, row['Part']),
+                ).fetchone()[0]
+            cursor = self.conn.execute(
+                'INSERT INTO parts (repo_id, part, lint_push, {}) VALUES (?, ?, ?, {})'.format(
+                    ', '.join(columns), ', '.join('?' * len(columns))
+                ),
+                [repo_id, row['Part'], push] + values,
+            )
+            part_id = cursor.lastrowid
+            self.conn.executemany(
+                'INSERT INTO stage_results VALUES (?, ?, ?, ?)',
+                [(part_id, stage, int(bool(passed)), detail) for stage, passed, detail in stages],
+            )
+            self.conn.executemany(
+                'INSERT INTO lint_warnings VALUES (?, ?, ?)',
+                [(part_id, file, message) for file, message in lint_warnings],
+            )
+            self.conn.executemany(
+                'INSERT INTO lint_diagnostics VALUES (?, ?, ?, ?)',
+                [(part_id, check, file, line) for check, file, line in lint_diagnostics],
+            )
+            if lint_ran:
+                counts = {}
+                for check, _, _ in lint_diagnostics:
+                    counts[check] = counts.get(check, 0) + 1
+                if not counts:
+                    counts[None] = 0
+                self.conn.executemany(
+                    'INSERT INTO lint_history VALUES (?, ?, ?, ?, ?)',
+                    [(repo_id, row['Part'], push, check, count) for check, count in counts.items()],
+                )
+            self.conn.executemany(
+                'INSERT INTO unit_test_failures VALUES (?, ?, ?, ?)',
+                [(part_id, suite, test, message) for suite, test, message in unit_test_failures],
+            )
+            self.conn.executemany(
+                'INSERT INTO unit_test_times VALUES (?, ?, ?, ?, ?)',
+                [(part_id, suite, test, seconds, int(bool(passed))) for suite, test, seconds, passed in unit_test_times],
+            )
+        return part_id
+
+    def rows(self, repo_pattern=None):
+        """Yield dicts keyed by CSV_FIELDS ordered by repo and part.
+        repo_pattern is an optional SQL LIKE pattern on the repo name."""
+        query = 'SELECT repos.name, parts.part, {} FROM parts JOIN repos ON repos.id = parts.repo_id'.format(
+            ', '.join('parts.' + column for column in _PART_COLUMNS.values())
+        )
+        params = ()
+        if repo_pattern:
+            query += ' WHERE repos.name LIKE ?'
+            params = (repo_pattern,)
+        query += ' ORDER BY repos.name, parts.part'
+        for record in self.conn.execute(query, params):
+            yield dict(zip(CSV_FIELDS, record))
+
+    def export_csv(self, file_handle, repo_pattern=None):
+        """Write the grading log CSV with the same columns the per-part
+        CSV files used."""
+        outcsv = csv.DictWriter(file_handle, CSV_FIELDS)
+        outcsv.writeheader()
+        count = 0
+        for row in self.rows(repo_pattern):
+            outcsv.writerow(row)
+            count += 1
+        return count
+
+
+def _cell(value):
+    return None if value is None else str(value)
+
+
+def open_gradebook():
+    """Open the gradebook named by the MS_GRADEBOOK environment variable
+    or return None when it is not set."""
+    path = os.environ.get('MS_GRADEBOOK')
+    if not path:
+        return None
+    return Gradebook(path)
+
+
+def main():
+    """Main function; export the gradebook to a CSV file."""
+    logger = setup_logger()
+    if len(sys.argv) < 4 or sys.argv[1] != 'export':
+        logger.error('usage: gradebook.py export gradebook.db grading_log.csv [repo LIKE pattern]')
+        sys.exit(1)
+    repo_pattern = sys.argv[4] if len(sys.argv) > 4 else None
+    with Gradebook(sys.argv[2]) as gradebook:
+        with open(sys.argv[3], 'w', newline='') as file_handle:
+            count = gradebook.export_csv(file_handle, repo_pattern)
+    logger.info('Exported %d rows to %s', count, sys.argv[3])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Long running grading daemon for the self-hosted runner. The daemon
+    imports the grader once, probes the tools once and then forks a warm
+    child for every job it receives over a local UNIX socket, so a push
+    no longer pays interpreter and import startup for each part.
+
+    Jobs are sent by grading_client.py along with the client's stdout
+    and stderr. Each child runs with the job's working directory and
+    MS_* environment, writes its output straight to the client's stdout
+    and stderr, and replies over the socket with one line holding
+    EXIT_MARKER and the exit status. A job from a repository whose .action differs from the
+    daemon's is answered with FALLBACK_MARKER and graded by the client.
+
+    ex.
+    .action/grading_daemon.py
+    .action/grading_daemon.py --socket /run/user/1000/grader.sock
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+from grading_client import EXIT_MARKER, FALLBACK_MARKER, action_digest, default_socket_path
+from logger import restart_listener, setup_logger, stop_listener
+
+TOOLS = ('clang++', 'clang-format', 'clang-tidy', 'make')
+
+
+def probe_tools():
+    """Run each tool's --version once so the daemon logs what it grades
+    with and the children inherit a warm page cache for the binaries."""
+    versions = {}
+    for tool in TOOLS:
+        try:
+            proc = subprocess.run(
+                [tool, '--version'], capture_output=True, timeout=10, check=False, text=True
+            )
+            versions[tool] = proc.stdout.split('\n')[0]
+        except (FileNotFoundError, subprocess.TimeoutExpired):
+            versions[tool] = None
+    return versions
+
+
+def warm_up():
+    """Import everything a job needs; parse_header compiles its regexes
+    on import."""
+    import csv
+    import json
+    import pexpect
+    import gradebook
+    import roster
+    import parse_header
+    import solution_check
+    return solution_check
+
+
+class GradingHandler(socketserver.StreamRequestHandler):
+    """Run one job. The server forks before calling handle(), so changing
+    the directory, environment and file descriptors is safe here."""
+
+    def handle(self):
+        restart_listener()
+        # The job's JSON arrives with the client's stdout and stderr.
+        request, fds, _, _ = socket.recv_fds(self.connection, 65536, 2)
+        while request and not request.endswith(b'\n'):
+            chunk = self.connection.recv(65536)
+            if not chunk:
+                break
+            request += chunk
+        job = json.loads(request) if request.endswith(b'\n') else {}
+        if len(fds) != 2 or job.get('action_digest') != self.server.action_digest:
+            # The repository carries a different grader; the client
+            # grades with its own copy.
+            for fd in fds:
+                os.close(fd)
+            self.wfile.write(FALLBACK_MARKER + b'\n')
+            return
+        os.chdir(job['cwd'])
+        for key, value in job.get('env', {}).items():
+            os.environ[key] = value
+        # The child's stdout and stderr, and those of subprocesses like
+        # make, become the client's.
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in fds:
+            os.close(fd)
+        status = 0
+        try:
+            from buildengine import job_slot
+            with job_slot():
+                self.server.solution_check.check_part(
+                    job['part'], job['target_directory'], job['program_name']
+                )
+        except SystemExit as exception:
+            # sys.exit('message') exits with status 1.
+            status = exception.code if isinstance(exception.code, int) else int(exception.code is not None)
+        except Exception as exception:
+            setup_logger().exception('Grading failed: %s', exception)
+            status = 1
+        # Let the log listener drain before reporting the status.
+        stop_listener()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.wfile.write(EXIT_MARKER + f' {status}\n'.encode('utf-8'))
+
+
+class GradingServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Fork a warm child per job."""
+
+    # Limit concurrent jobs; extra clients wait in the listen backlog.
+    max_children = os.cpu_count() or 4
+
+
+def main():
+    """Main function; warm up and serve jobs until interrupted."""
+    logger = setup_logger()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', default=default_socket_path(create=True))
+    args = parser.parse_args()
+    if not args.socket:
+        logger.error('❌ The socket directory is not private to this user; pass --socket')
+        sys.exit(1)
+    for tool, version in probe_tools().items():
+        logger.info('%s: %s', tool, version or 'not found')
+    solution_check = warm_up()
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    old_umask = os.umask(0o077)
+    server = GradingServer(args.socket, GradingHandler)
+    os.umask(old_umask)
+    server.solution_check = solution_check
+    server.action_digest = action_digest()
+    logger.info('Grading daemon listening on %s', args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
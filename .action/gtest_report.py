@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Streaming parser for googletest's JSON output (test_detail.json).
+    The file is read in chunks and each test is decoded on its own and
+    handed out as a results.UnitTestCase, so only one test's JSON is held
+    at a time however large the report is.
+
+    ex.
+    .action/gtest_report.py part-1/test_detail.json
+"""
+
+import json
+import sys
+from logger import setup_logger
+from results import UnitTestCase, UnitTestReport
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _Reader:
+    """JSON values read one at a time from a text file handle."""
+
+    def __init__(self, file_handle, chunk_size):
+        self.file_handle = file_handle
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.file_handle.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """The next character that is not white space, or '' at the end."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                return ''
+
+    def expect(self, characters):
+        """Consume and return the next character, which is one of
+        characters."""
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f'expected one of {characters!r} in googletest JSON, found {character!r}')
+        self.position += 1
+        return character
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk.
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.position = end
+            return value
+
+    def members(self):
+        """Yield the keys of the object that starts here, leaving the
+        reader at each key's value; the caller consumes the value."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def elements(self):
+        """Yield once per element of the array that starts here, leaving
+        the reader at the element; the caller consumes it."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield
+            if self.expect(',]') == ']':
+                return
+
+
+def test_seconds(test):
+    """A test's time from its JSON entry, e.g. "0.003s"."""
+    try:
+        return float(str(test.get('time', '0')).rstrip('s'))
+    except ValueError:
+        return 0.0
+
+
+def _test_case(suite, test):
+    return UnitTestCase(
+        suite, test.get('name', ''), test.get('status', 'RUN'), test_seconds(test),
+        tuple(failure.get('failure', '') for failure in test.get('failures', ())),
+    )
+
+
+class GtestReportParser:
+    """Iterate over a googletest JSON report's tests as UnitTestCase
+    objects. The report's top level numbers, e.g. tests and failures, are
+    in totals once iteration finishes."""
+
+    def __init__(self, file_handle, chunk_size=65536):
+        self.reader = _Reader(file_handle, chunk_size)
+        self.totals = {}
+
+    def __iter__(self):
+        reader = self.reader
+        for key in reader.members():
+            if key != 'testsuites':
+                self.totals[key] = reader.value()
+                continue
+            for _ in reader.elements():
+                suite = None
+                pending = []
+                for suite_key in reader.members():
+                    if suite_key == 'name':
+                        suite = reader.value()
+                        # Tests read before the suite's name was known.
+                        for test in pending:
+                            yield _test_case(suite, test)
+                        pending = []
+                    elif suite_key == 'testsuite':
+                        for _ in reader.elements():
+                            test = reader.value()
+                            if suite is None:
+                                pending.append(test)
+                            else:
+                                yield _test_case(suite, test)
+                    else:
+                        reader.value()
+                for test in pending:
+                    yield _test_case(test.get('classname', ''), test)
+
+
+def read_report(path, chunk_size=65536):
+    """The UnitTestReport for a googletest JSON file. Totals missing from
+    the file are counted from its tests. The file is parsed as a stream
+    but the report keeps every case in a list; iterate a
+    GtestReportParser to handle one test at a time instead."""
+    with open(path) as file_handle:
+        parser = GtestReportParser(file_handle, chunk_size)
+        cases = list(parser)
+    tests = parser.totals.get('tests', len(cases))
+    failures = parser.totals.get('failures', sum(1 for case in cases if not case.passed))
+    return UnitTestReport(tests, failures, cases)
+
+
+def main():
+    """Main function; summarize a googletest JSON report."""
+    logger = setup_logger()
+    if len(sys.argv) != 2:
+        logger.error('usage: gtest_report.py test_detail.json')
+        return 1
+    report = read_report(sys.argv[1])
+    for case in report.cases:
+        mark = '✅' if case.passed else '❌'
+        logger.info('%s %s.%s %.3f s', mark, case.suite, case.name, case.seconds)
+    logger.info('%d/%d unit tests passed', report.passed, report.tests)
+    return 1 if report.failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Sharded googletest runner. The part's unittest binary is built with
+    `make unittest` and then run as several shards at once through
+    GTEST_TOTAL_SHARDS and GTEST_SHARD_INDEX, each with a timeout. A
+    shard that times out or crashes has its tests run one at a time, so
+    a hanging test costs only itself. The shards' JSON reports are merged
+    into the one file `make unittest` would have written, with the same
+    layout and every test's time.
+
+    ex.
+    .action/gtest_runner.py part-1 --shards 4 --timeout 10
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from gtest_report import test_seconds
+from logger import setup_logger
+
+UNITTEST = 'unittest'
+SHARD_TIMEOUT = 30
+TEST_TIMEOUT = 10
+BUILD_TIMEOUT = 120
+
+
+def build_unittest(target_dir, always_clean=True):
+    """Build the unittest binary with `make unittest`, or as a unity
+    build with MS_BUILD_ENGINE=unity. GTEST_FILTER is set to match no
+    test so the run in the Makefile's recipe is empty."""
+    from assessment import make_spotless
+    from buildengine import compile_slot, unity_enabled, unity_unittest
+    from capture import run_bounded
+    logger = setup_logger()
+    if always_clean and not make_spotless(target_dir):
+        return False
+    if unity_enabled():
+        # What the Makefile's cleanunittest removes; the unity build
+        # replaces or removes the binary itself.
+        shutil.rmtree(os.path.join(target_dir, 'unittest.dSYM'), ignore_errors=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(target_dir, 'test_detail.json'))
+        if unity_unittest(target_dir):
+            return True
+    cmd = f'make -C {target_dir} unittest GTEST_OUTPUT_FORMAT=json GTEST_OUTPUT_FILE={os.devnull}'
+    logger.debug(cmd)
+    try:
+        with compile_slot():
+            proc = run_bounded([cmd], timeout=BUILD_TIMEOUT, env=dict(os.environ, GTEST_FILTER='-*'))
+    except subprocess.TimeoutExpired:
+        logger.error('❌ Building the unit tests took more than %d seconds', BUILD_TIMEOUT)
+        return False
+    if proc.stderr:
+        logger.info('stderr: %s', str(proc.stderr).rstrip("\n\r"))
+    return proc.returncode == 0 and os.path.exists(os.path.join(target_dir, UNITTEST))
+
+
+def parse_test_list(text):
+    """Suite.Test names, in order, from --gtest_list_tests output."""
+    names = []
+    suite = None
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if line[0] != ' ':
+            suite = line.split('#')[0].strip()
+        elif suite:
+            names.append(suite + line.split('#')[0].strip())
+    return names
+
+
+def list_tests(target_dir):
+    """The tests in target_dir's unittest binary, or None when listing
+    them timed out."""
+    from capture import run_bounded
+    try:
+        proc = run_bounded([os.path.join('.', UNITTEST), '--gtest_list_tests'], TEST_TIMEOUT, shell=False, cwd=target_dir)
+    except subprocess.TimeoutExpired:
+        setup_logger().error('❌ Listing the unit tests took more than %g seconds', TEST_TIMEOUT)
+        return None
+    return parse_test_list(proc.stdout)
+
+
+def shard_tests(tests, total, index):
+    """The tests googletest runs in shard index of total: runnable tests
+    are dealt out in order, disabled ones do not count."""
+    runnable = [test for test in tests if not any(part.startswith('DISABLED_') for part in test.split('.'))]
+    return [test for number, test in enumerate(runnable) if number % total == index]
+
+
+def _run(target_dir, output, timeout, env=None, gtest_filter=None):
+    """Run the unittest binary writing JSON to output. Returns None when
+    the report was written, otherwise why it was not."""
+    from capture import run_bounded
+    cmd = [os.path.join('.', UNITTEST), f'--gtest_output=json:{output}']
+    if gtest_filter:
+        cmd.append(f'--gtest_filter={gtest_filter}')
+    try:
+        proc = run_bounded(cmd, timeout, shell=False, cwd=target_dir, env=env)
+    except subprocess.TimeoutExpired:
+        return f'Timed out after {timeout:g} seconds'
+    if not os.path.exists(output):
+        return f'Crashed with exit status {proc.returncode}'
+    return None
+
+
+def _load(path):
+    with open(path) as file_handle:
+        return json.load(file_handle)
+
+
+def _failed_test(test, reason, seconds):
+    suite, name = test.split('.', 1)
+    return {
+        'name': name, 'status': 'RUN', 'result': 'COMPLETED', 'time': f'{seconds:g}s',
+        'classname': suite, 'failures': [{'failure': reason, 'type': ''}],
+    }
+
+
+def merge_reports(reports, tests, broken=()):
+    """One googletest JSON report from the shards' reports. broken is a
+    list of (test, reason, seconds) for tests that wrote no report; they
+    are reported as failed. Tests appear in the order of tests and a
+    test reported by more than one shard, as disabled tests are, once."""
+    order = {test: number for number, test in enumerate(tests)}
+    entries = {}
+    for report in reports:
+        for suite in report.get('testsuites', []):
+            for test in suite.get('testsuite', []):
+                key = f"{suite['name']}.{test['name']}"
+                if key not in entries or entries[key].get('status') != 'RUN':
+                    entries[key] = test
+    for test, reason, seconds in broken:
+        entries[test] = _failed_test(test, reason, seconds)
+    suites = {}
+    for key in sorted(entries, key=lambda key: order.get(key, len(order))):
+        suites.setdefault(key.split('.', 1)[0], []).append(entries[key])
+
+    def totals(tests):
+        return {
+            'tests': len(tests),
+            'failures': sum(1 for test in tests if test.get('failures')),
+            'disabled': sum(1 for test in tests if test.get('status') == 'NOTRUN'),
+            'errors': 0,
+            'time': '{:g}s'.format(sum(test_seconds(test) for test in tests)),
+        }
+
+    merged = dict(totals(list(entries.values())), name='AllTests', testsuites=[])
+    for name, suite_tests in suites.items():
+        merged['testsuites'].append(dict(totals(suite_tests), name=name, testsuite=suite_tests))
+    return merged
+
+
+def run_sharded(target_dir, output_file='test_detail.json', shards=None, timeout=SHARD_TIMEOUT, test_timeout=TEST_TIMEOUT):
+    """Run target_dir's unittest binary as shards in parallel and write
+    the merged report to output_file in target_dir. Returns the report,
+    or None when the tests cannot be listed. Shards and retries draw
+    from the buildengine job budget like compiles do."""
+    from buildengine import run_all
+    logger = setup_logger()
+    tests = list_tests(target_dir)
+    if tests is None:
+        return None
+    if not tests:
+        logger.error('❌ No unit tests found in %s', target_dir)
+        return None
+    shards = max(1, min(shards or os.cpu_count() or 1, len(tests)))
+    workdir = tempfile.mkdtemp(prefix='gtest_shards_')
+    try:
+        def run_shard(index):
+            env = dict(os.environ, GTEST_TOTAL_SHARDS=str(shards), GTEST_SHARD_INDEX=str(index))
+            output = os.path.join(workdir, f'shard-{index}.json')
+            return index, output, _run(target_dir, output, timeout, env)
+
+        def run_alone(number, test):
+            output = os.path.join(workdir, f'test-{number}.json')
+            return test, output, _run(target_dir, output, test_timeout, gtest_filter=test)
+
+        reports = []
+        retry = []
+        ran = run_all(range(shards), run_shard)
+        for index, output, problem in (ran[index] for index in range(shards)):
+            if problem:
+                logger.warning('Unit test shard %d/%d: %s; running its tests one at a time', index + 1, shards, problem)
+                retry.extend(shard_tests(tests, shards, index))
+            else:
+                reports.append(_load(output))
+        broken = []
+        ran = run_all(enumerate(retry), lambda args: run_alone(*args))
+        for test, output, problem in (ran[args] for args in enumerate(retry)):
+            if problem:
+                logger.error('❌ %s: %s', test, problem)
+                broken.append((test, problem, test_timeout if problem.startswith('Timed out') else 0.0))
+            else:
+                reports.append(_load(output))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    merged = merge_reports(reports, tests, broken)
+    with open(os.path.join(target_dir, output_file), 'w') as file_handle:
+        json.dump(merged, file_handle, indent=2)
+    return merged
+
+
+def run_unittest(target_dir, always_clean=True, output_file='test_detail.json', shards=None, timeout=SHARD_TIMEOUT):
+    """Sharded counterpart of assessment.make_unittest(): build, then run
+    the tests in shards. Returns True when a report was written. A
+    report left by an earlier run is removed first, so it is never
+    graded as this run's."""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(os.path.join(target_dir, output_file))
+    if not build_unittest(target_dir, always_clean):
+        return False
+    return run_sharded(target_dir, output_file, shards, timeout) is not None
+
+
+def main():
+    """Main function; run a part's unit tests in shards."""
+    logger = setup_logger()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('target_dir')
+    parser.add_argument('--shards', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=SHARD_TIMEOUT)
+    parser.add_argument('--no-clean', action='store_true')
+    args = parser.parse_args()
+    if not build_unittest(args.target_dir, not args.no_clean):
+        logger.error('❌ Unit tests did not build')
+        return 1
+    report = run_sharded(args.target_dir, shards=args.shards, timeout=args.timeout)
+    if report is None:
+        return 1
+    for suite in report['testsuites']:
+        for test in suite['testsuite']:
+            mark = '❌' if test.get('failures') else '✅'
+            logger.info('%s %s.%s %.3f s', mark, suite['name'], test['name'], test_seconds(test))
+    logger.info('%d/%d unit tests passed', report['tests'] - report['failures'], report['tests'])
+    return 1 if report['failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -42,7 +42,7 @@
 import sys
 import logging
 from logger import setup_logger
-from parse_header import dict_header
+from parse_header import validate_headers
 
 def header_check(file):
     """ Check file's header if it conforms to the standard given \
@@ -63,19 +63,8 @@ def header_check(file):
     #//
 
     # return true if header is good
-    keys = ['name', 'class', 'email', 'github', 'asgt', 'partners', 'comment']
-    with open(file) as file_handle:
-        contents = file_handle.read()
-    header = dict_header(contents, silent=True)
-    status = True
-    if header:
-        for k in keys:
-            if not k in header.keys():
-                logging.warning('%s: missing %s', file, k)
-                status = False
-    else:
-        status = False
-    return status
+    _, header = next(validate_headers([file]))
+    return _has_all_keys(file, header)
 
 
 def get_header_and_check(file):
@@ -97,10 +86,13 @@ def get_header_and_check(file):
     #//
 
     # return true if header is good
+    _, header = next(validate_headers([file], silent=False))
+    return (_has_all_keys(file, header), header)
+
+
+def _has_all_keys(file, header):
+    """ True when header was parsed and has every field. """
     keys = ['name', 'class', 'email', 'github', 'asgt', 'partners', 'comment']
-    with open(file) as file_handle:
-        contents = file_handle.read()
-    header = dict_header(contents)
     status = True
     if header:
         for k in keys:
@@ -109,7 +101,15 @@ def get_header_and_check(file):
                 status = False
     else:
         status = False
-    return (status, header)
+    return status
+
+
+def _announce(files):
+    """ Yield files, logging each one before its header is checked. """
+    logger = setup_logger()
+    for in_file in files:
+        logger.info('Check header for file: %s', in_file)
+        yield in_file
 
 def main():
     """ Main function; process each file given through get_header_and_check. """
@@ -117,9 +117,9 @@ def main():
     status = 0
     if len(sys.argv) < 2:
         logger.warning('Only %s arguments provided.', len(sys.argv))
-    for in_file in sys.argv[1:]:
-        logger.info('Check header for file: %s', in_file)
-        has_header, header_d = get_header_and_check(in_file)
+    # Stream every file through one parser.
+    for in_file, header_d in validate_headers(_announce(sys.argv[1:]), silent=False):
+        has_header = _has_all_keys(in_file, header_d)
         if not has_header:
             logger.warning('Header is malformed or missing.')
             logger.warning('Could not find a header in the file.')
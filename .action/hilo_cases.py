@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Exhaustive game space test for part-2. Every secret from 1 to 10 is
+    paired with every opening of depth guesses, the rest of each game is
+    filled in with seeded random guesses, and each game is played once
+    as typed and once with out of range guesses that make the program
+    ask again. The expected transcript comes from GameState, a model of
+    part-2/hilo.h, and the cases run through a bounded pool of worker
+    processes with the secret as argv[1].
+
+    Non-numeric input is not generated: main.cc clears the stream but
+    never discards the bad token, so it would prompt forever.
+
+    ex.
+    .action/hilo_cases.py part-2/hilo --depth 2 --jobs 8
+"""
+
+import argparse
+import itertools
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Tuple
+from logger import setup_logger
+
+SECRETS = range(1, 11)
+GUESSES = range(1, 11)
+INVALID_GUESSES = (0, 11, -1, 100)
+PROMPT = 'Enter a guess 1-10: '
+CASE_TIMEOUT = 1
+
+
+class GameState:
+    """The reference GameState from part-2/hilo.h."""
+
+    def __init__(self, secret):
+        self.secret = secret
+        self.guesses_left = 4
+
+    def guess_correct(self, guess):
+        return guess == self.secret
+
+    def guess_too_big(self, guess):
+        return guess > self.secret
+
+    def guess_too_small(self, guess):
+        return guess < self.secret
+
+    def count_guess(self):
+        self.guesses_left -= 1
+
+    def game_over(self):
+        return self.guesses_left == 0
+
+
+def transcript(secret, inputs):
+    """What part-2's main.cc prints for secret when inputs are typed,
+    without the echo of the input. Inputs left over when the game ends
+    are not read."""
+    game = GameState(secret)
+    inputs = iter(inputs)
+    output = []
+    won = False
+    while not game.game_over():
+        output.append(f'You have {game.guesses_left} guesses left.\n')
+        while True:
+            output.append(PROMPT)
+            guess = next(inputs)
+            if 1 <= guess <= 10:
+                break
+        game.count_guess()
+        if game.guess_correct(guess):
+            won = True
+            break
+        if game.guess_too_big(guess):
+            output.append('Too big!\n')
+        if game.guess_too_small(guess):
+            output.append('Too small!\n')
+    output.append('You won!\n' if won else 'You lost!\n')
+    return ''.join(output)
+
+
+@dataclass(frozen=True)
+class Case:
+    """One game: the secret, what is typed and the expected output."""
+    secret: int
+    inputs: Tuple[int, ...]
+    expected: str
+
+
+def _play(guesses, secret):
+    """guesses cut short where the game ends."""
+    played = []
+    for guess in guesses:
+        played.append(guess)
+        if guess == secret or len(played) == 4:
+            break
+    return played
+
+
+def generate_cases(depth=2, seed=120):
+    """Cases for every secret and every opening of depth guesses; each
+    game is also played with an invalid guess before some of its
+    guesses. Games that end within the opening are generated once."""
+    rng = random.Random(seed)
+    cases = []
+    seen = set()
+    for secret in SECRETS:
+        for opening in itertools.product(GUESSES, repeat=depth):
+            guesses = _play(list(opening) + [rng.choice(GUESSES) for _ in range(4 - depth)], secret)
+            if (secret, tuple(guesses)) in seen:
+                continue
+            seen.add((secret, tuple(guesses)))
+            retyped = []
+            for guess in guesses:
+                if rng.random() < 0.5:
+                    retyped.extend(rng.sample(INVALID_GUESSES, rng.randint(1, 2)))
+                retyped.append(guess)
+            for inputs in (tuple(guesses), tuple(retyped)):
+                cases.append(Case(secret, inputs, transcript(secret, inputs)))
+    return cases
+
+
+def normalize(text):
+    """Compare transcripts the way p2_regex does: case and the amount of
+    white space do not matter."""
+    return ' '.join(text.split()).casefold()
+
+
+def run_case(binary, case, timeout=CASE_TIMEOUT):
+    """(passed, output) for one case."""
+    from capture import run_bounded
+    stdin = ''.join(f'{value}\n' for value in case.inputs)
+    try:
+        proc = run_bounded([binary, str(case.secret)], timeout, shell=False, input=stdin)
+    except subprocess.TimeoutExpired as exception:
+        output = exception.output or b''
+        return False, output.decode('utf-8', 'replace') if isinstance(output, bytes) else output
+    passed = proc.returncode == 0 and normalize(proc.stdout) == normalize(case.expected)
+    return passed, proc.stdout
+
+
+def _run_chunk(binary, cases):
+    return [run_case(binary, case)[0] for case in cases]
+
+
+def run_cases(binary, cases, jobs=None, chunk_size=32):
+    """Run cases with at most jobs worker processes and 2 * jobs chunks
+    of chunk_size cases in flight. Returns a list of bools in the order
+    of cases."""
+    jobs = jobs or os.cpu_count() or 1
+    binary = os.path.abspath(binary)
+    chunks = [cases[start:start + chunk_size] for start in range(0, len(cases), chunk_size)]
+    results = [None] * len(chunks)
+    pending = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for index, chunk in enumerate(chunks):
+            if len(pending) >= 2 * jobs:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+            pending[pool.submit(_run_chunk, binary, chunk)] = index
+        for future in pending:
+            results[pending[future]] = future.result()
+    return [passed for chunk in results for passed in chunk]
+
+
+def main():
+    """Main function; play every generated game against a part-2 program."""
+    logger = setup_logger()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('binary')
+    parser.add_argument('--depth', type=int, default=2, choices=(1, 2, 3, 4))
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=120)
+    parser.add_argument('--show', type=int, default=3, help='failing cases to show')
+    args = parser.parse_args()
+    cases = generate_cases(args.depth, args.seed)
+    logger.info('Running %d cases', len(cases))
+    start = time.perf_counter()
+    statuses = run_cases(args.binary, cases, args.jobs)
+    seconds = time.perf_counter() - start
+    failed = [case for case, passed in zip(cases, statuses) if not passed]
+    for case in failed[:args.show]:
+        _, output = run_case(os.path.abspath(args.binary), case)
+        logger.error('❌ secret %d, input %s', case.secret, ' '.join(map(str, case.inputs)))
+        logger.error('Expected: "%s"', case.expected)
+        logger.error('Your output: "%s"', output)
+    passed = len(cases) - len(failed)
+    logger.info(
+        '%s %d/%d cases passed (%.1f%%) in %.1f s, %.0f cases/s',
+        '✅' if not failed else '❌', passed, len(cases), 100 * passed / len(cases),
+        seconds, len(cases) / seconds,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Lint a part's files once per translation unit. The .cc files are
+    linted with a header filter so diagnostics in the part's own headers
+    come back with them; the clang-tidy output is parsed into
+    Diagnostic records, duplicates reported by several translation units
+    are dropped and each diagnostic is attributed to the file it is in.
+    A header is only linted on its own when no linted .cc includes it. """
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from ccsrcutilities import lint_check
+from logger import setup_logger
+
+DIAGNOSTIC_RE = re.compile(
+    r'^(?P<file>.+?):(?P<line>\d+):(?P<column>\d+): '
+    r'(?P<severity>warning|error|note|remark): (?P<message>.*?)(?: \[(?P<check>[^\[\]]+)\])?$'
+)
+
+
+@dataclass(frozen=True)
+class Diagnostic:
+    """One clang-tidy diagnostic. Two translation units reporting the same
+    problem give equal records; text is what clang-tidy printed for it,
+    the excerpt and notes included, and is not compared."""
+    file: str
+    line: int
+    column: int
+    severity: str
+    check: str
+    message: str
+    text: Tuple[str, ...] = field(default=(), compare=False)
+
+
+@dataclass
+class LintReport:
+    """Diagnostics for a set of files. warnings holds each file's
+    diagnostic text lines, as lint_check() returns them for one file."""
+    warnings: Dict[str, List[str]] = field(default_factory=dict)
+    diagnostics: List[Tuple[str, Diagnostic]] = field(default_factory=list)
+    seconds: Dict[str, float] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+
+
+def parse_tidy_output(lines, translation_unit):
+    """Parse clang-tidy's output lines into Diagnostic records. Notes and
+    source excerpts stay with the diagnostic before them; lines before
+    the first diagnostic are kept as one attributed to
+    translation_unit."""
+    diagnostics = []
+    head = None
+    text = []
+
+    def flush():
+        if head is not None:
+            diagnostics.append(Diagnostic(
+                file=os.path.realpath(head.group('file')),
+                line=int(head.group('line')),
+                column=int(head.group('column')),
+                severity=head.group('severity'),
+                check=head.group('check') or '',
+                message=head.group('message'),
+                text=tuple(text),
+            ))
+        elif text:
+            diagnostics.append(Diagnostic(
+                os.path.realpath(translation_unit), 0, 0, 'error', '', text[0], tuple(text)
+            ))
+
+    for line in lines:
+        match = DIAGNOSTIC_RE.match(line)
+        if match and match.group('severity') != 'note':
+            flush()
+            head = match
+            text = []
+        text.append(line)
+    flush()
+    return diagnostics
+
+
+def included_files(source, index=None):
+    """Real paths of the files source includes with a path relative to
+    its own directory, taken from index, a srcindex.SourceIndex holding
+    source, or the kept index of source's directory."""
+    from srcindex import source_index
+    directory = os.path.dirname(source) or '.'
+    entry = (index or source_index(directory)).entry(source)
+    if entry is None:
+        return set()
+    return {os.path.realpath(os.path.join(directory, name)) for name in entry.includes}
+
+
+def lint_files(files, tidy_options=None, skip_compile_cmd=False, index=None):
+    """Lint files and return a LintReport with an entry for every file.
+    index is the grading run's srcindex.SourceIndex, if it has one."""
+    import time
+    logger = setup_logger()
+    owners = {os.path.realpath(file): file for file in files}
+    sources = [file for file in files if file.endswith('.cc')]
+    headers = [file for file in files if not file.endswith('.cc')]
+    header_filter = None
+    if headers:
+        names = '|'.join(re.escape(os.path.basename(header)) for header in headers)
+        header_filter = f'(^|/)({names})$'
+    report = LintReport(
+        warnings={file: [] for file in files},
+        seconds={file: 0.0 for file in files},
+    )
+    seen = {}
+    covered = set()
+
+    def collect(file, **options):
+        start = time.perf_counter()
+        output = lint_check(file, tidy_options, skip_compile_cmd, **options)
+        report.seconds[file] += time.perf_counter() - start
+        for diagnostic in parse_tidy_output(output, file):
+            # Diagnostics in files that are not graded, such as errors in
+            # a system header, belong to the translation unit.
+            seen.setdefault(diagnostic, owners.get(diagnostic.file, file))
+
+    for source in sources:
+        collect(source, header_filter=header_filter)
+        covered.update(included_files(source, index))
+    for header in headers:
+        if os.path.realpath(header) in covered:
+            logger.debug('Skipping %s; its includers covered it.', header)
+            report.skipped.append(header)
+            continue
+        collect(header)
+    for diagnostic, owner in seen.items():
+        report.diagnostics.append((owner, diagnostic))
+        report.warnings[owner].extend(diagnostic.text)
+    return report
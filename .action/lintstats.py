@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Class wide lint analytics. Diagnostics are held column by column in
+    arrays of interned ids, so a cohort's worth of them is a few bytes
+    each, and the queries count whole columns at once: the most frequent
+    checks, diagnostics per student and each check's count per push.
+    The store is loaded from the gradebook and the summaries can be
+    written back to it.
+
+    ex.
+    .action/lintstats.py report gradebook.db
+    .action/lintstats.py export gradebook.db
+"""
+
+import sys
+from array import array
+from collections import Counter
+from itertools import compress
+from logger import setup_logger
+
+
+class _Interner:
+    """Map strings to small integer ids and back."""
+
+    __slots__ = ('names', 'ids')
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def id(self, name):
+        number = self.ids.get(name)
+        if number is None:
+            number = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return number
+
+
+class LintStore:
+    """Lint diagnostics as parallel columns: check, file, line, repo, part
+    and push. push numbers a repo part's gradings from 1; diagnostics of
+    one grading share it."""
+
+    __slots__ = ('checks', 'files', 'repos', 'parts',
+                 'check', 'file', 'line', 'repo', 'part', 'push')
+
+    def __init__(self):
+        self.checks = _Interner()
+        self.files = _Interner()
+        self.repos = _Interner()
+        self.parts = _Interner()
+        self.check = array('I')
+        self.file = array('I')
+        self.line = array('I')
+        self.repo = array('I')
+        self.part = array('I')
+        self.push = array('I')
+
+    def __len__(self):
+        return len(self.check)
+
+    def add(self, check, file, line, repo, part, push=1):
+        """Append one diagnostic."""
+        self.check.append(self.checks.id(check))
+        self.file.append(self.files.id(file))
+        self.line.append(line)
+        self.repo.append(self.repos.id(repo))
+        self.part.append(self.parts.id(part))
+        self.push.append(push)
+
+    def add_result(self, result, push=1):
+        """Append the diagnostics of a results.GradeResult."""
+        for check, file, line in result.lint_diagnostics:
+            self.add(check, file, line, result.repo, result.part, push)
+
+    def _selector(self, part):
+        if part is None:
+            return None
+        wanted = self.parts.ids.get(part)
+        return bytes(number == wanted for number in self.part)
+
+    def _column(self, column, part):
+        selector = self._selector(part)
+        return column if selector is None else compress(column, selector)
+
+    def top_checks(self, count=10, part=None):
+        """The count most frequent checks as (check, diagnostics)."""
+        counts = Counter(self._column(self.check, part))
+        return [(self.checks.names[check], total) for check, total in counts.most_common(count)]
+
+    def per_repo(self, part=None):
+        """Diagnostics per repo, i.e. per student, as {repo: count}."""
+        counts = Counter(self._column(self.repo, part))
+        return {self.repos.names[repo]: total for repo, total in counts.items()}
+
+    def repos_per_check(self, part=None):
+        """How many repos have each check, as {check: repos}."""
+        pairs = set(zip(self._column(self.check, part), self._column(self.repo, part)))
+        counts = Counter(check for check, _ in pairs)
+        return {self.checks.names[check]: total for check, total in counts.items()}
+
+    def trends(self, checks=None, part=None):
+        """Each check's diagnostics at push 1, 2, ... across the cohort as
+        {check: [count at push 1, count at push 2, ...]}."""
+        counts = Counter(zip(self._column(self.check, part), self._column(self.push, part)))
+        last_push = max(self.push, default=0)
+        wanted = None if checks is None else {self.checks.ids.get(check) for check in checks}
+        series = {}
+        for (check, push), total in counts.items():
+            if wanted is not None and check not in wanted:
+                continue
+            name = self.checks.names[check]
+            series.setdefault(name, [0] * last_push)[push - 1] = total
+        return series
+
+    @classmethod
+    def from_gradebook(cls, gradebook):
+        """Load the diagnostics of every push in the gradebook's lint
+        history. The push a part's current lint_diagnostics belong to
+        comes with their files and lines; when the last grading skipped
+        lint there is none, and every push is loaded from the history."""
+        store = cls()
+        query = '''
+            SELECT lint_diagnostics.check_name, lint_diagnostics.file, lint_diagnostics.line,
+                   repos.name, parts.part, parts.lint_push
+            FROM lint_diagnostics
+            JOIN parts ON parts.id = lint_diagnostics.part_id
+            JOIN repos ON repos.id = parts.repo_id
+            WHERE parts.lint_push IS NOT NULL
+        '''
+        detailed = {
+            (repo, part): push
+            for repo, part, push in gradebook.conn.execute(
+                'SELECT repos.name, parts.part, parts.lint_push '
+                'FROM parts JOIN repos ON repos.id = parts.repo_id '
+                'WHERE parts.lint_push IS NOT NULL'
+            )
+        }
+        for check, file, line, repo, part, push in gradebook.conn.execute(query):
+            store.add(check, file, line, repo, part, push)
+        # Other pushes only kept per check counts; they have no file or
+        # line.
+        for check, repo, part, push, count in gradebook.conn.execute(
+            'SELECT lint_history.check_name, repos.name, lint_history.part, '
+            'lint_history.push, lint_history.count '
+            'FROM lint_history JOIN repos ON repos.id = lint_history.repo_id'
+        ):
+            # A NULL check marks a push without diagnostics.
+            if push == detailed.get((repo, part)) or check is None:
+                continue
+            for _ in range(count):
+                store.add(check, '', 0, repo, part, push)
+        return store
+
+    def export(self, gradebook):
+        """Replace the gradebook's lint_summary and lint_repo_counts
+        tables with this store's current totals."""
+        latest = {}
+        for repo, part, push in zip(self.repo, self.part, self.push):
+            latest[(repo, part)] = max(push, latest.get((repo, part), 0))
+        current = bytes(
+            latest[(repo, part)] == push for repo, part, push in zip(self.repo, self.part, self.push)
+        )
+        checks = Counter(compress(self.check, current))
+        repos = Counter(compress(self.repo, current))
+        spread = Counter(check for check, _ in set(zip(compress(self.check, current), compress(self.repo, current))))
+        with gradebook.conn:
+            gradebook.conn.execute('BEGIN IMMEDIATE')
+            gradebook.conn.execute('DROP TABLE IF EXISTS lint_summary')
+            gradebook.conn.execute(
+                'CREATE TABLE lint_summary (check_name TEXT PRIMARY KEY, diagnostics INTEGER, repos INTEGER)'
+            )
+            gradebook.conn.execute('DROP TABLE IF EXISTS lint_repo_counts')
+            gradebook.conn.execute(
+                'CREATE TABLE lint_repo_counts (repo TEXT PRIMARY KEY, diagnostics INTEGER)'
+            )
+            gradebook.conn.executemany(
+                'INSERT INTO lint_summary VALUES (?, ?, ?)',
+                [(self.checks.names[check], total, spread[check]) for check, total in checks.items()],
+            )
+            gradebook.conn.executemany(
+                'INSERT INTO lint_repo_counts VALUES (?, ?)',
+                [(self.repos.names[repo], total) for repo, total in repos.items()],
+            )
+        return len(checks)
+
+
+def main():
+    """Main function; report on or export a gradebook's lint data."""
+    from gradebook import Gradebook
+    logger = setup_logger()
+    if len(sys.argv) < 3 or sys.argv[1] not in ('report', 'export'):
+        logger.error('usage: lintstats.py report|export gradebook.db')
+        sys.exit(1)
+    with Gradebook(sys.argv[2]) as gradebook:
+        store = LintStore.from_gradebook(gradebook)
+        if sys.argv[1] == 'export':
+            count = store.export(gradebook)
+            logger.info('Exported totals for %d checks', count)
+            return
+    logger.info('%d diagnostics in %d repos', len(store), len(store.repos.names))
+    for check, total in store.top_checks(20):
+        logger.info('%6d %s', total, check)
+    for check, series in sorted(store.trends().items()):
+        logger.info('%s by push: %s', check, ' '.join(str(total) for total in series))
+
+
+if __name__ == '__main__':
+    main()
@@ -24,26 +24,119 @@
 # POSSIBILITY OF SUCH DAMAGE.
 #
 """ Local logger setup. Used across all the different bits and pieces
-    in the GitHub actions. """
+    in the GitHub actions.
 
+    Records are handed to a queue and written to stdout by a listener
+    thread so graders never block on a slow terminal or pipe. Set
+    MS_LOG_JSON=1 to emit JSON lines instead of text and MS_JOB_ID (or
+    call set_job_id()) to tag records from parallel runs. """
+
+import atexit
+import contextvars
 import logging
+import logging.handlers
+import os
+import queue
 import sys
 
 mshafae_logger = None
+mshafae_listener = None
+
+_job_id = contextvars.ContextVar('job_id', default=os.environ.get('MS_JOB_ID'))
+
+
+class LazyJoin:
+    """Join lines only when a handler actually emits the record, e.g.
+    logger.debug('%s', LazyJoin(diff)) costs nothing when DEBUG is off."""
+
+    __slots__ = ('lines', 'separator')
+
+    def __init__(self, lines, separator='\n'):
+        self.lines = lines
+        self.separator = separator
+
+    def __str__(self):
+        return self.separator.join(self.lines)
+
+
+class JobIdFilter(logging.Filter):
+    """Stamp each record with the current job id."""
+
+    def filter(self, record):
+        record.job_id = _job_id.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Format a record as a single JSON object per line."""
+
+    def format(self, record):
+        import json
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'job': getattr(record, 'job_id', None),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def set_job_id(job_id):
+    """Tag records logged from the current thread or task with job_id.
+    Returns a token for _job_id.reset()."""
+    return _job_id.set(job_id)
+
+
+def stop_listener():
+    """Flush queued records and stop the listener thread."""
+    global mshafae_listener
+    if mshafae_listener:
+        mshafae_listener.stop()
+        mshafae_listener = None
+
+
+def restart_listener():
+    """Give a forked child its own queue and listener thread. The child
+    inherits the parent's queue but not its listener thread, so without
+    this its records are never written. grading_daemon.py calls it in
+    each job's child."""
+    global mshafae_listener
+    if not mshafae_logger:
+        return
+    handlers = mshafae_listener.handlers if mshafae_listener else ()
+    log_queue = queue.SimpleQueue()
+    for handler in mshafae_logger.handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            handler.queue = log_queue
+    mshafae_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    mshafae_listener.start()
+
 
 def setup_logger():
     """Set up the logger to output to stdout."""
     # https://docs.python.org/3/howto/logging.html#logging-basic-tutorial
     # https://stackoverflow.com/questions/14058453/making-python-loggers-output-all-messages-to-stdout-in-addition-to-log-file
     # root = logging.getLogger()
-    global mshafae_logger
+    global mshafae_logger, mshafae_listener
     if not mshafae_logger:
       logger = logging.getLogger()
       logger.setLevel(logging.INFO)
       handler = logging.StreamHandler(sys.stdout)
       handler.setLevel(logging.INFO)
-      formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+      if os.environ.get('MS_LOG_JSON'):
+          formatter = JSONFormatter()
+      else:
+          formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
       handler.setFormatter(formatter)
-      logger.addHandler(handler)
+      log_queue = queue.SimpleQueue()
+      queue_handler = logging.handlers.QueueHandler(log_queue)
+      queue_handler.addFilter(JobIdFilter())
+      logger.addHandler(queue_handler)
+      mshafae_listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+      mshafae_listener.start()
+      # Flush whatever is still queued when the grader calls sys.exit().
+      atexit.register(stop_listener)
       mshafae_logger = logger
     return mshafae_logger
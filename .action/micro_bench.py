@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Microbenchmarks of the grader's Python hot paths: header parsing,
+    header_check, the comment stripping diff, the format diff, the
+    pexpect patterns of the run checks, grading log row assembly and
+    the class wide lint queries over 100k diagnostics.
+    Each benchmark is warmed up, then timed with timeit and
+    perf_counter_ns; the median and p95 time per item are reported.
+    With --baseline a benchmark fails when its median is more than
+    --tolerance times the saved one.
+
+    ex.
+    .action/micro_bench.py
+    .action/micro_bench.py --json micro.json
+    .action/micro_bench.py --baseline micro.json header_parse
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+from cohort_bench import make_header, mutate_main, percentile, replace_header
+from logger import setup_logger
+
+ACTION_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_ROOT = os.path.dirname(ACTION_DIR)
+HEADERS = 2000
+HEADER_FILES = 200
+
+
+def _sample_source():
+    with open(os.path.join(SOURCE_ROOT, 'part-1', 'main.cc')) as file_handle:
+        return file_handle.read()
+
+
+def _headers(count, seed=120):
+    """count sources, every third one with a broken header."""
+    rng = random.Random(seed)
+    body = _sample_source()
+    sources = []
+    for number in range(count):
+        login = f'student{number:04d}'
+        header = make_header(rng, login, [f'partner{number:04d}'], 'Lab 11-01', number % 3 != 0)
+        sources.append(replace_header(body, header))
+    return sources
+
+
+def bench_header_parse(workdir):
+    from parse_header import dict_header
+    sources = _headers(HEADERS)
+
+    def run():
+        for contents in sources:
+            dict_header(contents, silent=True)
+    return run, len(sources)
+
+
+def bench_header_check(workdir):
+    from header_check import header_check
+    paths = []
+    for number, contents in enumerate(_headers(HEADER_FILES)):
+        path = os.path.join(workdir, f'header_{number}.cc')
+        with open(path, 'w') as file_handle:
+            file_handle.write(contents)
+        paths.append(path)
+
+    def run():
+        for path in paths:
+            header_check(path)
+    return run, len(paths)
+
+
+def bench_strip_and_compare(workdir):
+    if not shutil.which('clang++'):
+        return None
+    from ccsrcutilities import strip_and_compare_files
+    base = os.path.join(workdir, 'base.cc')
+    submission = os.path.join(workdir, 'submission.cc')
+    with open(base, 'w') as file_handle:
+        file_handle.write(_sample_source())
+    with open(submission, 'w') as file_handle:
+        file_handle.write(mutate_main(_sample_source(), 'lint_violation'))
+
+    def run():
+        strip_and_compare_files(base, submission)
+    return run, 1
+
+
+def bench_format_diff(workdir):
+    from ccsrcutilities import format_diff
+    original = mutate_main(_sample_source(), 'format_drift').split('\n')
+    correct = _sample_source().split('\n')
+
+    def run():
+        format_diff(original, correct)
+    return run, 1
+
+
+def bench_run_patterns(workdir):
+    # pexpect turns a str pattern into bytes and compiles it with DOTALL
+    # for a bytes spawn, then searches the buffered output.
+    from solution_check import P1_REGEX, P2_VALUES, p2_regex
+    cases = [(
+        re.compile(P1_REGEX.encode('utf-8'), re.DOTALL),
+        b'The densest state is District of Columbia (11294.8)\r\n'
+        b'The sparsest state is Alaska (1.28521)\r\n',
+    )]
+    for values in P2_VALUES:
+        transcript = values[-1].replace('\n', '\r\n').encode('utf-8')
+        cases.append((re.compile(p2_regex(values[-1]).encode('utf-8'), re.DOTALL), transcript))
+
+    def run():
+        for pattern, output in cases:
+            pattern.search(output)
+    return run, len(cases)
+
+
+def bench_csv_row(workdir):
+    import csv
+    import io
+    from gradebook import CSV_FIELDS
+    from results import GradeResult, StageVerdict
+    result = GradeResult(
+        repo='cpsc-120-lab-11-student0001', part='part-1', author='student0001',
+        partners=['student0002'], files=['main.cc', 'states.cc', 'states.h'],
+        unit_tests_total=10, unit_tests_passed=9, run_statuses=[True],
+    )
+    for file in result.files:
+        result.stages.append(StageVerdict('header', True, file))
+        result.stages.append(StageVerdict('format', True, file))
+        result.stages.append(StageVerdict('lint', False, file))
+    result.stages.append(StageVerdict('build', True))
+
+    def run():
+        outcsv = csv.DictWriter(io.StringIO(), CSV_FIELDS)
+        outcsv.writeheader()
+        outcsv.writerow(result.csv_row())
+    return run, 1
+
+
+def bench_lint_queries(workdir):
+    from lintstats import LintStore
+    rng = random.Random(120)
+    checks = [f'readability-check-{number}' for number in range(60)]
+    store = LintStore()
+    for _ in range(100000):
+        store.add(rng.choice(checks), 'main.cc', rng.randint(1, 200),
+                  f'student{rng.randrange(300):04d}', rng.choice(('part-1', 'part-2')),
+                  rng.randint(1, 5))
+
+    def run():
+        store.top_checks(10)
+        store.per_repo()
+        store.trends()
+    return run, 1
+
+
+# Benchmark name -> setup function returning (callable, items per call),
+# or None when a tool it needs is missing.
+BENCHMARKS = {
+    'header_parse': bench_header_parse,
+    'header_check': bench_header_check,
+    'strip_and_compare': bench_strip_and_compare,
+    'format_diff': bench_format_diff,
+    'run_patterns': bench_run_patterns,
+    'csv_row': bench_csv_row,
+    'lint_queries': bench_lint_queries,
+}
+
+
+def measure(func, items, repeat, min_seconds=0.2):
+    """Warm up func, then time repeat rounds of it; return the median
+    and p95 time per item in microseconds."""
+    timer = timeit.Timer(func, timer=time.perf_counter_ns)
+    # Doubling the loop count warms up func and makes each round long
+    # enough to time reliably.
+    number = 1
+    while True:
+        elapsed_ns = timer.timeit(number)
+        if elapsed_ns >= min_seconds * 1e9 / repeat or number >= 1 << 20:
+            break
+        number *= 2
+    samples = [
+        elapsed_ns / number / items / 1000
+        for elapsed_ns in timer.repeat(repeat=repeat, number=number)
+    ]
+    return {
+        'median_us': round(percentile(samples, 0.50), 3),
+        'p95_us': round(percentile(samples, 0.95), 3),
+        'loops': number,
+        'items': items,
+    }
+
+
+def main():
+    """Main function; run the benchmarks and compare with a baseline."""
+    logger = setup_logger()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--baseline', help='compare against a saved report')
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help='allowed slowdown relative to the baseline')
+    args = parser.parse_args()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file_handle:
+            baseline = json.load(file_handle)
+    report = {}
+    status = 0
+    workdir = tempfile.mkdtemp(prefix='micro_bench_')
+    try:
+        for name in args.benchmarks:
+            setup = BENCHMARKS[name](workdir)
+            if setup is None:
+                logger.warning('%s: skipped, a tool it needs is not installed', name)
+                continue
+            report[name] = measure(*setup, args.repeat)
+            logger.info('%s: median %.3f us, p95 %.3f us per item', name,
+                        report[name]['median_us'], report[name]['p95_us'])
+            if name in baseline:
+                allowed = baseline[name]['median_us'] * args.tolerance
+                if report[name]['median_us'] > allowed:
+                    logger.error('❌ %s regressed from %.3f us to %.3f us per item', name,
+                                 baseline[name]['median_us'], report[name]['median_us'])
+                    status = 1
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        with open(args.json, 'w') as file_handle:
+            json.dump(report, file_handle, indent=2, sort_keys=True)
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
@@ -27,10 +27,8 @@
 """ Create a Clang compile commands DB named compile_commands.json
     which is used by the clang-tidy utility. """
 import glob
-import json
 import os
 from os.path import exists
-import platform
 import logging
 from logger import setup_logger
 
@@ -40,6 +38,8 @@ def create_clang_compile_commands_db(
 ):
     """Create a Clang compile commands DB named
     compile_commands.json in the current working directory."""
+    import json
+    import platform
     out = 'compile_commands.json'
     linux_includes = ' -I/usr/include/c++/9/'
     darwin_includes = ' -D OSX -nostdinc++ -I/opt/local/include/libcxx/v1'
@@ -0,0 +1,174 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Reference answers for part-1 computed from a demographics CSV laid out
+    like part-1/state_demographics.csv, so the run check can grade against
+    any data file instead of two hard-coded numbers. Answers are cached by
+    the file's SHA-256, in memory and under MS_CACHE_DIR. derive_datasets()
+    writes alternative CSVs for feeding to a student's program. """
+
+import csv
+import json
+import math
+import os
+import random
+from dataclasses import asdict, dataclass
+from fileaccess import cache_dir, file_digest
+
+NAME_COLUMN = 'State'
+POPULATION_COLUMN = 'Population.2014 Population'
+LAND_AREA_COLUMN = 'Miscellaneous.Land Area'
+# Column positions in part-1/state_demographics.csv, used when a file has
+# no header naming them.
+DEFAULT_COLUMNS = (0, 2, 47)
+
+_answers = {}
+
+
+@dataclass
+class StatesAnswer:
+    """What part-1 should print for one data file. Ties go to the state
+    that comes first in the file, as the reference solution's strict
+    comparisons do."""
+    densest: str
+    densest_density: float
+    sparsest: str
+    sparsest_density: float
+
+    def numbers(self):
+        """The numbers the program prints, in order."""
+        return (self.densest_density, self.sparsest_density)
+
+
+def state_columns(table):
+    """Indexes of the name, population and land area columns."""
+    try:
+        return tuple(
+            table.names.index(name) for name in (NAME_COLUMN, POPULATION_COLUMN, LAND_AREA_COLUMN)
+        )
+    except ValueError:
+        return DEFAULT_COLUMNS
+
+
+def load_states(path):
+    """(names, populations, land areas) from a demographics CSV, through
+    the columnar cache so the text is parsed only once per file."""
+    from columnar import open_table
+    table = open_table(path)
+    name, population, land_area = state_columns(table)
+    return table.strings(name), table.column(population), table.column(land_area)
+
+
+def compute_answer(names, populations, land_areas):
+    """The densest and sparsest state and their densities."""
+    densities = [population / area for population, area in zip(populations, land_areas)]
+    densest = sparsest = 0
+    for index, density in enumerate(densities):
+        if density > densities[densest]:
+            densest = index
+        if density < densities[sparsest]:
+            sparsest = index
+    return StatesAnswer(names[densest], densities[densest], names[sparsest], densities[sparsest])
+
+
+def states_answer(path):
+    """The answer for the data file at path, cached by its hash."""
+    digest = file_digest(path)
+    answer = _answers.get(digest)
+    if answer is not None:
+        return answer
+    cached = os.path.join(cache_dir(), f'oracle-p1-{digest}.json')
+    try:
+        with open(cached) as file_handle:
+            answer = StatesAnswer(**json.load(file_handle))
+    except (OSError, ValueError, TypeError):
+        answer = compute_answer(*load_states(path))
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            temp_path = f'{cached}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as file_handle:
+                json.dump(asdict(answer), file_handle)
+            os.replace(temp_path, cached)
+        except OSError:
+            pass
+    _answers[digest] = answer
+    return answer
+
+
+def mismatches(actual, expected, rel_tol=0.01, abs_tol=0.0):
+    """Indexes where actual is not close to expected, all numbers at once."""
+    return [
+        index
+        for index, close in enumerate(map(
+            lambda a, e: math.isclose(a, e, rel_tol=rel_tol, abs_tol=abs_tol), actual, expected
+        ))
+        if not close
+    ]
+
+
+def derive_datasets(source, destination, count, seed=120):
+    """Write count variations of the CSV at source, each as
+    destination/<n>/<source's name>: each state's population and land
+    area are scaled by random factors, so a different state can come out
+    densest or sparsest, and a few states are dropped. The source is
+    read from the columnar cache and each variation's answer is computed
+    from the numbers as written, so nothing is parsed again. Returns the
+    paths."""
+    import hashlib
+    import io
+    from columnar import open_table
+    rng = random.Random(seed)
+    table = open_table(source)
+    with open(source, 'rb') as file_handle:
+        lineterminator = '\r\n' if b'\r\n' in file_handle.read(65536) else '\n'
+    name, population, land_area = state_columns(table)
+    texts = [table.strings(index) for index in range(len(table.names))]
+    names = table.strings(name)
+    populations = table.column(population)
+    land_areas = table.column(land_area)
+    paths = []
+    for number in range(count):
+        keep = sorted(rng.sample(range(table.rows), rng.randint(max(2, table.rows * 3 // 4), table.rows)))
+        new_populations = [max(1, int(populations[row] * rng.uniform(0.5, 2.0))) for row in keep]
+        new_land_areas = [float(f'{land_areas[row] * rng.uniform(0.5, 2.0):.2f}') for row in keep]
+        output = io.StringIO()
+        writer = csv.writer(output, quoting=csv.QUOTE_ALL, lineterminator=lineterminator)
+        writer.writerow(table.names)
+        for position, row in enumerate(keep):
+            cells = [column[row] for column in texts]
+            cells[population] = str(new_populations[position])
+            cells[land_area] = f'{new_land_areas[position]:.2f}'
+            writer.writerow(cells)
+        data = output.getvalue().encode('utf-8')
+        directory = os.path.join(destination, str(number))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, os.path.basename(source))
+        with open(path, 'wb') as file_handle:
+            file_handle.write(data)
+        _answers[hashlib.sha256(data).hexdigest()] = compute_answer(
+            [names[row] for row in keep], new_populations, new_land_areas
+        )
+        paths.append(path)
+    return paths
@@ -39,11 +39,32 @@
 # //
 
 import datetime
-import itertools
 import re
 
+from fileaccess import open_text
 from logger import setup_logger
 
+# Compiled once at import; they used to be compiled on every call.
+CLASS_RE = re.compile(r'(?i)CPSC\s\d{3}[A-Z]?-\d{1,2}')
+EMAIL_RE = re.compile(r'\w+[.\-_0-9\w]*@.+')
+CSUF_EMAIL_RE = re.compile(r'(?i)\w+[.\-_0-9\w]*@(csu\.)?fullerton\.edu')
+GITHUB_RE = re.compile(r'@([a-zA-Z\d](?:[a-zA-Z\d]|-(?=[a-zA-Z\d])){0,38})')
+ASSIGNMENT_RE = re.compile(r'(?i)Lab \d\d-\d\d')
+# One line and the line break that ends it, using the same line breaks
+# as str.splitlines().
+LINE_RE = re.compile(r'([^\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]*)(\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]|)')
+
+MIN_HEADER_LENGTH = 10
+NAME_LINE = 1
+KLASS_LINE = 2
+DATE_LINE = 3
+EMAIL_LINE = 4
+GITHUB_LINE = 5
+ASSIGNMENT_LINE = 7
+PARTNERS_LINE = 8
+COMMENT_LINE = 10
+
+
 def null_dict_header():
     result_dict = {
         'name' : 'No Header',
@@ -56,223 +77,282 @@ def null_dict_header():
     }
     return result_dict
 
-def dict_header(contents, silent=False):
-    """Given a single string, parse the header and return the result
-    as a dictionary with the keys class, email, github, asgt, comment.
-    On parse error, log a descriptive message and return an empty dictionary."""
 
-    logger = setup_logger()
-    
-    FAILURE = dict()
-
-    lines = contents.splitlines()
-
-    # reject: empty source file
-    if len(lines) == 0:
-        if not silent:
-            logger.warning('header missing because source file is empty')
-        return FAILURE
-
-    # reject: whitespace on first line
-    assert(len(lines) > 0)
-    if len(lines[0]) == 0 or lines[0].isspace():
-        if not silent:
-            logger.warning('line 1: expected a // comment holding a header, but found whitespace instead')
-        return FAILURE
-
-    # find prefix of all comment lines
-    #
-    # At this point we are permissive about leading and trailing whitespace, so
-    # we can give constructive feedback about more important issues.
-    # The strict whitespace check is last, below.
-    comment_lines = list(itertools.takewhile(lambda line: line.lstrip().startswith('//'), lines))
-
-    # reject: no comments (meaning the first line is neither whitespace nor a comment)
-    if len(comment_lines) == 0:
-        if not silent:
-            logger.warning('line 1: expected a // comment holding a header, but instead found: %s', lines[0])
-        return FAILURE
-
-    # strip whitespace for parsing purposes
-    header_lines = [line.strip() for line in comment_lines]
-    
-    # reject: header is impossibly short
-    MIN_HEADER_LENGTH = 10 
-    if len(header_lines) < MIN_HEADER_LENGTH:
-        if not silent:
-            logger.warning('line %i: header is only %i lines long', len(header_lines) + 1, len(header_lines))
-            logger.warning('a header must be at least %i lines long to contain all required information', MIN_HEADER_LENGTH)
-        return FAILURE
-
-    # reject: missing blank lines 6 or 9
-    def check_blank_line(line_number, previous_field_name):
-        if header_lines[line_number - 1] != '//':
-            if not silent:
-                logger.warning('line %i: should be a blank // comment after the %s',
-                                line_number, previous_field_name)
+def iter_lines(contents):
+    """Yield the lines of contents one at a time, split the way
+    str.splitlines() splits them, without splitting the whole string."""
+    position = 0
+    end = len(contents)
+    while position < end:
+        match = LINE_RE.match(contents, position)
+        yield match.group(1)
+        position = match.end()
+
+
+def _quiet(*args):
+    pass
+
+
+def is_github_username(username):
+    """True when username looks like @name; used for partners too."""
+    return bool(GITHUB_RE.fullmatch(username))
+
+
+class HeaderParser:
+    """Single pass parser for the leading // comment block of a source
+    file. Give it lines with feed() until it returns False, which it does
+    on the first line after the header, then call result(). Call reset()
+    to reuse it for another file."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget the previous file."""
+        self.first_line = None
+        # number of comment lines seen
+        self.count = 0
+        # stripped comment lines, only as many as the fields need
+        self.header_lines = []
+        # (line number, True when leading) of the first stray whitespace
+        self.stray_whitespace = None
+        self.done = False
+
+    def feed(self, line):
+        """Take the next line of the file. Returns False once the header
+        has ended and no more lines are needed."""
+        if self.done:
             return False
+        if self.first_line is None:
+            self.first_line = line
+        # At this point we are permissive about leading and trailing whitespace, so
+        # we can give constructive feedback about more important issues.
+        # The strict whitespace check is last, in result().
+        stripped = line.strip()
+        if not stripped.startswith('//'):
+            self.done = True
+            return False
+        self.count += 1
+        if self.count <= MIN_HEADER_LENGTH:
+            self.header_lines.append(stripped)
+        if self.stray_whitespace is None and line != stripped:
+            self.stray_whitespace = (self.count, line[0].isspace())
         return True
-    if not check_blank_line(6, 'GitHub username'):
-        return FAILURE
-    if not check_blank_line(9, 'Partners'):
-        return FAILURE
-
-    # extract the fields: name, class, date, email, github, asgt, partners, comment
-    # check that each is nonempty and has a space after //
-    def check_field(line_number, name):
-        line = header_lines[line_number - 1]
-        assert(line.startswith('//'))
-        assert(line.strip() == line)
+
+    def _field(self, line_number, name, warn):
+        """The value of a field line, or False when it is missing."""
+        line = self.header_lines[line_number - 1]
         if line == '//':
-            if not silent:
-                logger.warning('line %i: should contain %s, but it is missing',
-                                line_number, name)
+            warn('line %i: should contain %s, but it is missing', line_number, name)
             return False
-        assert(len(line) > 2)
         if line[2] != ' ':
-            if not silent:
-                logger.warning('line %i: there must be a space between // and %s',
-                                line_number, name)
+            warn('line %i: there must be a space between // and %s', line_number, name)
             return False
-        assert(len(line) > 3) # must be a non-whitespace char after '// '
         value = line[3:].strip()
         if len(value) == 0:
-            if not silent:
-                logger.warning('line %i: %s field is empty', line_number, name)
+            warn('line %i: %s field is empty', line_number, name)
             return False
         return value
 
-    NAME_LINE = 1
-    KLASS_LINE = 2
-    DATE_LINE = 3
-    EMAIL_LINE = 4
-    GITHUB_LINE = 5
-    ASSIGNMENT_LINE = 7
-    PARTNERS_LINE = 8
-    COMMENT_LINE = 10
-
-    name = check_field(NAME_LINE, 'name')
-    klass = check_field(KLASS_LINE, 'class') # class is a reserved word
-    date = check_field(DATE_LINE, 'date')
-    email = check_field(EMAIL_LINE, 'email')
-    github = check_field(GITHUB_LINE, 'GitHub')
-    assignment = check_field(ASSIGNMENT_LINE, 'assignment')
-    partners = check_field(PARTNERS_LINE, 'Partners:')
-    comment = check_field(COMMENT_LINE, 'comment')
-    if not all([name, klass, date, email, github, assignment, partners, comment]):
-        return FAILURE
-
-    # check name
-    if not any([char.isalpha() for char in name]):
-        if not silent:
-            logger.warning('line %i: does not resemble a name', NAME_LINE)
-            logger.warning('a name is expected to have at least one letter')
-        return FAILURE
-
-    # check class
-    if not re.fullmatch('(?i)CPSC\s\d{3}[A-Z]?-\d{1,2}', klass):
-        if not silent:
-            logger.warning('line %i: does not resemble a class section number', KLASS_LINE)
-            logger.warning('an example valid class section number is: 120L-01')
-        return FAILURE
-    
-    # check date
-    try:
-        datetime.date.fromisoformat(date)
-    except ValueError:
-        if not silent:
-            logger.warning('line %i: does not resemble a date in YYYY-MM-DD format', DATE_LINE)
-            logger.warning('an example valid date is: 2022-12-31')
-        return FAILURE
-
-    # check email
-    # any domain whatsoever
-    if not re.fullmatch('\w+[.\-_0-9\w]*@.+', email):
-        if not silent:
-            logger.warning('line %i: does not resemble an email address', EMAIL_LINE)
-            logger.warning('an example email address is: adalovelace@csu.fullerton.edu')
-        return FAILURE
-    # CSUF domain
-    if not re.fullmatch('(?i)\w+[.\-_0-9\w]*@(csu\.)?fullerton\.edu', email):
-        if not silent:
-            logger.warning('line %i: email address is not CSUF-issued', EMAIL_LINE)
-            logger.warning('use your CSUF-issued email ending in @csu.fullerton.edu or @fullerton.edu')
-            logger.warning('an example email address is: adalovelace@csu.fullerton.edu')
-        return FAILURE
-
-    # github
-    def is_github_username(str): # will reuse this for partners below
-        return bool(re.fullmatch('@([a-zA-Z\d](?:[a-zA-Z\d]|-(?=[a-zA-Z\d])){0,38})', str))
-    if not is_github_username(github):
-        if not silent:
-            logger.warning('line %i: does not resemble a GitHub username starting with @', GITHUB_LINE)
-            logger.warning('an example GitHub username is: @AdaLovelace')
-        return FAILURE
-
-    # assignment
-    if not re.fullmatch('(?i)Lab \d\d-\d\d', assignment):
-        if not silent:
-            logger.warning('line %i: does not resemble a Lab assignment number', ASSIGNMENT_LINE)
-            logger.warning('an example lab assignment number is: Lab 01-02')
-        return FAILURE
-
-    # partners
-    if not partners.startswith('Partners:'):
-        if not silent:
-            logger.warning('line %i: does not contain a Partners: list', PARTNERS_LINE)
-        return FAILURE
-    partner_string = partners.split('Partners:')[1].strip()
-    partner_usernames = [str.strip()
-                         for str in partner_string.split(',')
-                         if len(str.strip()) > 0]
-    partner_count = len(partner_usernames)
-    if partner_count == 0:
-        if not silent:
-            logger.warning('line %i: partners list is empty; expected you to have a pair-programming partner', PARTNERS_LINE)
-        # do not return FAILURE; proceed with grading this; life happens
-    if partner_count > 2:
-        if not silent:
-            logger.warning('line %i: expected only one or two partners, but you have %i', PARTNERS_LINE, partner_count)
-        # do not return FAILURE; proceed with grading this; life happens
-    for username in partner_usernames:
-        if not is_github_username(username):
-            if not silent:
-                logger.warning('line %i: partner "%s" does not resemble a GitHub username starting with @', PARTNERS_LINE, username)
-                logger.warning('an example GitHub username is: @AdaLovelace')
+    def result(self, silent=False):
+        """Check what was fed and return the header as a dictionary with
+        the keys name, class, email, github, asgt, partners, comment. On
+        a parse error, log a descriptive message unless silent and return
+        an empty dictionary."""
+        warn = _quiet if silent else setup_logger().warning
+        FAILURE = dict()
+
+        # reject: empty source file
+        if self.first_line is None:
+            warn('header missing because source file is empty')
             return FAILURE
 
-    # comment
-    if not any([char.isalpha() for char in comment]):
-        if not silent:
-            logger.warning('line %i: does not resemble a descriptive comment', COMMENT_LINE)
-            logger.warning('a descriptive comment is expected to have at least one letter', COMMENT_LINE)
-        return FAILURE
-
-    # finally check for stray whitespace
-    # use the un-stripped source lines in comment_lines, not the stripped ones in header_lines
-    for index, line in enumerate(comment_lines):
-        if line != line.lstrip():
-            if not silent:
-                logger.warning('line %i: unexpected leading whitespace; delete whitespace before //', index + 1)
+        # reject: whitespace on first line
+        if len(self.first_line) == 0 or self.first_line.isspace():
+            warn('line 1: expected a // comment holding a header, but found whitespace instead')
             return FAILURE
-        if line != line.rstrip():
-            if not silent:
-                logger.warning('line %i: unexpected trailing whitespace; delete whitespace at the end of the line', index + 1)
+
+        # reject: no comments (meaning the first line is neither whitespace nor a comment)
+        if self.count == 0:
+            warn('line 1: expected a // comment holding a header, but instead found: %s', self.first_line)
             return FAILURE
 
-    # Success!
-    # create a dictionary object
-    result_dict = {
-        'name' : name,
-        'class' : klass,
-        'email' : email,
-        'github' : github,
-        'asgt' : assignment,
-        'partners' : partner_string,
-        'comment' : comment,
-    }
+        # reject: header is impossibly short
+        if self.count < MIN_HEADER_LENGTH:
+            warn('line %i: header is only %i lines long', self.count + 1, self.count)
+            warn('a header must be at least %i lines long to contain all required information', MIN_HEADER_LENGTH)
+            return FAILURE
+
+        # reject: missing blank lines 6 or 9
+        for line_number, previous_field_name in ((6, 'GitHub username'), (9, 'Partners')):
+            if self.header_lines[line_number - 1] != '//':
+                warn('line %i: should be a blank // comment after the %s',
+                     line_number, previous_field_name)
+                return FAILURE
+
+        # extract the fields: name, class, date, email, github, asgt, partners, comment
+        # check that each is nonempty and has a space after //; every
+        # field is checked so all of the problems are reported
+        name = self._field(NAME_LINE, 'name', warn)
+        klass = self._field(KLASS_LINE, 'class', warn) # class is a reserved word
+        date = self._field(DATE_LINE, 'date', warn)
+        email = self._field(EMAIL_LINE, 'email', warn)
+        github = self._field(GITHUB_LINE, 'GitHub', warn)
+        assignment = self._field(ASSIGNMENT_LINE, 'assignment', warn)
+        partners = self._field(PARTNERS_LINE, 'Partners:', warn)
+        comment = self._field(COMMENT_LINE, 'comment', warn)
+        if not all([name, klass, date, email, github, assignment, partners, comment]):
+            return FAILURE
+
+        # check name
+        if not any(char.isalpha() for char in name):
+            warn('line %i: does not resemble a name', NAME_LINE)
+            warn('a name is expected to have at least one letter')
+            return FAILURE
+
+        # check class
+        if not CLASS_RE.fullmatch(klass):
+            warn('line %i: does not resemble a class section number', KLASS_LINE)
+            warn('an example valid class section number is: 120L-01')
+            return FAILURE
+
+        # check date
+        try:
+            datetime.date.fromisoformat(date)
+        except ValueError:
+            warn('line %i: does not resemble a date in YYYY-MM-DD format', DATE_LINE)
+            warn('an example valid date is: 2022-12-31')
+            return FAILURE
+
+        # check email
+        # any domain whatsoever
+        if not EMAIL_RE.fullmatch(email):
+            warn('line %i: does not resemble an email address', EMAIL_LINE)
+            warn('an example email address is: adalovelace@csu.fullerton.edu')
+            return FAILURE
+        # CSUF domain
+        if not CSUF_EMAIL_RE.fullmatch(email):
+            warn('line %i: email address is not CSUF-issued', EMAIL_LINE)
+            warn('use your CSUF-issued email ending in @csu.fullerton.edu or @fullerton.edu')
+            warn('an example email address is: adalovelace@csu.fullerton.edu')
+            return FAILURE
+
+        # github
+        if not is_github_username(github):
+            warn('line %i: does not resemble a GitHub username starting with @', GITHUB_LINE)
+            warn('an example GitHub username is: @AdaLovelace')
+            return FAILURE
+
+        # assignment
+        if not ASSIGNMENT_RE.fullmatch(assignment):
+            warn('line %i: does not resemble a Lab assignment number', ASSIGNMENT_LINE)
+            warn('an example lab assignment number is: Lab 01-02')
+            return FAILURE
+
+        # partners
+        if not partners.startswith('Partners:'):
+            warn('line %i: does not contain a Partners: list', PARTNERS_LINE)
+            return FAILURE
+        partner_string = partners.split('Partners:')[1].strip()
+        partner_usernames = [str.strip()
+                             for str in partner_string.split(',')
+                             if len(str.strip()) > 0]
+        partner_count = len(partner_usernames)
+        if partner_count == 0:
+            warn('line %i: partners list is empty; expected you to have a pair-programming partner', PARTNERS_LINE)
+            # do not return FAILURE; proceed with grading this; life happens
+        if partner_count > 2:
+            warn('line %i: expected only one or two partners, but you have %i', PARTNERS_LINE, partner_count)
+            # do not return FAILURE; proceed with grading this; life happens
+        for username in partner_usernames:
+            if not is_github_username(username):
+                warn('line %i: partner "%s" does not resemble a GitHub username starting with @', PARTNERS_LINE, username)
+                warn('an example GitHub username is: @AdaLovelace')
+                return FAILURE
+
+        # comment
+        if not any(char.isalpha() for char in comment):
+            warn('line %i: does not resemble a descriptive comment', COMMENT_LINE)
+            warn('a descriptive comment is expected to have at least one letter')
+            return FAILURE
+
+        # finally check for stray whitespace, found while feeding the
+        # un-stripped source lines
+        if self.stray_whitespace:
+            line_number, leading = self.stray_whitespace
+            if leading:
+                warn('line %i: unexpected leading whitespace; delete whitespace before //', line_number)
+            else:
+                warn('line %i: unexpected trailing whitespace; delete whitespace at the end of the line', line_number)
+            return FAILURE
+
+        # Success!
+        # create a dictionary object
+        result_dict = {
+            'name' : name,
+            'class' : klass,
+            'email' : email,
+            'github' : github,
+            'asgt' : assignment,
+            'partners' : partner_string,
+            'comment' : comment,
+        }
+
+        return result_dict
+
+
+def dict_header(contents, silent=False):
+    """Given a single string, parse the header and return the result
+    as a dictionary with the keys class, email, github, asgt, comment.
+    On parse error, log a descriptive message and return an empty dictionary."""
+    parser = HeaderParser()
+    for line in iter_lines(contents):
+        if not parser.feed(line):
+            break
+    return parser.result(silent)
+
+
+def _feed_file(parser, file_handle, chunk_size=4096):
+    """Feed parser the lines of an open file until its header ends,
+    reading chunk_size characters at a time."""
+    pending = ''
+    for chunk in iter(lambda: file_handle.read(chunk_size), ''):
+        pending += chunk
+        position = 0
+        while True:
+            match = LINE_RE.match(pending, position)
+            # The last line, or a '\r' that may be half of '\r\n', may
+            # continue in the next chunk.
+            if not match.group(2) or (match.group(2) == '\r' and match.end() == len(pending)):
+                break
+            if not parser.feed(match.group(1)):
+                return
+            position = match.end()
+        pending = pending[position:]
+    for line in iter_lines(pending):
+        if not parser.feed(line):
+            return
+
+
+def validate_headers(paths, silent=True):
+    """Check the header of each file in paths, reading only as much of
+    each file as its header needs, with one parser shared by all files.
+    Yields (path, header) in order, where header is what dict_header()
+    returns: empty when the header is malformed or the file is
+    unreadable."""
+    logger = setup_logger()
+    parser = HeaderParser()
+    for path in paths:
+        parser.reset()
+        try:
+            with open_text(path) as file_handle:
+                _feed_file(parser, file_handle)
+        except (OSError, UnicodeDecodeError) as exception:
+            logger.warning('%s: cannot read file: %s', path, exception)
+            yield path, dict()
+            continue
+        yield path, parser.result(silent)
 
-    return result_dict
 
 def parse_header(contents, keyword=None):
     """Given Given a single string, parse the header and return the keyword's value."""
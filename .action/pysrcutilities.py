@@ -26,12 +26,14 @@
 """ Utilities used to manipulate Python source code files from student
     assignments. """
 
+from __future__ import annotations
+
 import glob
 import os.path
 import logging
 import re
 from datetime import datetime
-import black
+# black is imported where it is used; it dominates startup time otherwise.
 
 def remove_python_comments(file):
     """Removing comments from Python code. Inspiration from
@@ -122,7 +124,7 @@ def pyformat_file_in_place(
     src: black.Path,
     fast: bool,
     mode: black.Mode,
-    write_back: black.WriteBack = black.WriteBack.NO,
+    write_back: black.WriteBack = None,
     lock: black.Any = None,  # multiprocessing.Manager().Lock() is some crazy proxy
 ) -> (bool, str):
     """This was taken from black so that the diff is captured to a string rather than sent directly to stdout. Format file under `src` path. Return True if changed.
@@ -130,6 +132,9 @@ def pyformat_file_in_place(
     code to the file.
     `mode` and `fast` options are passed to :func:`format_file_contents`.
     """
+    import black
+    if write_back is None:
+        write_back = black.WriteBack.NO
     then = datetime.utcfromtimestamp(src.stat().st_mtime)
     with open(src, "rb") as buf:
         src_contents, encoding, newline = black.decode_bytes(buf.read())
@@ -175,6 +180,7 @@ def pyformat_file_in_place(
 
 def pyformat_check(file):
     """Use black to check the style of the input file."""
+    import black
     diff_contents = None
     # black.freeze_support()
     # black.patch_click()
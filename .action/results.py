@@ -0,0 +1,189 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Typed results of grading one part of a student's repository, as
+    returned by assessment.grade_part(). """
+
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class StageVerdict:
+    """Outcome of one stage, e.g. formatting one file or the build."""
+    stage: str
+    passed: bool
+    file: Optional[str] = None
+    detail: Optional[str] = None
+    seconds: float = 0.0
+    # True when the stage did not run because a stage it needs failed
+    skipped: bool = False
+
+
+@dataclass
+class UnitTestFailure:
+    """One failed googletest assertion."""
+    __slots__ = ('suite', 'test', 'message')
+    suite: str
+    test: str
+    message: str
+
+
+@dataclass
+class UnitTestCase:
+    """One googletest test. status is RUN, or NOTRUN for a disabled test,
+    and failures holds the message of each failed assertion."""
+    __slots__ = ('suite', 'name', 'status', 'seconds', 'failures')
+    suite: str
+    name: str
+    status: str
+    seconds: float
+    failures: Tuple[str, ...]
+
+    @property
+    def passed(self):
+        return not self.failures
+
+
+@dataclass
+class UnitTestReport:
+    """A googletest run, as parsed by gtest_report.read_report(). tests
+    and failures are the run's own totals."""
+    __slots__ = ('tests', 'failures', 'cases')
+    tests: int
+    failures: int
+    cases: List[UnitTestCase]
+
+    @property
+    def passed(self):
+        return self.tests - self.failures
+
+    def failed_assertions(self):
+        """A UnitTestFailure for every failed assertion."""
+        return [
+            UnitTestFailure(case.suite, case.name, message)
+            for case in self.cases for message in case.failures
+        ]
+
+    def times(self):
+        """(suite, test, seconds, passed) for every test that ran."""
+        return [
+            (case.suite, case.name, case.seconds, case.passed)
+            for case in self.cases if case.status != 'NOTRUN'
+        ]
+
+
+@dataclass
+class GradeResult:
+    """Everything known about one graded part. status is the exit status
+    the command line graders use: 0 when every stage passed."""
+    repo: str
+    part: str
+    author: Optional[str] = None
+    partners: List[str] = field(default_factory=list)
+    files: List[str] = field(default_factory=list)
+    stages: List[StageVerdict] = field(default_factory=list)
+    notes: List[str] = field(default_factory=list)
+    lint_warnings: List[tuple] = field(default_factory=list)
+    # (check, file, line) for every clang-tidy diagnostic
+    lint_diagnostics: List[tuple] = field(default_factory=list)
+    unit_tests_total: Optional[int] = None
+    unit_tests_passed: Optional[int] = None
+    unit_test_failures: List[UnitTestFailure] = field(default_factory=list)
+    # (suite, test, seconds, passed) for every unit test that ran
+    unit_test_times: List[tuple] = field(default_factory=list)
+    run_statuses: List[bool] = field(default_factory=list)
+    timings: dict = field(default_factory=dict)
+    status: int = 0
+
+    def verdicts(self, stage):
+        """The verdicts recorded for stage."""
+        return [verdict for verdict in self.stages if verdict.stage == stage]
+
+    def skipped(self, stage):
+        """True when stage was skipped."""
+        return any(verdict.skipped for verdict in self.verdicts(stage))
+
+    def _ratio(self, stage):
+        verdicts = self.verdicts(stage)
+        if not verdicts:
+            return None
+        if self.skipped(stage):
+            return 0
+        return f'{sum(verdict.passed for verdict in verdicts)}/{len(verdicts)}'
+
+    def merge(self, other):
+        """Add the findings in other, e.g. one stage's, to this result."""
+        for name in ('partners', 'stages', 'notes', 'lint_warnings', 'lint_diagnostics',
+                     'unit_test_failures', 'unit_test_times', 'run_statuses'):
+            getattr(self, name).extend(getattr(other, name))
+        for name in ('author', 'unit_tests_total', 'unit_tests_passed'):
+            if getattr(other, name) is not None:
+                setattr(self, name, getattr(other, name))
+        for stage, seconds in other.timings.items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        self.status = self.status or other.status
+
+    def csv_row(self):
+        """The grading log row keyed by gradebook.CSV_FIELDS."""
+        row = {
+            'Repo Name': self.repo,
+            'Part': self.part,
+            'Author': self.author,
+            'Formatting': self._ratio('format'),
+            'Linting': self._ratio('lint'),
+            'Notes': ''.join(self.notes),
+        }
+        for num, name in enumerate(self.partners[:3], start=1):
+            row[f'Partner{num}'] = name
+        if len(self.partners) > 3:
+            row['PartnerN'] = ';'.join(self.partners[3:])
+        if not self.files:
+            row.update({'Formatting': 0, 'Linting': 0, 'Build': 0, 'Tests': 0})
+        build = self.verdicts('build')
+        if build:
+            row['Build'] = int(build[-1].passed)
+            row['Tests'] = f'{sum(self.run_statuses)}/{len(self.run_statuses)}'
+        if self.skipped('unittest'):
+            row['UnitTests'] = 0
+        elif self.unit_tests_total is not None:
+            row['UnitTests'] = f'{self.unit_tests_passed}/{self.unit_tests_total}'
+            row['UnitTestNotes'] = ''.join(
+                f'{failure.suite}:{failure.test}:{failure.message}\n'
+                for failure in self.unit_test_failures
+            )
+        return row
+
+    def gradebook_records(self):
+        """Arguments for gradebook.Gradebook.record_part()."""
+        return (
+            self.csv_row(),
+            [(verdict.stage, verdict.passed, verdict.file or verdict.detail) for verdict in self.stages],
+            self.lint_warnings,
+            [(failure.suite, failure.test, failure.message) for failure in self.unit_test_failures],
+            self.lint_diagnostics,
+            self.unit_test_times,
+            bool(self.verdicts('lint')) and not self.skipped('lint'),
+        )
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Student roster mapping GitHub logins to (last name, first name).
+    The roster lives in a SQLite table keyed on the login so a lookup
+    reads one row no matter how many sections and semesters it holds.
+
+    The roster is named by MS_GITUSER_DB. For compatibility, a roster
+    named by MS_GITUSER_PICKLE (a pickled dict of login -> names) is
+    converted once to a .sqlite file next to it and used from then on.
+
+    ex.
+    .action/roster.py convert students.pickle students.sqlite
+    .action/roster.py lookup students.sqlite mshafae
+"""
+
+import os
+import sqlite3
+import sys
+from logger import setup_logger
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS students (
+    login TEXT PRIMARY KEY,
+    last_name TEXT NOT NULL,
+    first_name TEXT NOT NULL
+) WITHOUT ROWID;
+'''
+
+
+class Roster:
+    """Read only view of a roster database. Lookups are cached so asking
+    for the same partner twice does not query twice."""
+
+    def __init__(self, path):
+        import threading
+        self.path = path
+        # grade_part() looks partners up from a stage thread; the lock
+        # keeps those lookups one at a time on the shared connection.
+        self.conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def get(self, login, default=None):
+        """Return (last name, first name) for login or default."""
+        login = login.lower()
+        with self._lock:
+            if login not in self._cache:
+                self._cache[login] = self.conn.execute(
+                    'SELECT last_name, first_name FROM students WHERE login = ?',
+                    (login,),
+                ).fetchone()
+            found = self._cache[login]
+        return default if found is None else found
+
+    def __contains__(self, login):
+        return self.get(login) is not None
+
+    def __getitem__(self, login):
+        found = self.get(login)
+        if found is None:
+            raise KeyError(login)
+        return found
+
+
+def convert_pickle(pickle_path, db_path):
+    """One time conversion of a pickled {login: (last, first, ...)} dict
+    into a roster database. Existing logins are overwritten."""
+    import pickle
+    with open(pickle_path, 'rb') as file_handle:
+        # The students file contains only one dict
+        students_dict = pickle.load(file_handle)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executescript(_SCHEMA)
+        conn.executemany(
+            'INSERT OR REPLACE INTO students VALUES (?, ?, ?)',
+            (
+                (login.lower(), str(names[0]), str(names[1]))
+                for login, names in students_dict.items()
+            ),
+        )
+    count = conn.execute('SELECT count(*) FROM students').fetchone()[0]
+    conn.close()
+    return count
+
+
+def open_roster():
+    """Open the roster named by MS_GITUSER_DB or, failing that, by
+    MS_GITUSER_PICKLE. Returns None when neither is set."""
+    logger = setup_logger()
+    db_path = os.environ.get('MS_GITUSER_DB')
+    pickle_path = os.environ.get('MS_GITUSER_PICKLE')
+    if not db_path and pickle_path:
+        db_path = os.path.splitext(pickle_path)[0] + '.sqlite'
+        if not os.path.exists(db_path) or os.path.getmtime(db_path) < os.path.getmtime(pickle_path):
+            logger.info('Converting %s to %s', pickle_path, db_path)
+            # Convert into a temporary file so concurrent graders never
+            # open a half written roster.
+            tmp_path = f'{db_path}.{os.getpid()}'
+            convert_pickle(pickle_path, tmp_path)
+            os.replace(tmp_path, db_path)
+    if not db_path:
+        return None
+    return Roster(db_path)
+
+
+def main():
+    """Main function; convert a pickled roster or look up logins."""
+    logger = setup_logger()
+    if len(sys.argv) >= 4 and sys.argv[1] == 'convert':
+        count = convert_pickle(sys.argv[2], sys.argv[3])
+        logger.info('Wrote %d students to %s', count, sys.argv[3])
+    elif len(sys.argv) >= 4 and sys.argv[1] == 'lookup':
+        with Roster(sys.argv[2]) as roster:
+            for login in sys.argv[3:]:
+                logger.info('%s: %s', login, roster.get(login))
+    else:
+        logger.error('usage: roster.py convert students.pickle students.sqlite')
+        logger.error('       roster.py lookup students.sqlite login [login ...]')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -30,7 +30,7 @@ import os.path
 import os
 import sys
 import logging
-import subprocess
+from capture import run_bounded
 from logger import setup_logger
 
 
@@ -41,14 +41,7 @@ def run(binary='asgt', args='', expect=None):
     if os.path.exists(cmd):
         if len(args) > 0:
             cmd = cmd + ' ' + args
-        proc = subprocess.run(
-            [cmd],
-            capture_output=True,
-            shell=True,
-            timeout=10,
-            check=False,
-            text=True,
-        )
+        proc = run_bounded([cmd], timeout=10)
         if proc.stdout:
             logging.info('Output (stdout): %s', str(proc.stdout).rstrip("\n\r"))
             if expect:
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Scaling test for part-1. Demographics CSVs of 10^3 to 10^6 rows in
+    the state_demographics.csv schema are streamed to disk under
+    MS_CACHE_DIR, the student's program is timed on each one and a power
+    law is fitted to the times. An exponent near 2 means the program is
+    quadratic in the number of rows, e.g. it copies every row it has
+    read for each new one.
+
+    When MS_SCALING_CHECK is set the part-1 grader runs this after the
+    program passes its runs and adds a note for quadratic programs.
+
+    ex.
+    .action/scaling.py generate /tmp/big.csv --rows 100000
+    .action/scaling.py check part-1/states
+"""
+
+import argparse
+import csv
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+from logger import setup_logger
+
+SIZES = (1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+DATA_FILE = 'state_demographics.csv'
+# The grader's own copy, so an edited student copy cannot change the schema.
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'part-1', DATA_FILE)
+# Fitted exponent at and above which a program is called quadratic; a
+# linear program measures about 1 and n log n slightly more.
+QUADRATIC_EXPONENT = 1.6
+# Times that exceed the run on the small file by less than this are
+# mostly process start up and noise and are left out of the fit.
+MIN_FIT_SECONDS = 0.02
+FIT_POINTS = 2
+RUN_TIMEOUT = 20
+REPEATS = 2
+
+
+def write_scaled_csv(path, rows, template=TEMPLATE, seed=120):
+    """Stream a CSV of rows states to path: the header and the cells of
+    template's rows, cycled, with numbered state names and random
+    populations and land areas. The rows are written as they are made so
+    memory use does not depend on rows. Returns the oracle.StatesAnswer
+    for the file."""
+    from columnar import open_table
+    from oracle import StatesAnswer, state_columns
+    rng = random.Random(seed)
+    table = open_table(template)
+    name, population, land_area = state_columns(table)
+    templates = list(zip(*(table.strings(index) for index in range(len(table.names)))))
+    densest = sparsest = None
+    # Per process, so graders making the same dataset at once each write
+    # their own file and the last os.replace() wins.
+    partial = f'{path}.{os.getpid()}.partial'
+    with open(partial, 'w', newline='') as file_handle:
+        writer = csv.writer(file_handle, quoting=csv.QUOTE_ALL)
+        writer.writerow(table.names)
+        for number in range(rows):
+            cells = list(templates[number % len(templates)])
+            state = f'{cells[name]} {number}'
+            people = rng.randint(1000, 40000000)
+            area = float(f'{rng.uniform(50.0, 600000.0):.2f}')
+            cells[name], cells[population], cells[land_area] = state, str(people), f'{area:.2f}'
+            writer.writerow(cells)
+            # Strict comparisons so ties go to the first state, as in
+            # oracle.compute_answer().
+            density = people / area
+            if densest is None or density > densest[1]:
+                densest = (state, density)
+            if sparsest is None or density < sparsest[1]:
+                sparsest = (state, density)
+    os.replace(partial, path)
+    return StatesAnswer(*densest, *sparsest)
+
+
+def scaled_dataset(rows, seed=120):
+    """A directory holding a DATA_FILE of rows states, made on first use
+    and kept under MS_CACHE_DIR."""
+    from fileaccess import cache_dir
+    directory = os.path.join(cache_dir(), 'scaled-p1', f'{rows}-{seed}')
+    path = os.path.join(directory, DATA_FILE)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        logger = setup_logger()
+        logger.debug('Writing %d rows to %s', rows, path)
+        write_scaled_csv(path, rows, seed=seed)
+    return directory
+
+
+def fit_exponent(sizes, seconds):
+    """Least squares slope of log(seconds) against log(size), or None
+    with fewer than two points."""
+    if len(sizes) < 2:
+        return None
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(second) for second in seconds]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+
+
+@dataclass
+class ScalingReport:
+    """Times of one program on growing data files. seconds[i] is the best
+    time on sizes[i] less baseline, the time on the small file. When the
+    program ran out of time on timed_out rows that size is included with
+    the timeout as its time."""
+    baseline: float = 0.0
+    sizes: List[int] = field(default_factory=list)
+    seconds: List[float] = field(default_factory=list)
+    timed_out: Optional[int] = None
+    failed: Optional[int] = None
+
+    @property
+    def exponent(self):
+        """Fitted to the largest sizes, where the leading term of the
+        program's running time dominates. A timeout raises it to at least
+        the slope up to the timeout."""
+        points = [
+            (size, second) for size, second in zip(self.sizes, self.seconds)
+            if second >= MIN_FIT_SECONDS and size != self.timed_out
+        ]
+        exponent = fit_exponent([size for size, _ in points[-FIT_POINTS:]], [second for _, second in points[-FIT_POINTS:]])
+        if self.timed_out and points:
+            bound = fit_exponent([points[-1][0], self.timed_out], [points[-1][1], self.seconds[-1]])
+            exponent = bound if exponent is None else max(exponent, bound)
+        return exponent
+
+    @property
+    def quadratic(self):
+        exponent = self.exponent
+        return exponent is not None and exponent >= QUADRATIC_EXPONENT
+
+    def describe(self):
+        """One line summary for logs and grading notes."""
+        times = ', '.join(f'{size}: {second:.3f}s' for size, second in zip(self.sizes, self.seconds))
+        exponent = self.exponent
+        growth = 'too fast to fit' if exponent is None else f'time grows like n^{exponent:.2f}'
+        if self.timed_out:
+            growth += f', timed out on {self.timed_out} rows'
+        return f'{growth} ({times})'
+
+
+def time_run(binary, directory, timeout=RUN_TIMEOUT, repeats=REPEATS):
+    """Best wall clock time of repeats runs of binary in directory. Raises
+    subprocess.TimeoutExpired, or CalledProcessError on a non-zero exit."""
+    from capture import run_bounded
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        proc = run_bounded([os.path.abspath(binary)], timeout, shell=False, cwd=directory)
+        seconds = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, binary, proc.stdout, proc.stderr)
+        best = seconds if best is None else min(best, seconds)
+        if seconds > 1:
+            # Long runs are not noisy enough to be worth repeating.
+            break
+    return best
+
+
+def scaling_check(binary, sizes=SIZES, timeout=RUN_TIMEOUT, seed=120):
+    """Time binary on the repository's data file and then on scaled ones
+    of each size, stopping at the first timeout or failure. Returns a
+    ScalingReport."""
+    logger = setup_logger()
+    report = ScalingReport()
+    try:
+        report.baseline = time_run(binary, os.path.dirname(TEMPLATE), timeout)
+    except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as exception:
+        logger.debug('No baseline: %s', exception)
+        report.failed = 0
+        return report
+    for size in sizes:
+        directory = scaled_dataset(size, seed)
+        try:
+            seconds = time_run(binary, directory, timeout)
+        except subprocess.TimeoutExpired:
+            report.timed_out = size
+            seconds = timeout
+        except subprocess.CalledProcessError as exception:
+            logger.debug('%d rows: %s', size, exception)
+            report.failed = size
+            break
+        report.sizes.append(size)
+        report.seconds.append(max(seconds - report.baseline, 1e-6))
+        logger.debug('%d rows: %.3f s', size, seconds)
+        if report.timed_out:
+            break
+    return report
+
+
+def main():
+    """Main function; generate a scaled data file or time a program."""
+    logger = setup_logger()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate = commands.add_parser('generate', help='write a scaled data file')
+    generate.add_argument('path')
+    generate.add_argument('--rows', type=int, default=SIZES[0])
+    generate.add_argument('--seed', type=int, default=120)
+    check = commands.add_parser('check', help='time a part-1 program on scaled data files')
+    check.add_argument('binary')
+    check.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    check.add_argument('--timeout', type=float, default=RUN_TIMEOUT)
+    check.add_argument('--seed', type=int, default=120)
+    args = parser.parse_args()
+    if args.command == 'generate':
+        answer = write_scaled_csv(args.path, args.rows, seed=args.seed)
+        logger.info('Wrote %d rows to %s; densest %s, sparsest %s', args.rows, args.path, answer.densest, answer.sparsest)
+        return 0
+    report = scaling_check(args.binary, args.sizes, args.timeout, args.seed)
+    if report.failed is not None:
+        logger.error('❌ %s failed on %d rows', args.binary, report.failed)
+        return 1
+    if report.quadratic:
+        logger.error('❌ %s: %s', args.binary, report.describe())
+        return 1
+    logger.info('✅ %s: %s', args.binary, report.describe())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -31,30 +31,61 @@
 
 # ex.
 # .action/solution_check_p1.py  part-1 asgt
+# .action/solution_check.py --watch part-1 . states
 
-import difflib
 import logging
-import io
-import math
+import re
 import os
 import os.path
-import re
-import shutil
-import subprocess
 import sys
-import pexpect
 from assessment import csv_solution_check_make, make
+from capture import BoundedCapture, OutputLimitExceeded, DEFAULT_BYTE_LIMIT, drain_to_eof
 from logger import setup_logger
 
 
+def output_limit_exceeded(proc, log_stream):
+    """Stop a pexpect child that printed more than DEFAULT_BYTE_LIMIT
+    bytes and log what was kept of its output."""
+    logger = setup_logger()
+    proc.terminate(force=True)
+    logger.error('Your program printed more than %d bytes.', DEFAULT_BYTE_LIMIT)
+    logger.error('Your output: "%s"', log_stream.text())
+
+
+def p1_regex(densest, sparsest):
+    """The pattern _run_p1 expects when densest and sparsest are the
+    names of the densest and sparsest states."""
+    def words(text):
+        return r'\s*'.join(re.escape(word) for word in text.split())
+    return (r'(?i)\s*' + words(f'The densest state is {densest}') + r'\s*\('
+        + r'([-+]?[0-9]+[.]?[0-9]*)\s*'
+        + r'\)\s*'
+        + words(f'The sparsest state is {sparsest}') + r'\s*\('
+        + r'([-+]?[0-9]+[.]?[0-9]*)\s*'
+        + r'\)\s*')
+
+
+P1_REGEX = p1_regex('District of Columbia', 'Alaska')
+# Alternative data files derived from the repository's one that part-1 is
+# also run on.
+P1_ALTERNATIVES = 3
+
+
+def p2_regex(expected_output):
+    """The pattern _run_p2 expects for one game's transcript."""
+    regex = expected_output.replace(' ', '\\s+').replace('\n', '\\s+')
+    return fr'(?i).*{regex}.*'
+
+
 def run_p1(binary):
-    """Run part-1"""
+    """Run part-1 on the repository's data file and on alternatives
+    derived from it, checking against the oracle's answers."""
+    import shutil
+    import tempfile
+    from oracle import StatesAnswer, derive_datasets, states_answer
     logger = setup_logger()
     status = []
     error_values = ()
-    values = [
-        [11294.8, 1.28521],
-    ]
     for index, val in enumerate(error_values):
         test_number = index + 1
         logger.info('Test %d - %s', test_number, val)
@@ -63,68 +94,78 @@ def run_p1(binary):
             logger.error("Did not receive expected response for test %d.", test_number)
         status.append(rv)
 
-    for index, val in enumerate(values):
-        test_number = len(error_values) + index + 1
-        logger.info('Test %d - %s', test_number, val)
-        rv = _run_p1(binary, val)
-        if not rv:
-            logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
+    data_file = os.path.join(os.path.dirname(binary), 'state_demographics.csv')
+    workdir = tempfile.mkdtemp(prefix='p1_data_')
+    try:
+        if os.path.exists(data_file):
+            cases = [(data_file, states_answer(data_file))] + [
+                (path, states_answer(path))
+                for path in derive_datasets(data_file, workdir, P1_ALTERNATIVES)
+            ]
+        else:
+            logger.warning('%s is missing; using the expected values for the original file.', data_file)
+            cases = [(data_file, StatesAnswer('District of Columbia', 11294.8, 'Alaska', 1.28521))]
+        for index, (path, answer) in enumerate(cases):
+            test_number = len(error_values) + index + 1
+            logger.info('Test %d - %s', test_number, list(answer.numbers()))
+            rv = _run_p1(binary, answer, os.path.dirname(path))
+            if not rv:
+                logger.error("Did not receive expected response for test %d.", test_number)
+            status.append(rv)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
     return status
 
 def _run_p1_error(binary, values):
     raise NotImplementedError
 
-def _run_p1(binary, values):
-    """The actual test with the expected input and output"""
+def _run_p1(binary, answer, cwd=None):
+    """The actual test with the expected input and output; cwd holds the
+    state_demographics.csv the program reads."""
+    import pexpect
+    from oracle import mismatches
     logger = setup_logger()
     status = False
-    proc = pexpect.spawn(binary, timeout=1, args=[])
+    proc = pexpect.spawn(os.path.abspath(binary), timeout=1, args=[], cwd=cwd)
     # proc.logfile = sys.stdout.buffer
 
-    with io.BytesIO() as log_stream:
+    with BoundedCapture(byte_limit=DEFAULT_BYTE_LIMIT) as log_stream:
         proc.logfile = log_stream
         try:
-            regex = (r'(?i)\s*The\s*densest\s*state\s*is\s*District\s*of\s*Columbia\s*\('
-                + '([-+]?[0-9]+[.]?[0-9]*)\s*'
-                + '\)\s*'
-                + 'The\s*sparsest\s*state\s*is\s*Alaska\s*\('
-                + '([-+]?[0-9]+[.]?[0-9]*)\s*'
-                + '\)\s*')
-
-            match_index = proc.expect(regex)
-
-            token = proc.match.group(1).decode("utf-8") 
-            actual = float(token)
-            expected = values[0]
-            # 1% tolerance
-            if not math.isclose(expected, actual, rel_tol=.01): 
-                logging.error('actual numeric output is %f, which does not equal %f', actual, expected)
-                return status
+            match_index = proc.expect(p1_regex(answer.densest, answer.sparsest))
 
-            token = proc.match.group(2).decode("utf-8") 
-            actual = float(token)
-            expected = values[1]
+            actual = [float(token.decode("utf-8")) for token in proc.match.groups()]
+            expected = answer.numbers()
             # 1% tolerance
-            if not math.isclose(expected, actual, rel_tol=.01): 
-                logging.error('actual numeric output is %f, which does not equal %f', actual, expected)
+            wrong = mismatches(actual, expected, rel_tol=.01)
+            for index in wrong:
+                logging.error('actual numeric output is %f, which does not equal %f', actual[index], expected[index])
+            if wrong:
                 return status
 
+        except OutputLimitExceeded:
+            output_limit_exceeded(proc, log_stream)
+            return status
         except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
-            logger.error('Expected:\nThe densest state is District of Columbia (11294.8)\nThe sparsest state is Alaska (1.28521)')
+            logger.error('Expected:\nThe densest state is %s (%g)\nThe sparsest state is %s (%g)',
+                         answer.densest, answer.densest_density, answer.sparsest, answer.sparsest_density)
             logger.error('Could not find expected output.')
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
+            logger.error('Your output: "%s"', log_stream.text())
             logger.debug("%s", str(exception))
             logger.debug(str(proc))
             return status
 
-        proc.expect(pexpect.EOF)
+        try:
+            drain_to_eof(proc)
+        except OutputLimitExceeded:
+            output_limit_exceeded(proc, log_stream)
+            return status
         proc.close()
         if proc.exitstatus != 0:
             logger.error("Expected: zero exit code.")
             logger.error(f'Exit code was {proc.exitstatus}.')
             logger.error("Program returned non-zero, but zero is required")
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
+            logger.error('Your output: "%s"', log_stream.text())
             return status
         
     status = True
@@ -204,6 +245,7 @@ def run_p2(binary):
 
 
 def _run_p2(binary, values):
+    import pexpect
     logger = setup_logger()
     status = False
 
@@ -216,28 +258,32 @@ def _run_p2(binary, values):
     for guess in guesses:
         proc.sendline(str(guess))
 
-    with io.BytesIO() as log_stream:
+    with BoundedCapture(byte_limit=DEFAULT_BYTE_LIMIT) as log_stream:
         proc.logfile = log_stream
         try:
-            regex = expected_output.replace(' ', '\\s+').replace('\n', '\\s+')
-            proc.expect(
-                fr'(?i).*{regex}.*'
-            )
+            proc.expect(p2_regex(expected_output))
+        except OutputLimitExceeded:
+            output_limit_exceeded(proc, log_stream)
+            return status
         except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
             logger.error(f'Expected: "{expected_output}"')
             logger.error('Could not find expected output.')
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
+            logger.error('Your output: "%s"', log_stream.text())
             logger.debug("%s", str(exception))
             logger.debug(str(proc))
             return status
 
-        proc.expect(pexpect.EOF)
+        try:
+            drain_to_eof(proc)
+        except OutputLimitExceeded:
+            output_limit_exceeded(proc, log_stream)
+            return status
         proc.close()
         if proc.exitstatus != 0:
             logger.error("Expected: zero exit code.")
             logger.error(f'Exit code was {proc.exitstatus}.')
             logger.error("Program returned non-zero, but zero is required")
-            logger.error('Your output: "%s"', log_stream.getvalue().decode('utf-8'))
+            logger.error('Your output: "%s"', log_stream.text())
             return status
     status = True
     return status
@@ -276,29 +322,49 @@ tidy_opts = (
     '{key: readability-identifier-naming.IgnoreMainLikeFunctions, value: 1}]}"'
 )
 
+def scale_p1(binary):
+    """Time part-1 on growing data files; see scaling.py."""
+    from scaling import scaling_check
+    return scaling_check(binary)
+
+
+# Part name -> (run function, files to check)
+PARTS = {
+    'part-1': (run_p1, ['main.cc', 'states.cc', 'states.h']),
+    'part-2': (run_p2, ['main.cc', 'hilo.cc', 'hilo.h']),
+}
+# Part name -> scaling check, run when MS_SCALING_CHECK is set
+SCALING = {
+    'part-1': scale_p1,
+}
+
+
+def check_part(part, target_directory, program_name):
+    """Grade one part from the current working directory, which is the
+    part's directory inside the student's repository."""
+    if part not in PARTS:
+        print('Error: no match.')
+        return
+    run, files = PARTS[part]
+    repo_name = os.path.basename(os.path.dirname(os.getcwd()))
+    csv_solution_check_make(
+        csv_key=repo_name,
+        target_directory=target_directory,
+        program_name=program_name,
+        run=run,
+        files=files,
+        tidy_options=tidy_opts,
+        scaling=SCALING.get(part) if os.environ.get('MS_SCALING_CHECK') else None,
+    )
+
+
 if __name__ == '__main__':
-    cwd = os.getcwd()
-    repo_name = os.path.basename(os.path.dirname(cwd))
-
-    if sys.argv[1] == 'part-1':
-        csv_solution_check_make(
-            csv_key=repo_name,
-            target_directory=sys.argv[2],
-            program_name=sys.argv[3],
-            run=run_p1,
-            files=['main.cc', 'states.cc', 'states.h'],
-            #do_lint_check=False,
-            tidy_options=tidy_opts,
-        )
-    elif sys.argv[1] == 'part-2':
-        csv_solution_check_make(
-            csv_key=repo_name,
-            target_directory=sys.argv[2],
-            program_name=sys.argv[3],
-            run=run_p2,
-            files=['main.cc', 'hilo.cc', 'hilo.h'],
-            # do_lint_check=False,
-            tidy_options=tidy_opts,
-        )
+    if sys.argv[1] == '--watch':
+        from watch import watch_part
+        if sys.argv[2] not in PARTS:
+            print('Error: no match.')
+            sys.exit(1)
+        run, files = PARTS[sys.argv[2]]
+        watch_part(sys.argv[3], files, sys.argv[4], run, tidy_opts)
     else:
-        print('Error: no match.')
+        check_part(sys.argv[1], sys.argv[2], sys.argv[3])
@@ -0,0 +1,224 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Index of the C++ sources in a directory tree, built with one
+    os.scandir walk. Each entry records the file's type, size, hash,
+    includes and whether it defines main. The index is saved between
+    runs under MS_CACHE_DIR (default ~/.cache/cpsc120-grader) and only
+    files whose mtime or size changed are read again, so finding the
+    sources and the file with main are lookups.
+
+    ex.
+    .action/srcindex.py part-1
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import List
+from fileaccess import LARGE_FILE_BYTES, cache_dir, read_bytes
+from logger import setup_logger
+
+INDEX_VERSION = 1
+SOURCE_TYPES = {'.cc': 'cc', '.h': 'h'}
+# Directories never holding student sources. Hidden directories, like
+# .git, are skipped as well, as glob('**') skips them.
+IGNORE_DIRS = {'__pycache__', 'unittest.dSYM', 'doc', 'html', 'latex'}
+MAIN_REGEX = re.compile(
+    rb'int\s*main\s*\(int\s*argc,\s*(const)?\s*char\s*(const)?\s*\*\s*argv\[\]\)'
+)
+INCLUDE_REGEX = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*[<"]([^>"\n]+)[>"]', re.MULTILINE)
+
+
+@dataclass
+class SourceEntry:
+    """One indexed source file; path is relative to the indexed root."""
+    path: str
+    kind: str
+    size: int
+    mtime_ns: int
+    sha256: str
+    includes: List[str] = field(default_factory=list)
+    has_main: bool = False
+
+
+def cache_path(root):
+    """Where the index of root is saved."""
+    digest = hashlib.sha256(os.path.realpath(root).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir(), f'srcindex-{digest}.json')
+
+
+def _scan(full_path, relative, kind, stat):
+    """Read one file and describe it."""
+    if stat.st_size >= LARGE_FILE_BYTES:
+        with open(full_path, 'rb') as file_handle, \
+                mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _describe(data, relative, kind, stat)
+    return _describe(read_bytes(full_path), relative, kind, stat)
+
+
+def _describe(data, relative, kind, stat):
+    return SourceEntry(
+        path=relative,
+        kind=kind,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        sha256=hashlib.sha256(data).hexdigest(),
+        includes=[match.group(1).decode('utf-8', 'replace') for match in INCLUDE_REGEX.finditer(data)],
+        has_main=MAIN_REGEX.search(data) is not None,
+    )
+
+
+def _walk(root, relative=''):
+    """Yield (relative path, kind, stat) for every source under root."""
+    try:
+        entries = list(os.scandir(os.path.join(root, relative)))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        child = os.path.join(relative, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name not in IGNORE_DIRS:
+                yield from _walk(root, child)
+            continue
+        kind = SOURCE_TYPES.get(os.path.splitext(entry.name)[1])
+        if kind and entry.is_file():
+            yield child, kind, entry.stat()
+
+
+class SourceIndex:
+    """The sources under root. Call refresh() to pick up changes; only
+    new and changed files are read."""
+
+    def __init__(self, root):
+        self.root = root
+        self.entries = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(cache_path(self.root)) as file_handle:
+                saved = json.load(file_handle)
+        except (OSError, ValueError):
+            return
+        if saved.get('version') != INDEX_VERSION:
+            return
+        self.entries = {item['path']: SourceEntry(**item) for item in saved['entries']}
+
+    def refresh(self):
+        """Walk root once and update the entries that changed."""
+        found = {}
+        for relative, kind, stat in _walk(self.root):
+            entry = self.entries.get(relative)
+            if entry is None or entry.mtime_ns != stat.st_mtime_ns or entry.size != stat.st_size:
+                entry = _scan(os.path.join(self.root, relative), relative, kind, stat)
+                self.dirty = True
+            found[relative] = entry
+        if found.keys() != self.entries.keys():
+            self.dirty = True
+        self.entries = found
+        return self
+
+    def save(self):
+        """Write the index to its cache file if it changed."""
+        if not self.dirty:
+            return
+        path = cache_path(self.root)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as file_handle:
+                json.dump({
+                    'version': INDEX_VERSION,
+                    'root': os.path.realpath(self.root),
+                    'entries': [asdict(entry) for entry in self.entries.values()],
+                }, file_handle)
+            os.replace(temp_path, path)
+            self.dirty = False
+        except OSError as exception:
+            setup_logger().debug('Cannot save source index %s: %s', path, exception)
+
+    def files(self, *kinds):
+        """Paths, joined with root, of the sources of the given kinds,
+        all kinds when none are given, sorted within each kind."""
+        kinds = kinds or tuple(SOURCE_TYPES.values())
+        return [
+            os.path.join(self.root, entry.path)
+            for kind in kinds
+            for entry in sorted(self.entries.values(), key=lambda entry: entry.path)
+            if entry.kind == kind
+        ]
+
+    def main_files(self):
+        """Paths, joined with root, of the sources that define main."""
+        return [
+            os.path.join(self.root, entry.path)
+            for entry in sorted(self.entries.values(), key=lambda entry: entry.path)
+            if entry.has_main
+        ]
+
+    def entry(self, path):
+        """The entry for path, given relative to the working directory as
+        files() returns them, or None when it is not indexed."""
+        return self.entries.get(os.path.relpath(path, self.root))
+
+
+_indexes = {}
+
+
+def source_index(root='.', refresh=False):
+    """The saved index of root. Indexes are kept for the rest of the run
+    and walked when first built; later calls are lookups unless refresh
+    is true. A grading run refreshes once, at its start, and passes the
+    index on; watch mode refreshes after every change."""
+    key = os.path.realpath(root)
+    index = _indexes.get(key)
+    if index is None or index.root != root:
+        index = _indexes[key] = SourceIndex(root)
+        refresh = True
+    if refresh:
+        index.refresh()
+        index.save()
+    return index
+
+
+def main():
+    """Main function; index a directory and print the entries."""
+    logger = setup_logger()
+    index = source_index(sys.argv[1] if len(sys.argv) > 1 else '.')
+    for entry in sorted(index.entries.values(), key=lambda entry: entry.path):
+        logger.info('%s %s %d bytes%s includes: %s', entry.kind, entry.path, entry.size,
+                    ' (main)' if entry.has_main else '', ', '.join(entry.includes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" A small scheduler for grading stages declared as a graph. Each stage
+    names the stages that must pass before it (requires), the ones that
+    only have to finish first (after), an estimated cost in seconds and
+    the resources it holds while running, e.g. the part directory that
+    `make spotless` empties. Ready stages start cheapest first, several
+    at a time, and a stage whose required stage failed or was skipped is
+    skipped itself without running.
+
+    ex.
+    outcomes = run_stages([
+        Stage('build', build, cost=5, resources=('directory',)),
+        Stage('run', run, requires=('build',), cost=2),
+    ], jobs=2)
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+from logger import setup_logger
+
+PASSED = 'passed'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+@dataclass
+class Stage:
+    """One unit of grading work. func takes no arguments and returns true
+    when the stage passed."""
+    name: str
+    func: Callable[[], bool]
+    requires: Tuple[str, ...] = ()
+    after: Tuple[str, ...] = ()
+    cost: float = 1.0
+    resources: Tuple[str, ...] = ()
+
+
+@dataclass
+class StageOutcome:
+    """What became of a stage; reason says why it was skipped."""
+    state: str
+    seconds: float = 0.0
+    reason: Optional[str] = None
+
+    @property
+    def passed(self):
+        return self.state == PASSED
+
+
+def _check(stages):
+    """Raise ValueError for duplicate names or a dependency cycle. Returns
+    each stage's dependencies that are in the graph; the others are
+    dropped so optional stages can simply be left out."""
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError(f'duplicate stage names in {names}')
+    depends = {
+        stage.name: [name for name in stage.requires + stage.after if name in names]
+        for stage in stages
+    }
+    visiting, done = set(), set()
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError('stage cycle: ' + ' -> '.join(path + [name]))
+        visiting.add(name)
+        for dependency in depends[name]:
+            visit(dependency, path + [name])
+        visiting.discard(name)
+        done.add(name)
+
+    for name in names:
+        visit(name, [])
+    return depends
+
+
+def run_stages(stages, jobs=1):
+    """Run stages on up to jobs threads. Returns {name: StageOutcome}. An
+    exception raised by a stage is raised here once running stages have
+    finished."""
+    logger = setup_logger()
+    depends = _check(stages)
+    outcomes = {}
+    pending = list(stages)
+    running = {}
+    held = set()
+
+    def timed(stage):
+        start = time.perf_counter()
+        passed = stage.func()
+        return bool(passed), time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            ready = [stage for stage in pending if all(name in outcomes for name in depends[stage.name])]
+            skipped = False
+            for stage in ready:
+                blocking = [name for name in stage.requires if name in outcomes and not outcomes[name].passed]
+                if blocking:
+                    reason = ', '.join(f'{name} {outcomes[name].state}' for name in blocking)
+                    logger.info('⏭ Skipping %s: %s', stage.name, reason)
+                    outcomes[stage.name] = StageOutcome(SKIPPED, reason=reason)
+                    pending.remove(stage)
+                    skipped = True
+            if skipped:
+                # Skips can make more stages ready.
+                continue
+            for stage in sorted(ready, key=lambda stage: stage.cost):
+                if len(running) >= max(1, jobs) or held.intersection(stage.resources):
+                    continue
+                held.update(stage.resources)
+                running[pool.submit(timed, stage)] = stage
+                pending.remove(stage)
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                held.difference_update(stage.resources)
+                if future.exception() is not None:
+                    wait(running)
+                    raise future.exception()
+                passed, seconds = future.result()
+                outcomes[stage.name] = StageOutcome(PASSED if passed else FAILED, seconds)
+    return outcomes
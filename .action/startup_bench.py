@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Measure the import time of each entry point with -X importtime and
+    fail when one exceeds its budget. The JSON report can be saved and
+    compared across releases.
+
+    ex.
+    .action/startup_bench.py
+    .action/startup_bench.py --repeat 9 --json startup.json
+    .action/startup_bench.py --baseline startup.json --tolerance 1.25
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from logger import setup_logger
+
+# Entry point module -> budget for its cumulative import time in ms.
+# These are the scripts the part Makefiles run for format, lint, header
+# and test, solution_check being the test target's fallback when no
+# grading daemon answers, plus the build and run checks the workflow
+# runs. grading_client imports only the standard library until it falls
+# back, so its budget is the tightest.
+BUDGETS_MS = {
+    'format_check': 100,
+    'lint_check': 100,
+    'header_check': 100,
+    'grading_client': 40,
+    'build_check': 100,
+    'run_check': 100,
+    'solution_check': 100,
+}
+
+
+def import_time_us(module, action_dir):
+    """Import module in a fresh interpreter; return the cumulative import
+    time in microseconds and the five slowest imports by self time."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=action_dir,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    cumulative = None
+    self_times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        self_times.append((int(self_us), name.strip()))
+        if name.strip() == module:
+            cumulative = int(cumulative_us)
+    self_times.sort(reverse=True)
+    return cumulative, [name for _, name in self_times[:5]]
+
+
+def run_benchmark(modules, repeat, action_dir):
+    """Return a report of the median cumulative import time per module."""
+    report = {}
+    for module in modules:
+        samples = []
+        slowest = []
+        for _ in range(repeat):
+            cumulative, slowest = import_time_us(module, action_dir)
+            samples.append(cumulative)
+        report[module] = {
+            'median_ms': round(statistics.median(samples) / 1000, 2),
+            'min_ms': round(min(samples) / 1000, 2),
+            'budget_ms': BUDGETS_MS.get(module),
+            'slowest_imports': slowest,
+        }
+    return report
+
+
+def main():
+    """Main function; benchmark the entry points and check the budgets."""
+    logger = setup_logger()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=list(BUDGETS_MS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--baseline', help='compare against a saved report')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='allowed slowdown relative to the baseline')
+    args = parser.parse_args()
+    action_dir = os.path.dirname(os.path.abspath(__file__))
+    report = run_benchmark(args.modules, args.repeat, action_dir)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file_handle:
+            baseline = json.load(file_handle)
+    status = 0
+    for module, result in report.items():
+        logger.info('%s: %.2f ms (budget %s ms); slowest: %s', module,
+                    result['median_ms'], result['budget_ms'],
+                    ', '.join(result['slowest_imports']))
+        if result['budget_ms'] and result['median_ms'] > result['budget_ms']:
+            logger.error('❌ %s exceeds its startup budget', module)
+            status = 1
+        if module in baseline:
+            allowed = baseline[module]['median_ms'] * args.tolerance
+            if result['median_ms'] > allowed:
+                logger.error('❌ %s regressed from %.2f ms to %.2f ms', module,
+                             baseline[module]['median_ms'], result['median_ms'])
+                status = 1
+    if args.json:
+        with open(args.json, 'w') as file_handle:
+            json.dump(report, file_handle, indent=2, sort_keys=True)
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
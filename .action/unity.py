@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Clash detection for unity builds, where a part's .cc files are
+    compiled as one translation unit that includes each of them in turn.
+    That breaks when two files define the same name at namespace scope,
+    e.g. a static helper or a constant each file has its own copy of,
+    when a macro #defined in one file changes a later one, or when a
+    header without an include guard is included by more than one file.
+
+    The scan is a light tokenizer, not a C++ parser. It errs towards
+    reporting a clash, which only costs the unity build; a clash it
+    misses makes the unity compile fail, and the caller then builds the
+    files separately as well.
+
+    ex.
+    .action/unity.py part-1/main.cc part-1/states.cc
+"""
+
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+from fileaccess import read_text
+from logger import setup_logger
+
+LITERAL_REGEX = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL
+)
+DIRECTIVE_REGEX = re.compile(r'^[ \t]*#[ \t]*(\w+)[ \t]*(.*)$', re.MULTILINE)
+LOCAL_INCLUDE_REGEX = re.compile(r'^[ \t]*#[ \t]*include[ \t]*"([^"\n]+)"', re.MULTILINE)
+TOKEN_REGEX = re.compile(r'[A-Za-z_]\w*|::|\S')
+IDENTIFIER_REGEX = re.compile(r'[A-Za-z_]\w*')
+GUARD_REGEX = re.compile(r'#\s*pragma\s+once|#\s*ifndef\s+(\w+)\s+#\s*define\s+\1\b')
+# Words that end up in front of '(' or '=' when a declaration is not
+# one this scan understands; they are never the name being defined.
+KEYWORDS = {
+    'auto', 'bool', 'char', 'const', 'constexpr', 'decltype', 'double',
+    'float', 'inline', 'int', 'long', 'operator', 'return', 'short',
+    'signed', 'sizeof', 'static', 'std', 'unsigned', 'void', 'volatile',
+}
+CLASS_KEYS = ('class', 'struct', 'union', 'enum')
+NAMESPACE, FUNCTION, BLOCK = 'namespace', 'function', 'block'
+
+
+@dataclass
+class SourceScan:
+    """What one source file brings into a unity build."""
+    names: Set[str] = field(default_factory=set)
+    macros: Set[str] = field(default_factory=set)
+    identifiers: Set[str] = field(default_factory=set)
+    includes: List[str] = field(default_factory=list)
+
+
+def _strip(text):
+    """text without comments and with empty string and character
+    literals, keeping line breaks so directives stay on their lines."""
+    def blank(match):
+        literal = match.group(0)
+        if literal.startswith('/'):
+            return ' ' + '\n' * literal.count('\n')
+        return '""' if literal.startswith('"') else "''"
+    return LITERAL_REGEX.sub(blank, text.replace('\\\n', ' '))
+
+
+def _skip_template(statement):
+    """statement without a leading template<...> parameter list."""
+    if statement[:2] != ['template', '<']:
+        return statement
+    depth = 0
+    for index, token in enumerate(statement[1:], 1):
+        depth += {'<': 1, '>': -1}.get(token, 0)
+        if depth == 0:
+            return statement[index + 1:]
+    return []
+
+
+def _name_before(statement, index):
+    """The unqualified identifier at statement[index - 1], or None."""
+    if index < 1 or not IDENTIFIER_REGEX.fullmatch(statement[index - 1]):
+        return None
+    if index >= 2 and statement[index - 2] == '::':
+        return None
+    name = statement[index - 1]
+    return None if name in KEYWORDS else name
+
+
+def _is_function(statement):
+    """True when the block after statement is a function body."""
+    statement = _skip_template(statement)
+    if '(' not in statement or any(key in statement for key in CLASS_KEYS):
+        return False
+    return '=' not in statement[:statement.index('(')]
+
+
+def _defined_name(statement, opens_block):
+    """The name a namespace scope statement defines, or None for
+    declarations and what the scan does not understand. opens_block
+    is true when the statement is followed by '{'."""
+    statement = _skip_template(statement)
+    if not statement or statement[0] in ('friend', 'static_assert'):
+        return None
+    if statement[0] == 'using':
+        if len(statement) > 2 and statement[2] == '=':
+            return statement[1]
+        return None
+    if statement[0] == 'typedef':
+        return _name_before(statement, len(statement))
+    if 'extern' in statement and not opens_block:
+        return None
+    first = {token: index for index, token in reversed(list(enumerate(statement)))}
+    for key in CLASS_KEYS:
+        if key in first and first[key] < first.get('(', len(statement)) and opens_block:
+            rest = [token for token in statement[first[key] + 1:] if token not in CLASS_KEYS]
+            return rest[0] if rest and IDENTIFIER_REGEX.fullmatch(rest[0]) else None
+    ends = [first[token] for token in ('=', '(', '[') if token in first]
+    if ends:
+        end = min(ends)
+        if statement[end] == '(' and not opens_block:
+            # A function declaration, or a variable initialized with
+            # parentheses, which is too rare to tell apart.
+            return None
+        return _name_before(statement, end)
+    return _name_before(statement, len(statement))
+
+
+def namespace_names(tokens):
+    """The names defined at namespace scope by a file's tokens: functions,
+    variables, types and aliases. Members defined with a qualified name,
+    like State::Name, are left out."""
+    names = set()
+    # One entry per open brace: NAMESPACE for a namespace or extern "C"
+    # block, FUNCTION for a function body and BLOCK for anything else.
+    stack = []
+    statement = []
+    for token in tokens:
+        if any(kind != NAMESPACE for kind in stack):
+            if token == '{':
+                stack.append(BLOCK)
+            elif token == '}' and stack:
+                kind = stack.pop()
+                if kind == FUNCTION:
+                    statement = []
+            continue
+        if token == '{':
+            if 'namespace' in statement or statement[:1] == ['extern']:
+                stack.append(NAMESPACE)
+                statement = []
+                continue
+            name = _defined_name(statement, True)
+            if name:
+                names.add(name)
+            stack.append(FUNCTION if _is_function(statement) else BLOCK)
+            # After a class or an initializer the statement goes on,
+            # e.g. `struct A {} a;`, but it has given its name.
+            statement = ['{}']
+        elif token == '}':
+            if stack:
+                stack.pop()
+            statement = []
+        elif token == ';':
+            if '{}' not in statement:
+                name = _defined_name(statement, False)
+                if name:
+                    names.add(name)
+            statement = []
+        else:
+            statement.append(token)
+    return names
+
+
+def scan_source(path):
+    """SourceScan of one source file."""
+    raw = read_text(path)
+    text = _strip(raw)
+    scan = SourceScan()
+    for directive, argument in DIRECTIVE_REGEX.findall(text):
+        match = IDENTIFIER_REGEX.match(argument)
+        if directive == 'define' and match:
+            scan.macros.add(match.group(0))
+    # Literals are blanked in text, include file names with them.
+    for header in LOCAL_INCLUDE_REGEX.findall(raw):
+        scan.includes.append(os.path.join(os.path.dirname(path), header))
+    code = DIRECTIVE_REGEX.sub('', text)
+    tokens = TOKEN_REGEX.findall(code)
+    scan.names = namespace_names(tokens)
+    scan.identifiers = {token for token in tokens if IDENTIFIER_REGEX.fullmatch(token)}
+    return scan
+
+
+def _guarded(path):
+    try:
+        return GUARD_REGEX.search(_strip(read_text(path))) is not None
+    except OSError:
+        return True
+
+
+def unity_clashes(sources):
+    """Why sources, in order, cannot be compiled as one translation
+    unit; an empty list when no clash was found."""
+    scans: Dict[str, SourceScan] = {source: scan_source(source) for source in sources}
+    clashes = []
+    for number, source in enumerate(sources):
+        for other in sources[number + 1:]:
+            for name in sorted(scans[source].names & scans[other].names):
+                clashes.append(f'{name} is defined in {source} and {other}')
+            for macro in sorted(scans[source].macros & (scans[other].identifiers | scans[other].macros)):
+                clashes.append(f'macro {macro} from {source} reaches {other}')
+    included = {}
+    for source in sources:
+        for header in scans[source].includes:
+            included.setdefault(os.path.normpath(header), []).append(source)
+    for header, includers in sorted(included.items()):
+        if len(includers) > 1 and not _guarded(header):
+            clashes.append(f'{header} has no include guard and is included by ' + ' and '.join(includers))
+    return clashes
+
+
+def main():
+    """Main function; report unity build clashes between source files."""
+    logger = setup_logger()
+    if len(sys.argv) < 3:
+        logger.error('usage: unity.py source.cc source.cc ...')
+        return 1
+    clashes = unity_clashes(sys.argv[1:])
+    for clash in clashes:
+        logger.warning('❌ %s', clash)
+    if not clashes:
+        logger.info('✅ No clashes; the files can be built as one unit')
+    return 1 if clashes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#
+# Copyright 2022 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Watch a part's files and re-run only the checks affected by each
+    edit. Header and format verdicts for the edited files are printed
+    first. Lint runs on the edited files and on the .cc files that
+    include an edited header, found through the source index. The
+    build, unit tests and runs are repeated only when a translation
+    unit changed, and the build is an incremental `make all`, so only
+    the needed objects are rebuilt.
+
+    ex.
+    .action/solution_check.py --watch part-1 . states
+"""
+
+import os
+import time
+from assessment import make, make_unittest
+from ccsrcutilities import format_check, lint_check
+from header_check import header_check
+from lintagg import included_files
+from logger import setup_logger
+
+
+def snapshot(files):
+    """Map each existing file to its (mtime_ns, size)."""
+    stamps = {}
+    for file in files:
+        try:
+            stat = os.stat(file)
+        except FileNotFoundError:
+            continue
+        stamps[file] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+
+class _Waiter:
+    """Block until something in a directory changes. Uses inotify through
+    the optional inotify_simple package and falls back to polling."""
+
+    def __init__(self, directory, interval):
+        self.interval = interval
+        self.inotify = None
+        try:
+            from inotify_simple import INotify, flags
+            self.inotify = INotify()
+            self.inotify.add_watch(
+                directory, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE
+            )
+        except (ImportError, OSError):
+            self.inotify = None
+
+    def wait(self):
+        if self.inotify:
+            # Editors often write a file in several steps; wait briefly
+            # for the burst to finish.
+            if self.inotify.read(timeout=None):
+                self.inotify.read(timeout=int(self.interval * 1000))
+        else:
+            time.sleep(self.interval)
+
+
+def _verdict(passed, stage, file=None):
+    logger = setup_logger()
+    mark = '✅' if passed else '❌'
+    if file:
+        logger.info('%s %s %s', mark, stage, file)
+    else:
+        logger.info('%s %s', mark, stage)
+
+
+def header_dependents(headers, index):
+    """Real paths of the .cc files in index, a srcindex.SourceIndex, that
+    include one of headers directly or through another header."""
+    sources = [os.path.join(index.root, path) for path in index.entries]
+    includes = {os.path.realpath(source): included_files(source, index) for source in sources}
+    affected = {os.path.realpath(header) for header in headers}
+    grew = True
+    while grew:
+        grew = False
+        for source, included in includes.items():
+            if source not in affected and included & affected:
+                affected.add(source)
+                grew = True
+    return {source for source in affected & includes.keys() if source.endswith('.cc')}
+
+
+def regrade(changed, part_dir, program_name, run, tidy_options, verdicts, files=()):
+    """Re-run the stages affected by the changed files, updating
+    verdicts, a dict of (stage, file) -> bool, in place. files are the
+    watched files; those that include a changed header are linted
+    again."""
+    from srcindex import source_index
+    logger = setup_logger()
+    index = source_index(part_dir, refresh=True)
+    missing = [file for file in changed if not os.path.exists(file)]
+    present = [file for file in changed if file not in missing]
+    for file in missing:
+        logger.error('❌ %s is missing', file)
+        for stage in ('header', 'format', 'lint'):
+            verdicts[(stage, file)] = False
+    # Cheap checks first so the student sees them right away.
+    for file in present:
+        verdicts[('header', file)] = header_check(file)
+        _verdict(verdicts[('header', file)], 'header', file)
+        verdicts[('format', file)] = len(format_check(file)) == 0
+        _verdict(verdicts[('format', file)], 'format', file)
+    units = header_dependents([file for file in changed if not file.endswith('.cc')], index)
+    includers = [
+        file for file in files
+        if file not in changed and os.path.realpath(file) in units
+    ]
+    for file in present + includers:
+        verdicts[('lint', file)] = len(lint_check(file, tidy_options)) == 0
+        _verdict(verdicts[('lint', file)], 'lint', file)
+    if ('build', None) in verdicts and not units and not any(file.endswith('.cc') for file in changed):
+        logger.info('No translation unit changed; build, unit test and run verdicts stand.')
+        return
+    # make's dependency files decide which objects need rebuilding.
+    verdicts[('build', None)] = make(part_dir, 'all')
+    _verdict(verdicts[('build', None)], 'build')
+    if verdicts[('build', None)]:
+        verdicts[('unittest', None)] = make_unittest(part_dir, always_clean=False)
+        _verdict(verdicts[('unittest', None)], 'unit tests')
+        run_stats = run(os.path.join(part_dir, program_name))
+        verdicts[('run', None)] = all(run_stats)
+        logger.info('%s runs %d/%d', '✅' if all(run_stats) else '❌', sum(run_stats), len(run_stats))
+
+
+def watch_part(part_dir, files, program_name, run, tidy_options=None, interval=0.2):
+    """Grade the part, then re-grade incrementally each time one of files
+    changes. Runs until interrupted."""
+    logger = setup_logger()
+    files = [os.path.join(part_dir, file) for file in files]
+    waiter = _Waiter(part_dir, interval)
+    verdicts = {}
+    previous = {}
+    logger.info('Watching %s; press Ctrl-C to stop.', ' '.join(files))
+    try:
+        while True:
+            current = snapshot(files)
+            changed = [file for file in files if current.get(file) != previous.get(file)]
+            if changed:
+                logger.info('Changed: %s', ' '.join(changed))
+                regrade(changed, part_dir, program_name, run, tidy_options, verdicts, files)
+                failed = sorted(
+                    f'{stage} {file}' if file else stage
+                    for (stage, file), passed in verdicts.items() if not passed
+                )
+                if failed:
+                    logger.warning('Still failing: %s', ', '.join(failed))
+                else:
+                    logger.info('😀 Everything passes 🥳')
+                previous = current
+            waiter.wait()
+    except KeyboardInterrupt:
+        logger.info('Stopped watching.')
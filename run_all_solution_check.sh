@@ -3,6 +3,8 @@
 LABNUM="10"
 LAB="cpsc-120-lab-${LABNUM}"
 GRADING_LOG="grading_log.csv"
+# Every grader records its parts into this database.
+export MS_GRADEBOOK="${PWD}/gradebook.db"
 
 MAXJOBS=5
 MAKEJOBS=3
@@ -18,7 +20,7 @@ fi
 
 COPYMAKEFILES="NO"
 # Just in case you need to copy Makefiles or something else
-REPOHOME="${HOME}/github/cpsc120/cpsc-120-solution-lab-${LABNUM}
+REPOHOME="${HOME}/github/cpsc120/cpsc-120-solution-lab-${LABNUM}"
 if [ "${COPYMAKEFILES}X" = "YESX" ]; then
     for repo in *-${LAB}-*; do
         cp ${REPOHOME}/Makefile ${repo}
@@ -48,9 +50,8 @@ for i in *-${LAB}-*; do
     done
 done
 
-# Get the headers
-head -1 `ls */.*${LAB}*_part-*gradelog.csv | head -1` > ${GRADING_LOG}
-# Collect the rows
-for i in *-${LAB}-*; do
-    tail -q -n +2 ${i}/.*${LAB}*_part-*gradelog.csv >> ${GRADING_LOG};
-done
+wait
+
+# Export the rows from the gradebook
+FIRSTREPO=$(ls -d *-${LAB}-* | head -1)
+python3 ${FIRSTREPO}/.action/gradebook.py export ${MS_GRADEBOOK} ${GRADING_LOG} "%${LAB}%"